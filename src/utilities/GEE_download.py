@@ -1,13 +1,17 @@
 import ee
+import hashlib
 import os
 import requests
 import geopandas as gpd
 from shapely.geometry import mapping
 from google.oauth2 import service_account
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from download_utilities import download_file
+from src.utilities.download_utilities import download_file, get_http_session
+from src.utilities.telemetry_utilities import get_telemetry
+from src.utilities.download_cache_utilities import DownloadCache
+from src.utilities.GEE_tiling import GEE_MAX_REQUEST_BYTES, download_gee_tiles, plan_gee_tiles
+from src.utilities.mosaic_utilities import mosaic_rasters
 import rasterio
-from rasterio.merge import merge
 import rasterio.mask
 import logging
 
@@ -45,13 +49,18 @@ def download_gee_data_by_gdf(
     start_date=None,
     end_date=None,
     scale=500,
-    max_workers=5
+    max_workers=5,
+    cache=None,
+    metrics_path=None,
+    dtype="float64",
+    max_request_bytes=GEE_MAX_REQUEST_BYTES,
 ):
     """
     Downloads data from GEE for geometries defined in a GeoDataFrame with a specific CRS.
 
     - If the geometry is a MultiPolygon, it is exploded into individual polygons.
-    - Downloads each polygon separately.
+    - Downloads each polygon in grid-aligned tiles sized to the request limits, through one
+      pool shared by all regions, and mosaics the tiles.
     - Merges the resulting TIFFs.
     - Masks the merged TIFF to remove data outside the original geometry.
     - Finally, deletes intermediate files.
@@ -66,6 +75,13 @@ def download_gee_data_by_gdf(
         end_date (str, optional): End date in "YYYY-MM-DD" format. If None, no end date filter.
         scale (int): Spatial resolution in meters.
         max_workers (int): Maximum number of concurrent download threads.
+        cache (DownloadCache, optional): Cache of downloads keyed by the GEE request parameters
+            (collection, band, dates, scale, region geometry and CRS). Cached polygons are linked from
+            the cache instead of requested again.
+        metrics_path (str, optional): If given, the transfer telemetry of this call is exported
+            there at the end (JSON for ".json", Prometheus text otherwise).
+        dtype (str, optional): Data type of the band, used to size the tiles. Defaults to "float64".
+        max_request_bytes (int, optional): Uncompressed bytes per Earth Engine request.
     """
     os.makedirs(output_folder, exist_ok=True)
     logger.info(f"Output folder set to: {output_folder}")
@@ -100,6 +116,21 @@ def download_gee_data_by_gdf(
             logger.info(f"File already exists, skipping: {filepath}")
             return filepath
 
+        request = {
+            "collection": collection,
+            "band": band,
+            "start_date": start_date,
+            "end_date": end_date,
+            "scale": scale,
+            # the download is clipped to the polygon, so the key is its geometry, not its bbox
+            "region": hashlib.sha256(polygon.normalize().wkb).hexdigest(),
+            "crs": gdf.crs.to_string(),
+        }
+        cache_key = DownloadCache.key("gee", request)
+        if cache is not None and cache.get(cache_key, filepath):
+            logger.info(f"File found in cache: {filepath}")
+            return filepath
+
         try:
             # Build the ImageCollection
             image_collection = ee.ImageCollection(collection).select(band)
@@ -116,24 +147,21 @@ def download_gee_data_by_gdf(
                 logger.warning(f"No image found for {region_code} in the specified range.")
                 return None
 
-            # Create a bounding box for the polygon
-            bounds = polygon.bounds
-            region_bbox = [
-                [bounds[0], bounds[1]],
-                [bounds[2], bounds[1]],
-                [bounds[2], bounds[3]],
-                [bounds[0], bounds[3]],
-            ]
-
-            # Download using the GeoDataFrame's CRS
-            download_url = image.getDownloadURL({
-                "scale": scale,
-                "region": region_bbox,
-                "format": "GeoTIFF",
-                "crs": gdf.crs.to_string()
-            })
-
-            download_file(url=download_url, directory=region_folder, filename=filename)
+            # Download the polygon in grid-aligned tiles, using the GeoDataFrame's CRS
+            tiles = plan_gee_tiles(
+                polygon, scale, crs=gdf.crs.to_string(), dtype=dtype, max_bytes=max_request_bytes
+            )
+            if download_gee_tiles(
+                image,
+                tiles,
+                filepath,
+                crs=gdf.crs.to_string(),
+                executor=tile_executor,
+                download=download_file,
+            ) is None:
+                return None
+            if cache is not None:
+                cache.put(cache_key, filepath, source="gee", request=request)
             return filepath
 
         except Exception as e:
@@ -142,7 +170,7 @@ def download_gee_data_by_gdf(
 
     def merge_rasters(raster_paths, output_path):
         """
-        Merges multiple raster files into a single raster.
+        Merges multiple raster files into a single raster, written block by block.
 
         Args:
             raster_paths (list of str): Paths to raster files to merge.
@@ -157,24 +185,7 @@ def download_gee_data_by_gdf(
             return None
 
         try:
-            src_files_to_mosaic = [rasterio.open(rp) for rp in valid_rasters]
-            mosaic, out_trans = merge(src_files_to_mosaic)
-
-            # Take metadata from the first raster
-            out_meta = src_files_to_mosaic[0].meta.copy()
-            out_meta.update({
-                "driver": "GTiff",
-                "height": mosaic.shape[1],
-                "width": mosaic.shape[2],
-                "transform": out_trans
-            })
-
-            with rasterio.open(output_path, "w", **out_meta) as dest:
-                dest.write(mosaic)
-
-            for src in src_files_to_mosaic:
-                src.close()
-
+            mosaic_rasters(valid_rasters, output_path)
             logger.info(f"Merged raster saved at: {output_path}")
             return output_path
 
@@ -299,23 +310,29 @@ def download_gee_data_by_gdf(
 
         logger.info(f"Completed processing for region {region_code}.")
 
-    # Process regions using threads
-    tasks = []
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        for _, row in gdf.iterrows():
-            region_code = row[column_name]
-            region_geometry = row.geometry
-            tasks.append(executor.submit(process_region, region_code, region_geometry))
-
-        for future in as_completed(tasks):
-            try:
-                future.result()
-            except Exception as e:
-                logger.error(f"Error in a task: {e}")
-
+    # Process regions using threads, with one pooled keep-alive connection per thread;
+    # region threads wait while the tiles of every region share tile_executor
+    with get_telemetry().scope() as telemetry:
+        get_http_session(pool_size=max_workers)
+        tasks = []
+        tile_executor = ThreadPoolExecutor(max_workers=max_workers)
+        with tile_executor, ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for _, row in gdf.iterrows():
+                region_code = row[column_name]
+                region_geometry = row.geometry
+                tasks.append(executor.submit(process_region, region_code, region_geometry))
+
+            for future in as_completed(tasks):
+                try:
+                    future.result()
+                except Exception as e:
+                    logger.error(f"Error in a task: {e}")
+
+    if metrics_path:
+        telemetry.export(metrics_path)
     logger.info("Download completed.")
 
-# Example usage
+# Example usage, from the repository root: python -m src.utilities.GEE_download
 if __name__ == "__main__":
     # Initialize Earth Engine
     initialize_gee("path/to/credentials.json")
@@ -0,0 +1,142 @@
+import logging
+import os
+from typing import Any, List, Optional, Sequence, Tuple
+
+import numpy as np
+import rasterio
+import rioxarray  # noqa: F401
+import xarray as xr
+
+logger = logging.getLogger(__name__)
+
+# Earth Engine accepts many bands per image, but each band shrinks the tiles of a request
+DEFAULT_MAX_STACK_BANDS = 48
+
+
+def plan_period_stacks(
+    periods: Sequence[Any], n_bands: int, max_bands: int = DEFAULT_MAX_STACK_BANDS
+) -> List[List[Any]]:
+    """Group consecutive periods so that each stack holds every band of its periods and at most
+    max_bands bands in total (but always at least one period).
+
+    Args:
+        periods (Sequence[Any]): Periods to download, e.g. years or (year, month) pairs.
+        n_bands (int): Bands downloaded per period.
+        max_bands (int, optional): Maximum bands per stacked image. Defaults to DEFAULT_MAX_STACK_BANDS.
+
+    Returns:
+        List[List[Any]]: Periods of every stack.
+    """
+    per_stack = max(1, max_bands // max(n_bands, 1))
+    return [list(periods[i : i + per_stack]) for i in range(0, len(periods), per_stack)]
+
+
+def stacked_band_name(band: str, time_suffix: str) -> str:
+    """Name of a band of a stacked image, unique across bands and periods."""
+    return f"{band}_{time_suffix}" if time_suffix else band
+
+
+def split_stacked_raster(
+    stacked_path: str, output_paths: Sequence[str], overwrite: bool = False
+) -> List[str]:
+    """Write every band of a stacked GeoTIFF to its own single-band GeoTIFF.
+
+    Args:
+        stacked_path (str): Multi-band GeoTIFF, with its bands in the order of output_paths.
+        output_paths (Sequence[str]): One path per band.
+        overwrite (bool, optional): Whether to replace existing files. Defaults to False.
+
+    Returns:
+        List[str]: output_paths.
+    """
+    with rasterio.open(stacked_path) as src:
+        if src.count != len(output_paths):
+            raise ValueError(
+                f"{stacked_path} has {src.count} bands but {len(output_paths)} outputs were given."
+            )
+        profile = src.profile.copy()
+        profile.update(count=1, driver="GTiff")
+        for index, path in enumerate(output_paths, start=1):
+            if os.path.exists(path) and not overwrite:
+                logger.info(f"File already exists. Skipping: {path}")
+                continue
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            tmp_path = f"{path}.part"
+            with rasterio.open(tmp_path, "w", **profile) as dst:
+                for _, window in src.block_windows(index):
+                    dst.write(src.read(index, window=window), 1, window=window)
+            os.replace(tmp_path, path)
+    return list(output_paths)
+
+
+def stored_times(store: str, group: Optional[str] = None) -> List[np.datetime64]:
+    """Times already written to the cube of a group of a Zarr store, empty if there is none."""
+    group_path = os.path.join(store, group) if group else store
+    if not os.path.exists(os.path.join(group_path, ".zgroup")):
+        return []
+    with xr.open_zarr(store, group=group) as cube:
+        return [np.datetime64(time, "ns") for time in cube["time"].values]
+
+
+def stacked_raster_to_zarr(
+    stacked_path: str,
+    layers: Sequence[Tuple[str, Any]],
+    store: str,
+    group: Optional[str] = None,
+    chunk_size: int = 1024,
+) -> xr.Dataset:
+    """Write a stacked GeoTIFF into a time-indexed Zarr cube, one variable per band.
+
+    The bands of the GeoTIFF are the (band, time) layers in order, covering every band for each
+    time. A new cube is created with dims (time, y, x); if the group already exists, the times are
+    appended to it, so the stacks of one region can be written one after the other. Times already
+    in the cube are not written again, so re-running a download does not duplicate them. The
+    GeoTIFF is read and written in chunks of one time and chunk_size pixels a side, never whole.
+
+    Args:
+        stacked_path (str): Multi-band GeoTIFF.
+        layers (Sequence[Tuple[str, Any]]): (band name, time) of every band of the GeoTIFF.
+        store (str): Path of the Zarr store.
+        group (Optional[str], optional): Group of the cube in the store, e.g. the region code.
+                                         Defaults to None.
+        chunk_size (int, optional): Side of the spatial chunks of the cube. Defaults to 1024.
+
+    Returns:
+        xr.Dataset: The cube of the group, read lazily from the store.
+    """
+    existing = set(stored_times(store, group))
+    with xr.open_dataarray(
+        stacked_path, engine="rasterio", chunks={"band": 1, "y": chunk_size, "x": chunk_size}
+    ) as da:
+        if da.sizes["band"] != len(layers):
+            raise ValueError(
+                f"{stacked_path} has {da.sizes['band']} bands but {len(layers)} layers were given."
+            )
+        bands = list(dict.fromkeys(band for band, _ in layers))
+        times = list(dict.fromkeys(np.datetime64(time, "ns") for _, time in layers))
+        positions = {(band, np.datetime64(time, "ns")): i for i, (band, time) in enumerate(layers)}
+        new_times = [time for time in times if time not in existing]
+        if len(new_times) < len(times):
+            logger.info(
+                f"{len(times) - len(new_times)} times of {stacked_path} are already in {store}. Skipping them."
+            )
+        if new_times:
+            data_vars = {}
+            for band in bands:
+                try:
+                    indices = [positions[(band, time)] for time in new_times]
+                except KeyError:
+                    raise ValueError(f"band {band} is not available for every time of {stacked_path}.")
+                values = da.isel(band=indices).rename({"band": "time"})
+                data_vars[band] = values.assign_coords(time=np.array(new_times))
+            ds = xr.Dataset(data_vars).drop_vars("spatial_ref", errors="ignore")
+            ds = ds.rio.write_crs(da.rio.crs)
+            for name in ds.data_vars:
+                ds[name].encoding = {}
+            if existing:
+                ds.drop_vars(["x", "y", "spatial_ref"], errors="ignore").to_zarr(
+                    store, group=group, append_dim="time"
+                )
+            else:
+                ds.to_zarr(store, group=group, mode="a" if os.path.exists(store) else "w-")
+    return xr.open_zarr(store, group=group)
@@ -0,0 +1,438 @@
+import heapq
+import itertools
+import logging
+import math
+import os
+import shutil
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Executor, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from pyproj import CRS
+from shapely.geometry import box
+from shapely.geometry.base import BaseGeometry
+from shapely.prepared import prep
+
+from src.utilities.download_utilities import download_file
+from src.utilities.mosaic_utilities import mosaic_rasters
+
+logger = logging.getLogger(__name__)
+
+# limits of Image.getDownloadURL: uncompressed bytes per request and pixels per side
+GEE_MAX_REQUEST_BYTES = 48 * 1024 * 1024
+GEE_MAX_GRID_DIMENSION = 10000
+
+# metres per degree at the equator, as used by Earth Engine for scales in geographic CRSs
+METERS_PER_DEGREE = 2 * math.pi * 6378137 / 360
+
+
+@dataclass
+class GEETile:
+    """Pixel-aligned tile of a region, downloadable with one `getDownloadURL` call.
+
+    Attributes:
+        col (int): Column of the tile in the grid.
+        row (int): Row of the tile in the grid.
+        bounds (Tuple[float, float, float, float]): (minx, miny, maxx, maxy) in CRS units, on pixel edges.
+        pixel_size (float): Pixel size in CRS units.
+    """
+
+    col: int
+    row: int
+    bounds: Tuple[float, float, float, float]
+    pixel_size: float
+
+    @property
+    def width(self) -> int:
+        return int(round((self.bounds[2] - self.bounds[0]) / self.pixel_size))
+
+    @property
+    def height(self) -> int:
+        return int(round((self.bounds[3] - self.bounds[1]) / self.pixel_size))
+
+    def download_params(self, crs: str) -> dict:
+        """Parameters of `getDownloadURL` fixing the exact pixel grid of the tile."""
+        minx, _, _, maxy = self.bounds
+        return {
+            "crs": crs,
+            "crs_transform": [self.pixel_size, 0, minx, 0, -self.pixel_size, maxy],
+            "dimensions": f"{self.width}x{self.height}",
+            "format": "GeoTIFF",
+        }
+
+
+def pixel_size_for_scale(scale: float, crs: str = "EPSG:4326") -> float:
+    """Pixel size in units of the CRS for a scale in metres."""
+    return scale / METERS_PER_DEGREE if CRS.from_user_input(crs).is_geographic else float(scale)
+
+
+def tile_side_pixels(
+    n_bands: int = 1,
+    dtype: str = "float64",
+    max_bytes: int = GEE_MAX_REQUEST_BYTES,
+    max_dimension: int = GEE_MAX_GRID_DIMENSION,
+    safety: float = 0.9,
+) -> int:
+    """Side in pixels of the largest square tile below the request limits, rounded down to a
+    multiple of 256 when possible."""
+    side = int(math.sqrt(max_bytes * safety / (n_bands * np.dtype(dtype).itemsize)))
+    side = min(side, max_dimension)
+    if side >= 256:
+        side -= side % 256
+    if side < 1:
+        raise ValueError("request limits too small for a single pixel.")
+    return side
+
+
+def plan_gee_tiles(
+    geometry: BaseGeometry,
+    scale: float,
+    crs: str = "EPSG:4326",
+    n_bands: int = 1,
+    dtype: str = "float64",
+    max_bytes: int = GEE_MAX_REQUEST_BYTES,
+    max_dimension: int = GEE_MAX_GRID_DIMENSION,
+) -> List[GEETile]:
+    """Split a region into grid-aligned tiles that each fit in one Earth Engine request.
+
+    The grid is anchored at the origin of the CRS, so tiles of different regions and runs line
+    up. Tiles not intersecting the geometry are skipped, and each kept tile is shrunk to the
+    pixel-aligned bounds of its intersection with the geometry, so no bytes are requested far
+    from the region (e.g. inside the bounding box of a country with islands).
+
+    Args:
+        geometry (BaseGeometry): Region in the CRS.
+        scale (float): Scale in metres.
+        crs (str, optional): CRS of the geometry and the download. Defaults to "EPSG:4326".
+        n_bands (int, optional): Number of bands of the image. Defaults to 1.
+        dtype (str, optional): Data type of the bands. Defaults to "float64", the largest one.
+        max_bytes (int, optional): Uncompressed bytes per request. Defaults to GEE_MAX_REQUEST_BYTES.
+        max_dimension (int, optional): Pixels per side. Defaults to GEE_MAX_GRID_DIMENSION.
+
+    Returns:
+        List[GEETile]: Tiles by row then column.
+    """
+    if geometry.is_empty:
+        return []
+    pixel_size = pixel_size_for_scale(scale, crs)
+    side = tile_side_pixels(n_bands, dtype, max_bytes, max_dimension)
+    tile_size = side * pixel_size
+    minx, miny, maxx, maxy = geometry.bounds
+    prepared = prep(geometry)
+    tiles = []
+    for row in range(math.floor(miny / tile_size), math.ceil(maxy / tile_size)):
+        for col in range(math.floor(minx / tile_size), math.ceil(maxx / tile_size)):
+            cell = box(col * tile_size, row * tile_size, (col + 1) * tile_size, (row + 1) * tile_size)
+            if not prepared.intersects(cell):
+                continue
+            part = cell.intersection(geometry)
+            if part.is_empty or part.area == 0:
+                continue
+            tile = GEETile(col, row, _snap_bounds(part.bounds, pixel_size, cell.bounds), pixel_size)
+            if tile.width > 0 and tile.height > 0:
+                tiles.append(tile)
+    return tiles
+
+
+def download_gee_tiles(
+    image: Any,
+    tiles: List[GEETile],
+    output_path: str,
+    crs: str = "EPSG:4326",
+    executor: Optional[Executor] = None,
+    max_attempts: int = 5,
+    nodata: Optional[float] = None,
+    download: Callable[..., Any] = download_file,
+) -> Optional[str]:
+    """Download the tiles of an `ee.Image` concurrently and mosaic them into one GeoTIFF.
+
+    Tiles are fetched through `executor`, which can be shared by every region being downloaded
+    so that all tiles run at full parallelism; the calling thread only waits. Tiles are kept in
+    "<output_path>.tiles/" until the mosaic is written, so an interrupted run resumes with the
+    missing tiles only. A failed tile is retried here, each attempt being a single request.
+
+    Args:
+        image (ee.Image): Image to download.
+        tiles (List[GEETile]): Tiles from `plan_gee_tiles`.
+        output_path (str): Path of the mosaic.
+        crs (str, optional): CRS of the tiles. Defaults to "EPSG:4326".
+        executor (Optional[Executor], optional): Pool for the tile downloads. Defaults to a new
+                                                 pool of 4 threads.
+        max_attempts (int, optional): Attempts per tile. Defaults to 5.
+        nodata (Optional[float], optional): Nodata value of the mosaic. Defaults to None.
+        download (Callable[..., Any], optional): Function with the signature of `download_file`.
+
+    Returns:
+        Optional[str]: output_path, or None if no tile intersects the region.
+    """
+    if os.path.exists(output_path):
+        logger.info(f"File already exists. Skipping: {output_path}")
+        return output_path
+    if not tiles:
+        logger.warning(f"No tile intersects the region of {output_path}")
+        return None
+    if executor is None:
+        with ThreadPoolExecutor(max_workers=4) as new_executor:
+            return download_gee_tiles(
+                image, tiles, output_path, crs, new_executor, max_attempts, nodata, download
+            )
+
+    tiles_dir = f"{output_path}.tiles"
+    os.makedirs(tiles_dir, exist_ok=True)
+
+    def fetch(tile: GEETile) -> str:
+        filepath = _tile_path(output_path, tile)
+        filename = os.path.basename(filepath)
+        if os.path.exists(filepath):
+            return filepath
+        for attempt in range(1, max_attempts + 1):
+            try:
+                _fetch_tile(image, tile, crs, filepath, download)
+                return filepath
+            except Exception as exc:
+                if attempt == max_attempts:
+                    raise
+                wait_time = 0.32 * attempt
+                logger.warning(
+                    f"Error downloading {filename} of {output_path} (attempt {attempt} of "
+                    f"{max_attempts}): {exc}. Sleeping {wait_time} seconds before retry."
+                )
+                time.sleep(wait_time)
+        return filepath
+
+    paths = [future.result() for future in [executor.submit(fetch, tile) for tile in tiles]]
+    logger.info(f"Downloaded {len(paths)} tiles of {output_path}")
+    mosaic_tiles(paths, output_path, nodata=nodata)
+    shutil.rmtree(tiles_dir, ignore_errors=True)
+    return output_path
+
+
+@dataclass(eq=False)
+class GEEJob:
+    """Download of one image of a `GEETaskGraph`: its tiles, their mosaic and a follow-up step.
+
+    Attributes:
+        image (ee.Image): Image to download.
+        tiles (List[GEETile]): Tiles from `plan_gee_tiles`.
+        output_path (str): Path of the mosaic.
+        crs (str): CRS of the tiles.
+        nodata (Optional[float]): Nodata value of the mosaic.
+        on_done (Optional[Callable[[str], None]]): Called with output_path once the mosaic exists,
+                                                   e.g. to split a stacked image.
+        depends_on (List[GEEJob]): Jobs that must be finished before the mosaic of this one.
+        state (str): "pending", "merging", "done" or "failed".
+        error (Optional[BaseException]): Why the job failed.
+    """
+
+    image: Any
+    tiles: List[GEETile]
+    output_path: str
+    crs: str = "EPSG:4326"
+    nodata: Optional[float] = None
+    on_done: Optional[Callable[[str], None]] = None
+    depends_on: List["GEEJob"] = field(default_factory=list)
+    state: str = "pending"
+    error: Optional[BaseException] = None
+    remaining: int = field(default=0, repr=False)
+
+
+class GEETaskGraph:
+    """Flat graph of tile downloads and mosaics of many images, run by one bounded pool.
+
+    Every tile of every image (region x period) is an independent task, so the pool never sits
+    idle behind the serial loop of one region. A mosaic and its follow-up step run once all the
+    tiles of their image, and the jobs it depends on, are finished. Failed tiles are not retried
+    with a sleep inside a worker: they are put back in the queue with a growing delay while the
+    other tasks keep the workers busy.
+
+    Args:
+        max_workers (int, optional): Tasks running at once. Defaults to 5.
+        max_attempts (int, optional): Attempts per tile. Defaults to 5.
+        retry_delay (float, optional): Seconds before the first retry of a tile, multiplied by
+                                       the attempt number afterwards. Defaults to 0.32.
+        download (Callable[..., Any], optional): Function with the signature of `download_file`.
+    """
+
+    def __init__(
+        self,
+        max_workers: int = 5,
+        max_attempts: int = 5,
+        retry_delay: float = 0.32,
+        download: Callable[..., Any] = download_file,
+    ):
+        self.max_workers = max_workers
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.download = download
+        self.jobs: List[GEEJob] = []
+        self._dependents: Dict[int, List[GEEJob]] = {}
+        self._ready: deque = deque()
+
+    def add_image(
+        self,
+        image: Any,
+        tiles: List[GEETile],
+        output_path: str,
+        crs: str = "EPSG:4326",
+        nodata: Optional[float] = None,
+        on_done: Optional[Callable[[str], None]] = None,
+        depends_on: Sequence[GEEJob] = (),
+    ) -> GEEJob:
+        """Add the download of an image to the graph; nothing runs until `run`."""
+        job = GEEJob(image, tiles, output_path, crs, nodata, on_done, list(depends_on))
+        for dependency in job.depends_on:
+            self._dependents.setdefault(id(dependency), []).append(job)
+        self.jobs.append(job)
+        return job
+
+    def run(self) -> List[GEEJob]:
+        """Run every task of the graph and return the jobs, failed ones with their error.
+
+        Tiles already on disk (from an interrupted run) and images whose mosaic exists are not
+        downloaded again.
+        """
+        self._ready.clear()
+        retries: List[Tuple[float, int, GEEJob, GEETile, int]] = []
+        order = itertools.count()
+        for job in self.jobs:
+            tiles = []
+            if os.path.exists(job.output_path):
+                logger.info(f"File already exists. Skipping: {job.output_path}")
+            elif not job.tiles:
+                logger.warning(f"No tile intersects the region of {job.output_path}")
+                job.state = "done"
+                continue
+            else:
+                os.makedirs(f"{job.output_path}.tiles", exist_ok=True)
+                tiles = [t for t in job.tiles if not os.path.exists(_tile_path(job.output_path, t))]
+            job.remaining = len(tiles)
+            self._ready.extend((job, tile, 1) for tile in tiles)
+        for job in self.jobs:
+            self._try_merge(job)
+
+        running: Dict[Any, Tuple[GEEJob, Optional[GEETile], int]] = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while True:
+                now = time.monotonic()
+                while retries and retries[0][0] <= now:
+                    _, _, job, tile, attempt = heapq.heappop(retries)
+                    self._ready.append((job, tile, attempt))
+                while self._ready and len(running) < self.max_workers:
+                    job, tile, attempt = self._ready.popleft()
+                    if job.state == "failed":
+                        continue
+                    if tile is None:
+                        future = executor.submit(self._merge, job)
+                    else:
+                        path = _tile_path(job.output_path, tile)
+                        future = executor.submit(
+                            _fetch_tile, job.image, tile, job.crs, path, self.download
+                        )
+                    running[future] = (job, tile, attempt)
+                if not running and not self._ready:
+                    if not retries:
+                        break
+                    time.sleep(max(0.0, retries[0][0] - now))
+                    continue
+                timeout = max(0.0, retries[0][0] - now) if retries else None
+                done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    job, tile, attempt = running.pop(future)
+                    exc = future.exception()
+                    if tile is None:
+                        job.state, job.error = ("failed", exc) if exc else ("done", None)
+                        if exc:
+                            logger.error(f"Error merging {job.output_path}: {exc}")
+                        self._finish(job)
+                    elif exc is None:
+                        job.remaining -= 1
+                        self._try_merge(job)
+                    elif attempt < self.max_attempts and job.state != "failed":
+                        wait_time = self.retry_delay * attempt
+                        logger.warning(
+                            f"Error downloading tile {tile.row}_{tile.col} of {job.output_path} "
+                            f"(attempt {attempt} of {self.max_attempts}): {exc}. "
+                            f"Retrying in {wait_time} seconds."
+                        )
+                        heapq.heappush(
+                            retries, (time.monotonic() + wait_time, next(order), job, tile, attempt + 1)
+                        )
+                    elif job.state != "failed":
+                        logger.error(f"Error downloading {job.output_path}: {exc}")
+                        job.state, job.error = "failed", exc
+                        self._finish(job)
+        return self.jobs
+
+    def _try_merge(self, job: GEEJob):
+        """Queue the mosaic of a job once its tiles and dependencies are finished."""
+        if job.state != "pending" or job.remaining > 0:
+            return
+        if any(d.state == "failed" for d in job.depends_on):
+            job.state = "failed"
+            job.error = RuntimeError(f"a dependency of {job.output_path} failed.")
+            self._finish(job)
+        elif all(d.state == "done" for d in job.depends_on):
+            job.state = "merging"
+            # mosaics first: they free the disk of their tiles and unblock dependent jobs
+            self._ready.appendleft((job, None, 1))
+
+    def _finish(self, job: GEEJob):
+        for dependent in self._dependents.get(id(job), []):
+            self._try_merge(dependent)
+
+    @staticmethod
+    def _merge(job: GEEJob):
+        if not os.path.exists(job.output_path):
+            paths = [_tile_path(job.output_path, tile) for tile in job.tiles]
+            mosaic_tiles(paths, job.output_path, nodata=job.nodata)
+        shutil.rmtree(f"{job.output_path}.tiles", ignore_errors=True)
+        if job.on_done is not None:
+            job.on_done(job.output_path)
+
+
+def mosaic_tiles(paths: List[str], output_path: str, nodata: Optional[float] = None) -> str:
+    """Mosaic pixel-aligned tiles into one GeoTIFF, written window by window."""
+    if len(paths) == 1:
+        tmp_path = f"{output_path}.part"
+        shutil.copyfile(paths[0], tmp_path)
+        os.replace(tmp_path, output_path)
+    else:
+        mosaic_rasters(paths, output_path, nodata=nodata)
+    logger.info(f"Mosaic saved at: {output_path}")
+    return output_path
+
+
+def _tile_path(output_path: str, tile: GEETile) -> str:
+    """Where a tile of output_path is kept until the mosaic is written."""
+    return os.path.join(f"{output_path}.tiles", f"tile_{tile.row}_{tile.col}.tif")
+
+
+def _fetch_tile(image: Any, tile: GEETile, crs: str, path: str, download: Callable[..., Any]) -> str:
+    """Download one tile of an image in a single attempt; the callers retry failed tiles."""
+    url = image.getDownloadURL(tile.download_params(crs))
+    download(url, os.path.dirname(path), os.path.basename(path), source="gee", max_attempts=1)
+    return path
+
+
+def _snap_bounds(
+    bounds: Tuple[float, float, float, float],
+    pixel_size: float,
+    limits: Tuple[float, float, float, float],
+) -> Tuple[float, float, float, float]:
+    """Expand bounds outwards to pixel edges without leaving limits (the tile cell)."""
+    minx, miny, maxx, maxy = bounds
+    snapped = (
+        math.floor(minx / pixel_size + 1e-9) * pixel_size,
+        math.floor(miny / pixel_size + 1e-9) * pixel_size,
+        math.ceil(maxx / pixel_size - 1e-9) * pixel_size,
+        math.ceil(maxy / pixel_size - 1e-9) * pixel_size,
+    )
+    return (
+        max(snapped[0], limits[0]),
+        max(snapped[1], limits[1]),
+        min(snapped[2], limits[2]),
+        min(snapped[3], limits[3]),
+    )
@@ -3,17 +3,41 @@ import calendar
 import logging
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from typing import List, Optional, Any
+from typing import List, Optional, Any, Union
 
 import ee
 import geopandas as gpd
+import numpy as np
 from google.oauth2 import service_account
 from shapely.geometry import Polygon, MultiPolygon
 
 import rasterio
-from rasterio.merge import merge
+from rasterio.enums import Resampling
+from rasterio.warp import calculate_default_transform, reproject
 
-from dataset_generation.utilities.download_utilities import download_file, get_filename_from_cd
+from src.utilities.download_utilities import (
+    download_file,
+    get_filename_from_cd,
+    get_http_session,
+)
+from src.utilities.GEE_stacking import (
+    DEFAULT_MAX_STACK_BANDS,
+    plan_period_stacks,
+    split_stacked_raster,
+    stacked_band_name,
+    stacked_raster_to_zarr,
+    stored_times,
+)
+from src.utilities.footprint_catalog_utilities import (
+    FOOTPRINT_CATALOG_NAME,
+    FootprintCatalog,
+)
+from src.utilities.mosaic_utilities import mosaic_rasters
+from src.utilities.GEE_tiling import (
+    GEE_MAX_REQUEST_BYTES,
+    GEETaskGraph,
+    plan_gee_tiles,
+)
 
 # Configure logging
 logging.basicConfig(
@@ -25,33 +49,17 @@ logger = logging.getLogger(__name__)
 
 def merge_rasters(file_list: List[str], output_path: str) -> None:
     """
-    Merge multiple raster files into a single GeoTIFF using rasterio.merge.merge.
+    Merge multiple raster files into a single GeoTIFF, written block by block (`mosaic_rasters`).
 
     Args:
         file_list (List[str]): List of file paths to raster files.
         output_path (str): Path where the merged file will be saved.
     """
-    src_files = []
     try:
-        for fp in file_list:
-            src = rasterio.open(fp)
-            src_files.append(src)
-        mosaic, out_trans = merge(src_files)
-        out_meta = src_files[0].meta.copy()
-        out_meta.update({
-            "driver": "GTiff",
-            "height": mosaic.shape[1],
-            "width": mosaic.shape[2],
-            "transform": out_trans,
-        })
-        with rasterio.open(output_path, "w", **out_meta) as dest:
-            dest.write(mosaic)
+        mosaic_rasters(file_list, output_path)
         logger.info(f"Merged raster saved at: {output_path}")
     except Exception as exc:
         logger.error(f"Error during merging rasters: {exc}")
-    finally:
-        for src in src_files:
-            src.close()
 
 
 def initialize_gee(credentials_path: str) -> None:
@@ -80,189 +88,197 @@ def download_gee_data_single_collection(
     gdf: gpd.GeoDataFrame,
     column_name: str,
     collection: str,
-    band: str,
+    band: Union[str, List[str]],
     years: Optional[List[int]],
     output_folder: str,
     scale: int = 500,
     crs: str = "EPSG:4326",
     max_workers: int = 5,
     frequency: str = "yearly",
+    dtype: str = "float64",
+    max_request_bytes: int = GEE_MAX_REQUEST_BYTES,
+    stacked: bool = False,
+    zarr_store: Optional[str] = None,
+    max_stack_bands: int = DEFAULT_MAX_STACK_BANDS,
 ) -> None:
     """
     Downloads GEE data for a single collection and band, handling both yearly and monthly frequencies.
-    If a region's geometry is a multipolygon, it splits it into individual polygons, downloads each one,
-    and then merges the resulting files into a final GeoTIFF.
+    Each region is split into grid-aligned tiles sized to the Earth Engine request limits
+    (`plan_gee_tiles`). Every tile of every region and period is a task of one `GEETaskGraph`
+    of `max_workers` threads, so months and regions download side by side; each GeoTIFF is
+    mosaicked once its tiles are done, and failed tiles are requeued with a delay instead of
+    blocking a worker.
+
+    In stacked mode, the bands and periods (all years and months) of a region are renamed and
+    concatenated into multi-band images of up to `max_stack_bands` bands, each downloaded with
+    one request per tile instead of one per band and period. The bands are then split locally
+    into the usual per-period files or, with `zarr_store`, written to a time-indexed Zarr cube
+    with one group per region.
 
     Args:
         gdf (GeoDataFrame): GeoDataFrame containing region geometries.
         column_name (str): Column in `gdf` that holds unique region identifiers.
         collection (str): Earth Engine ImageCollection identifier.
-        band (str): Band name to select from the collection.
+        band (Union[str, List[str]]): Band name to select from the collection; several bands
+                                      require stacked mode.
         years (List[int], optional): List of years to download. If None, downloads without date filtering.
         output_folder (str): Directory to save the downloaded GeoTIFF files.
         scale (int, optional): Scale in meters for the data. Defaults to 500.
         crs (str, optional): Coordinate reference system for reprojection. Defaults to "EPSG:4326".
         max_workers (int, optional): Maximum number of parallel downloads. Defaults to 5.
         frequency (str, optional): Either "yearly" or "monthly". Defaults to "yearly".
+        dtype (str, optional): Data type of the band, used to size the tiles. Defaults to "float64".
+        max_request_bytes (int, optional): Uncompressed bytes per request. Defaults to GEE_MAX_REQUEST_BYTES.
+        stacked (bool, optional): Whether to stack bands and periods in one request. Defaults to False.
+        zarr_store (Optional[str], optional): In stacked mode, Zarr store for the cubes instead
+                                              of GeoTIFF files; requires years. Defaults to None.
+        max_stack_bands (int, optional): Maximum bands per stacked image. Defaults to DEFAULT_MAX_STACK_BANDS.
     """
     if frequency not in ("yearly", "monthly", "monthly_mosaic"):
         raise ValueError(f"Unsupported frequency: {frequency}")
+    bands = [band] if isinstance(band, str) else list(band)
+    if len(bands) > 1 and not stacked:
+        raise ValueError("Several bands can only be downloaded in stacked mode.")
+    if zarr_store is not None and (not stacked or not years):
+        raise ValueError("A Zarr store requires stacked mode and years.")
+    band = bands[0]
+    prefix = collection.split("/")[-1]
 
     os.makedirs(output_folder, exist_ok=True)
 
-    def process_region(region_code: str, region_geometry: Any, year: Optional[int] = None) -> None:
+    def period_images(image_collection: ee.ImageCollection, region_code: str, year: Optional[int]) -> List:
         """
-        Processes a single region (and optionally a specific year) to download and save the data.
-        If the region geometry is a multipolygon, it downloads each polygon separately and then merges them.
+        Images of every period of a year following `frequency`, as (time suffix, date, image).
+        """
+        if year is not None:
+            image_collection = image_collection.filterDate(f"{year}-01-01", f"{year}-12-31")
+        if frequency == "yearly":
+            img = image_collection.mosaic().reproject(crs=crs, scale=scale)
+            time_suffix = f"{year}" if year is not None else ""
+            return [(time_suffix, f"{year}-01-01" if year is not None else None, img)]
+        if year is None:
+            logger.warning(f"Year is required for {frequency} frequency. Skipping region: {region_code}")
+            return []
+        monthly_images = []
+        for month in range(1, 13):
+            start_date = f"{year}-{month:02d}-01"
+            end_date = f"{year}-{month:02d}-{calendar.monthrange(year, month)[1]}"
+            monthly_collection = image_collection.filterDate(start_date, end_date)
+            img = monthly_collection.mosaic().reproject(crs=crs, scale=scale)
+            monthly_images.append((f"{year}_{month:02d}", start_date, img))
+        if frequency == "monthly":
+            return monthly_images
+        # Combine all monthly images into one annual mosaic
+        mosaic_img = ee.ImageCollection([img for _, _, img in monthly_images]).mosaic()
+        return [(f"{year}_monthly_mosaic", f"{year}-01-01", mosaic_img)]
+
+    def plan_region(region_code: str, region_geometry: Any, year: Optional[int] = None) -> None:
+        """
+        Adds the images of a region (and optionally a specific year) to the task graph, one per period.
+        The tiles skip the area outside the geometry, e.g. between the parts of a multipolygon.
 
         Args:
             region_code (str): Unique identifier for the region.
             region_geometry: Geometry of the region (can be Polygon or MultiPolygon).
             year (int, optional): Year for which to download the data.
         """
-        try:
-            # Prepare the base ImageCollection and filter by year if needed.
-            image_collection = ee.ImageCollection(collection).select(band)
-            if year is not None:
-                start_date = f"{year}-01-01"
-                end_date = f"{year}-12-31"
-                image_collection = image_collection.filterDate(start_date, end_date)
-
-            region_folder = os.path.join(output_folder, region_code)
-            os.makedirs(region_folder, exist_ok=True)
-
-            def get_bbox_from_polygon(poly: Polygon) -> List:
-                minx, miny, maxx, maxy = poly.bounds
-                return [
-                    [minx, miny],
-                    [maxx, miny],
-                    [maxx, maxy],
-                    [minx, maxy],
+        image_collection = ee.ImageCollection(collection).select(band)
+        region_folder = os.path.join(output_folder, region_code)
+        os.makedirs(region_folder, exist_ok=True)
+        tiles = plan_gee_tiles(region_geometry, scale, crs, dtype=dtype, max_bytes=max_request_bytes)
+        for time_suffix, _, img in period_images(image_collection, region_code, year):
+            final_filename = f"{prefix}_{band}_{time_suffix}_{region_code}.tif"
+            graph.add_image(img, tiles, os.path.join(region_folder, final_filename), crs=crs)
+
+    def plan_region_stacked(region_code: str, region_geometry: Any) -> None:
+        """
+        Adds every band and period of a region to the task graph as stacked images, whose bands
+        are split into per-period GeoTIFFs or appended to the region's Zarr cube once downloaded.
+
+        Args:
+            region_code (str): Unique identifier for the region.
+            region_geometry: Geometry of the region (can be Polygon or MultiPolygon).
+        """
+        image_collection = ee.ImageCollection(collection).select(bands)
+        region_folder = os.path.join(output_folder, region_code)
+        os.makedirs(region_folder, exist_ok=True)
+        periods = [
+            period
+            for year in (years or [None])
+            for period in period_images(image_collection, region_code, year)
+        ]
+        stored = set(stored_times(zarr_store, region_code)) if zarr_store is not None else set()
+        previous = []
+        for index, stack in enumerate(plan_period_stacks(periods, len(bands), max_stack_bands)):
+            outputs = [
+                os.path.join(region_folder, f"{prefix}_{b}_{time_suffix}_{region_code}.tif")
+                for time_suffix, _, _ in stack
+                for b in bands
+            ]
+            if zarr_store is None and all(os.path.exists(path) for path in outputs):
+                logger.info(f"Files already exist. Skipping stack {index} of {region_code}")
+                continue
+            if zarr_store is not None and all(np.datetime64(date, "ns") in stored for _, date, _ in stack):
+                logger.info(f"Times already in {zarr_store}. Skipping stack {index} of {region_code}")
+                continue
+            img = ee.Image.cat(
+                [
+                    period_img.rename([stacked_band_name(b, time_suffix) for b in bands])
+                    for time_suffix, _, period_img in stack
                 ]
+            )
+            tiles = plan_gee_tiles(
+                region_geometry,
+                scale,
+                crs,
+                n_bands=len(outputs),
+                dtype=dtype,
+                max_bytes=max_request_bytes,
+            )
+            if zarr_store is not None:
+                layers = [(b, date) for _, date, _ in stack for b in bands]
 
-            def download_for_bbox(bbox: List, filename: str, img: ee.Image) -> Optional[str]:
-                """
-                Download the image for a given bounding box, retrying if necessary.
-                
-                Args:
-                    bbox (List): Bounding box coordinates.
-                    filename (str): The target filename.
-                    img (ee.Image): Earth Engine image.
-                
-                Returns:
-                    Optional[str]: The file path if downloaded successfully, or None.
-                """
-                filepath = os.path.join(region_folder, filename)
-                if os.path.exists(filepath):
-                    logger.info(f"File already exists. Skipping: {filepath}")
-                    return filepath
-
-                params = {"scale": scale, "region": bbox, "format": "GeoTIFF", "crs": crs}
-                max_attempts = 5
-                # Try up to max_attempts times with a small increasing delay between attempts.
-                for attempt in range(1, max_attempts + 1):
-                    try:
-                        download_url = img.getDownloadURL(params)
-                        download_file(download_url, region_folder, filename)
-                        logger.info(f"Downloaded file: {filepath}")
-                        return filepath
-                    except Exception as exc:
-                        wait_time = 0.32 * attempt  # a simple backoff strategy
-                        logger.warning(
-                            f"Error downloading {filename} (attempt {attempt} of {max_attempts}): {exc}. "
-                            f"Sleeping {wait_time} seconds before retry."
-                        )
-                        time.sleep(wait_time)
-                logger.error(f"Failed to download {filename} after {max_attempts} attempts.")
-                return None
-
-            def process_image(img: ee.Image, time_suffix: str) -> None:
-                """
-                Handles downloading for either a single polygon or a multipolygon.
-                For multipolygons, downloads each part and then merges them.
-                """
-                if region_geometry.geom_type == "MultiPolygon":
-                    temp_files = []
-                    for idx, poly in enumerate(region_geometry.geoms):
-                        bbox = get_bbox_from_polygon(poly)
-                        part_filename = f"{collection.split('/')[-1]}_{band}_{time_suffix}_{region_code}_part{idx}.tif"
-                        temp_filepath = download_for_bbox(bbox, part_filename, img)
-                        if temp_filepath:
-                            temp_files.append(temp_filepath)
-                    if not temp_files:
-                        logger.warning(f"No valid downloads for multipolygon region {region_code}, {time_suffix}")
-                        return
-                    # Merge the downloaded parts.
-                    merged_filename = f"{collection.split('/')[-1]}_{band}_{time_suffix}_{region_code}.tif"
-                    merged_filepath = os.path.join(region_folder, merged_filename)
-                    merge_rasters(temp_files, merged_filepath)
-                    # Optionally remove temporary files.
-                    for fp in temp_files:
-                        try:
-                            os.remove(fp)
-                            logger.info(f"Removed temporary file: {fp}")
-                        except Exception as e:
-                            logger.warning(f"Could not remove temp file {fp}: {e}")
-                else:
-                    # Single polygon case.
-                    bbox = get_bbox_from_polygon(region_geometry)
-                    final_filename = f"{collection.split('/')[-1]}_{band}_{time_suffix}_{region_code}.tif"
-                    download_for_bbox(bbox, final_filename, img)
-
-            # Process based on the frequency.
-            if frequency == "yearly":
-                img = image_collection.mosaic()
-                img = img.reproject(crs=crs, scale=scale)
-                time_suffix = f"{year}" if year is not None else ""
-                process_image(img, time_suffix)
-            elif frequency == "monthly":
-                if year is None:
-                    logger.warning("Year is required for monthly frequency. Skipping region: %s", region_code)
-                    return
-                for month in range(1, 13):
-                    start_date = f"{year}-{month:02d}-01"
-                    end_date = f"{year}-{month:02d}-{calendar.monthrange(year, month)[1]}"
-                    monthly_collection = image_collection.filterDate(start_date, end_date)
-                    img = monthly_collection.mosaic()
-                    img = img.reproject(crs=crs, scale=scale)
-                    time_suffix = f"{year}_{month:02d}"
-                    process_image(img, time_suffix)
-            elif frequency == "monthly_mosaic":
-                if year is None:
-                    logger.warning("Year is required for monthly_mosaic frequency. Skipping region: %s", region_code)
-                    return
-                monthly_images = []
-                for month in range(1, 13):
-                    start_date = f"{year}-{month:02d}-01"
-                    end_date = f"{year}-{month:02d}-{calendar.monthrange(year, month)[1]}"
-                    monthly_collection = image_collection.filterDate(start_date, end_date)
-                    monthly_img = monthly_collection.mosaic()
-                    monthly_img = monthly_img.reproject(crs=crs, scale=scale)
-                    monthly_images.append(monthly_img)
-                # Combine all monthly images into one annual mosaic
-                mosaic_img = ee.ImageCollection(monthly_images).mosaic()
-                time_suffix = f"{year}_monthly_mosaic"
-                process_image(mosaic_img, time_suffix)
+                def unstack(path: str, layers=layers) -> None:
+                    stacked_raster_to_zarr(path, layers, zarr_store, group=region_code)
+                    os.remove(path)
 
-        except Exception as exc:
-            logger.error(f"Unexpected error for region {region_code}, year {year}: {exc}")
+            else:
 
-    tasks = []
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        for _, row in gdf.iterrows():
-            region_code = row[column_name]
-            region_geometry = row.geometry
-            if years:
+                def unstack(path: str, outputs=outputs) -> None:
+                    split_stacked_raster(path, outputs)
+                    os.remove(path)
+
+            stacked_path = os.path.join(region_folder, f"{prefix}_stack{index}_{region_code}.tif")
+            # the stacks of a region are appended to its cube in time order
+            job = graph.add_image(img, tiles, stacked_path, crs=crs, on_done=unstack, depends_on=previous)
+            if zarr_store is not None:
+                previous = [job]
+
+    # keep one pooled keep-alive connection per download thread
+    get_http_session(pool_size=max_workers)
+    # every tile of every region and period is a task of one pool of max_workers threads
+    graph = GEETaskGraph(max_workers=max_workers, download=download_file)
+    # the tiles are planned on the grid of crs, the CRS the images are downloaded in
+    if gdf.crs is not None:
+        gdf = gdf.to_crs(crs)
+    for _, row in gdf.iterrows():
+        region_code = row[column_name]
+        region_geometry = row.geometry
+        try:
+            if stacked:
+                plan_region_stacked(region_code, region_geometry)
+            elif years:
                 for yr in years:
-                    tasks.append(executor.submit(process_region, region_code, region_geometry, yr))
+                    plan_region(region_code, region_geometry, yr)
             else:
-                tasks.append(executor.submit(process_region, region_code, region_geometry))
-        for future in as_completed(tasks):
-            try:
-                future.result()
-            except Exception as exc:
-                logger.error(f"Error in thread execution: {exc}")
+                plan_region(region_code, region_geometry)
+        except Exception as exc:
+            logger.error(f"Unexpected error for region {region_code}: {exc}")
 
+    jobs = graph.run()
+    failed = [job for job in jobs if job.state == "failed"]
+    if failed:
+        logger.error(f"{len(failed)} of {len(jobs)} images failed to download.")
     logger.info("Processing complete.")
 
 def download_gee_data_single_image(
@@ -337,11 +353,13 @@ def download_gee_data_single_image(
             )
 
             # Download the file
-            download_file(download_url,region_folder, filename)
+            download_file(download_url, region_folder, filename, source="gee")
 
         except Exception as e:
             print(f"Error processing region {region_code}: {e}")
 
+    # keep one pooled keep-alive connection per download thread
+    get_http_session(pool_size=max_workers)
     tasks = []
     with ThreadPoolExecutor(max_workers=max_workers) as executor:
         for _, row in gdf.iterrows():
@@ -366,6 +384,7 @@ def merge_tifs_in_directory(
     target_epsg=None,
     delete_after_merge=False,
     nodata=None,
+    catalog_path=None,
 ):
     """
     Merges all .tif files inside a directory (including subdirectories) into a single GeoTIFF file,
@@ -379,16 +398,21 @@ def merge_tifs_in_directory(
         target_epsg (int, optional): EPSG code to reproject the merged GeoTIFF. Defaults to None.
         delete_after_merge (bool, optional): If True, deletes source .tif files after merging. Defaults to False.
         nodata (int/float, optional): Value to use as nodata in the merged file. Defaults to None.
+        catalog_path (str, optional): Footprint catalog of the directory, kept between runs so only
+                                      new or changed files are opened. Defaults to
+                                      "<input_dir>/.footprints.sqlite".
 
     Returns:
         None
     """
-    # Search recursively for all .tif files in the directory
+    # Search recursively for all .tif files in the directory, reading only new or changed ones
     print(f"Searching for .tif files in {input_dir}...")
-    tif_files = glob.glob(os.path.join(input_dir, "**", "*.tif"), recursive=True)
+    catalog = FootprintCatalog(catalog_path or os.path.join(input_dir, FOOTPRINT_CATALOG_NAME))
+    footprints = catalog.update(input_dir)
+    tif_files = [footprint.path for footprint in footprints]
 
     if not tif_files:
-        print("No .tif files found in the specified directory.")
+        print("No valid .tif files found in the specified directory.")
         return
 
     print(f"Found {len(tif_files)} .tif files.")
@@ -397,103 +421,52 @@ def merge_tifs_in_directory(
     if filter_gdf is not None:
         if filter_crs:
             filter_gdf = filter_gdf.to_crs(filter_crs)
-        filtered_files = []
-        for tif_file in tif_files:
-            try:
-                with rasterio.open(tif_file) as src:
-                    bounds = box(*src.bounds)
-                    bounds_gdf = gpd.GeoDataFrame({"geometry": [bounds]}, crs=src.crs)
-                    if (
-                        bounds_gdf.to_crs(filter_gdf.crs)
-                        .geometry[0]
-                        .intersects(filter_gdf.unary_union)
-                    ):
-                        filtered_files.append(tif_file)
-            except Exception as e:
-                print(f"Error checking intersection for {tif_file}: {e}")
-        tif_files = filtered_files
+        tif_files = catalog.select(filter_gdf.unary_union, filter_gdf.crs, footprints)
         print(f"Filtered to {len(tif_files)} .tif files after GeoDataFrame filtering.")
 
     if not tif_files:
         print("No .tif files remain after filtering.")
         return
 
-    # Open all .tif files using rasterio
-    datasets = []
-    for tif_file in tif_files:
-        try:
-            src = rasterio.open(tif_file)
-            datasets.append(src)
-        except Exception as e:
-            print(f"Error opening file {tif_file}: {e}")
-
-    if not datasets:
-        print("No valid .tif files were opened. Aborting merge.")
-        return
-
-    # Perform the merge
+    # Mosaic block by block, without holding the whole mosaic in memory
     print("Merging datasets...")
+    merged_filepath = f"{output_filepath}.merged.tif" if target_epsg else output_filepath
     try:
-        merged_data, merged_transform = merge(datasets, nodata=nodata)
+        mosaic_rasters(tif_files, merged_filepath, nodata=nodata)
     except Exception as e:
         print(f"Error during merging: {e}")
         return
-    finally:
-        # Close all datasets
-        for dataset in datasets:
-            dataset.close()
-
-    # Use metadata from the first dataset as a base for the output
-    out_meta = datasets[0].meta.copy()
-    out_meta.update(
-        {
-            "driver": "GTiff",
-            "height": merged_data.shape[1],
-            "width": merged_data.shape[2],
-            "transform": merged_transform,
-            "nodata": nodata,
-        }
-    )
-
-    # If target EPSG is specified, reproject the merged dataset
+
+    # If target EPSG is specified, reproject the merged GeoTIFF band by band
     if target_epsg:
         print(f"Reprojecting merged GeoTIFF to EPSG:{target_epsg}...")
-        dst_transform, dst_width, dst_height = calculate_default_transform(
-            out_meta["crs"],
-            f"EPSG:{target_epsg}",
-            out_meta["width"],
-            out_meta["height"],
-            *out_meta["bounds"],
-        )
-        out_meta.update(
-            {
-                "crs": f"EPSG:{target_epsg}",
-                "transform": dst_transform,
-                "width": dst_width,
-                "height": dst_height,
-            }
-        )
-        reprojected_data = rasterio.band(merged_data, 1)
-        with rasterio.open(output_filepath, "w", **out_meta) as dest:
-            reproject(
-                source=merged_data,
-                destination=reprojected_data,
-                src_transform=merged_transform,
-                src_crs=out_meta["crs"],
-                dst_transform=dst_transform,
-                dst_crs=f"EPSG:{target_epsg}",
-                resampling=Resampling.nearest,
+        dst_crs = f"EPSG:{target_epsg}"
+        with rasterio.open(merged_filepath) as src:
+            dst_transform, dst_width, dst_height = calculate_default_transform(
+                src.crs, dst_crs, src.width, src.height, *src.bounds
+            )
+            out_meta = src.profile.copy()
+            out_meta.update(
+                {
+                    "crs": dst_crs,
+                    "transform": dst_transform,
+                    "width": dst_width,
+                    "height": dst_height,
+                }
             )
-            print(f"Reprojected GeoTIFF saved successfully to {output_filepath}.")
-    else:
-        # Save the merged GeoTIFF
-        print(f"Saving merged GeoTIFF to {output_filepath}...")
-        try:
             with rasterio.open(output_filepath, "w", **out_meta) as dest:
-                dest.write(merged_data)
-            print(f"Merged GeoTIFF saved successfully: {output_filepath}")
-        except Exception as e:
-            print(f"Error saving merged GeoTIFF: {e}")
+                for band in range(1, src.count + 1):
+                    reproject(
+                        source=rasterio.band(src, band),
+                        destination=rasterio.band(dest, band),
+                        src_nodata=src.nodata,
+                        dst_nodata=src.nodata,
+                        resampling=Resampling.nearest,
+                    )
+        os.remove(merged_filepath)
+        print(f"Reprojected GeoTIFF saved successfully to {output_filepath}.")
+    else:
+        print(f"Merged GeoTIFF saved successfully: {output_filepath}")
 
     # Optionally delete the original .tif files
     if delete_after_merge:
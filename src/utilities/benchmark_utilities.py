@@ -0,0 +1,350 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence
+
+from src.utilities.copernicus_data_store_utilities import schedule_cds_downloads
+from src.utilities.download_utilities import (
+    download_file,
+    download_file_segmented,
+    download_many,
+    get_http_session,
+)
+from src.utilities.s3_utilities import copy_objects
+from src.utilities.stand_in_utilities import (
+    FakeCDSClientPool,
+    FakeCDSServer,
+    FakeS3Server,
+    RangeFileServer,
+)
+from src.utilities.telemetry_utilities import get_telemetry
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SWEEP = (1, 2, 4, 8, 16)
+
+
+@dataclass
+class BenchmarkPoint:
+    """Outcome of one run of a sweep.
+
+    Attributes:
+        target (str): What was measured, e.g. "http-threads" or "cds".
+        parameter (str): Swept setting, e.g. "max_workers".
+        value (int): Value of the setting.
+        transfers (int): Number of transfers.
+        bytes (int): Bytes transferred.
+        duration (float): Wall-clock seconds of the run.
+        errors (int): Failed transfers.
+        retries (int): Retried attempts.
+    """
+
+    target: str
+    parameter: str
+    value: int
+    transfers: int
+    bytes: int
+    duration: float
+    errors: int = 0
+    retries: int = 0
+
+    @property
+    def throughput(self) -> float:
+        """Bytes per second."""
+        return self.bytes / self.duration if self.duration > 0 else 0.0
+
+
+def sweep(
+    target: str,
+    parameter: str,
+    values: Sequence[int],
+    run: Callable[[int, str], None],
+    source: str,
+) -> List[BenchmarkPoint]:
+    """Run `run(value, output_dir)` for every value, each time in a new directory, and measure it.
+
+    Bytes, errors and retries are read from the transfer telemetry (`get_telemetry`), which is
+    reset before every run.
+
+    Args:
+        target (str): Name of the benchmark.
+        parameter (str): Name of the swept setting.
+        values (Sequence[int]): Values of the setting.
+        run (Callable[[int, str], None]): Transfers everything once with the given value into the directory.
+        source (str): Telemetry source of the transfers ("http", "cds" or "s3").
+
+    Returns:
+        List[BenchmarkPoint]: One point per value.
+    """
+    points = []
+    telemetry = get_telemetry()
+    for value in values:
+        output_dir = tempfile.mkdtemp(prefix=f"benchmark_{target}_")
+        telemetry.reset()
+        start = time.perf_counter()
+        try:
+            run(value, output_dir)
+        finally:
+            duration = time.perf_counter() - start
+            shutil.rmtree(output_dir, ignore_errors=True)
+        stats = telemetry.summary().get(source, {})
+        point = BenchmarkPoint(
+            target,
+            parameter,
+            value,
+            transfers=stats.get("transfers", 0),
+            bytes=stats.get("bytes", 0),
+            duration=duration,
+            errors=stats.get("status", {}).get("error", 0),
+            retries=stats.get("retries", 0),
+        )
+        logger.info(
+            f"{target} {parameter}={value}: {point.throughput / 1e6:.1f} MB/s "
+            f"in {duration:.2f} s, {point.errors} errors, {point.retries} retries"
+        )
+        points.append(point)
+    return points
+
+
+def benchmark_http_threads(
+    urls: Sequence[str], values: Sequence[int] = DEFAULT_SWEEP
+) -> List[BenchmarkPoint]:
+    """Download every URL with `download_file` from a thread pool, sweeping max_workers."""
+
+    def run(max_workers: int, output_dir: str):
+        def fetch(url: str):
+            get_http_session(pool_size=max_workers)
+            download_file(url, output_dir, url.rsplit("/", 1)[-1])
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for future in [executor.submit(fetch, url) for url in urls]:
+                try:
+                    future.result()
+                except Exception as e:
+                    logger.warning(f"Download failed: {e}")
+
+    return sweep("http-threads", "max_workers", values, run, "http")
+
+
+def benchmark_http_async(
+    urls: Sequence[str], values: Sequence[int] = DEFAULT_SWEEP
+) -> List[BenchmarkPoint]:
+    """Download every URL with `download_many`, sweeping max_concurrency (and max_per_host)."""
+
+    def run(max_concurrency: int, output_dir: str):
+        tasks = [(url, os.path.join(output_dir, url.rsplit("/", 1)[-1])) for url in urls]
+        asyncio.run(
+            download_many(
+                tasks,
+                max_concurrency=max_concurrency,
+                max_per_host=max_concurrency,
+                backoff_base=0.05,
+            )
+        )
+
+    return sweep("http-async", "max_concurrency", values, run, "http")
+
+
+def benchmark_http_segments(
+    url: str, values: Sequence[int] = DEFAULT_SWEEP, min_segment_size: int = 256 * 1024
+) -> List[BenchmarkPoint]:
+    """Download one large file with `download_file_segmented`, sweeping n_segments."""
+
+    def run(n_segments: int, output_dir: str):
+        download_file_segmented(
+            url,
+            output_dir,
+            url.rsplit("/", 1)[-1],
+            n_segments=n_segments,
+            min_segment_size=min_segment_size,
+        )
+
+    return sweep("http-segments", "n_segments", values, run, "http")
+
+
+def benchmark_cds(
+    server: FakeCDSServer,
+    n_requests: int = 16,
+    values: Sequence[int] = DEFAULT_SWEEP,
+    parameter: str = "max_downloads",
+    max_queued: int = 10,
+    max_downloads: int = 4,
+) -> List[BenchmarkPoint]:
+    """Run `schedule_cds_downloads` against a `FakeCDSServer`, sweeping max_downloads or max_queued."""
+    if parameter not in ("max_downloads", "max_queued"):
+        raise ValueError(f"parameter {parameter} not in ('max_downloads', 'max_queued').")
+    pool = FakeCDSClientPool(server.url, "stand-in", wait_until_complete=False)
+    tasks = [
+        {
+            "dataset": "stand-in",
+            "request": {
+                "period": [str(2000 + i)],
+                "experiment": "historical",
+                "product_type": "reanalysis",
+                "variable": "2m_temperature",
+            },
+        }
+        for i in range(n_requests)
+    ]
+
+    def run(value: int, output_dir: str):
+        settings = {"max_queued": max_queued, "max_downloads": max_downloads, parameter: value}
+        asyncio.run(
+            schedule_cds_downloads(
+                tasks,
+                Path(output_dir),
+                poll_interval=0.05,
+                max_poll_interval=0.5,
+                retry_delay=0,
+                client_pool=pool,
+                **settings,
+            )
+        )
+
+    return sweep("cds", parameter, values, run, "cds")
+
+
+def benchmark_s3(
+    server: FakeS3Server,
+    keys: Sequence[str],
+    source_bucket: str,
+    target_bucket: str,
+    values: Sequence[int] = DEFAULT_SWEEP,
+) -> List[BenchmarkPoint]:
+    """Copy objects between two buckets of a `FakeS3Server` with `copy_objects`, sweeping max_workers."""
+
+    def run(max_workers: int, output_dir: str):
+        client = server.client(max_pool_connections=max_workers)
+        copy_objects(keys, client, source_bucket, client, target_bucket, max_workers=max_workers)
+
+    return sweep("s3", "max_workers", values, run, "s3")
+
+
+def run_benchmarks(
+    values: Sequence[int] = DEFAULT_SWEEP,
+    n_files: int = 32,
+    file_size: int = 1024 * 1024,
+    latency: float = 0.02,
+    connection_bandwidth: Optional[float] = 8e6,
+    bandwidth: Optional[float] = 64e6,
+    failure_rate: float = 0.0,
+    queue_latency=(0.2, 1.0),
+    targets: Sequence[str] = ("http-threads", "http-async", "http-segments", "cds", "s3"),
+) -> List[BenchmarkPoint]:
+    """Start the stand-ins with the given link characteristics and sweep every target.
+
+    The defaults emulate a remote server 20 ms away that sends 8 MB/s per connection over a
+    64 MB/s link, so throughput should grow with concurrency until the link saturates.
+
+    Args:
+        values (Sequence[int], optional): Concurrency values swept. Defaults to (1, 2, 4, 8, 16).
+        n_files (int, optional): Files (objects, CDS requests) per run. Defaults to 32.
+        file_size (int, optional): Size of each file. Defaults to 1 MiB.
+        latency (float, optional): Seconds before every response. Defaults to 0.02.
+        connection_bandwidth (Optional[float], optional): Bytes/s per connection. Defaults to 8e6.
+        bandwidth (Optional[float], optional): Bytes/s of each server. Defaults to 64e6.
+        failure_rate (float, optional): Fraction of requests answered with 503. Defaults to 0.
+        queue_latency (Tuple[float, float], optional): Seconds CDS jobs stay queued. Defaults to (0.2, 1.0).
+        targets (Sequence[str], optional): Benchmarks to run. Defaults to all of them.
+
+    Returns:
+        List[BenchmarkPoint]: Points of every sweep.
+    """
+    link = {
+        "latency": latency,
+        "connection_bandwidth": connection_bandwidth,
+        "bandwidth": bandwidth,
+        "failure_rate": failure_rate,
+    }
+    content = os.urandom(file_size)
+    points: List[BenchmarkPoint] = []
+    with RangeFileServer(**link) as server:
+        urls = [server.add_file(f"/file_{i}.bin", content) for i in range(n_files)]
+        if "http-threads" in targets:
+            points += benchmark_http_threads(urls, values)
+        if "http-async" in targets:
+            points += benchmark_http_async(urls, values)
+        if "http-segments" in targets:
+            large = server.add_file("/large.bin", os.urandom(file_size * n_files))
+            points += benchmark_http_segments(large, values)
+    if "cds" in targets:
+        with FakeCDSServer(queue_latency=queue_latency, result_size=file_size, **link) as cds:
+            points += benchmark_cds(cds, n_requests=n_files, values=values)
+    if "s3" in targets:
+        with FakeS3Server(["source", "target"], **link) as s3:
+            client = s3.client()
+            keys = [f"hazard/hazard.zarr/array/{i}" for i in range(n_files)]
+            for key in keys:
+                s3.buckets["source"][key] = content
+            points += benchmark_s3(s3, keys, "source", "target", values)
+            client.close()
+    return points
+
+
+def format_curves(points: Sequence[BenchmarkPoint], width: int = 40) -> str:
+    """Throughput curves as text: one table per target with a bar per value."""
+    lines = []
+    targets: Dict[str, List[BenchmarkPoint]] = {}
+    for point in points:
+        targets.setdefault(point.target, []).append(point)
+    for target, selected in targets.items():
+        best = max(p.throughput for p in selected) or 1.0
+        lines.append(f"{target} ({selected[0].parameter})")
+        for p in selected:
+            bar = "#" * int(round(width * p.throughput / best))
+            lines.append(
+                f"{p.value:>6} {p.throughput / 1e6:>8.1f} MB/s {p.duration:>7.2f} s "
+                f"{p.errors:>3} err {p.retries:>3} retries |{bar}"
+            )
+        lines.append("")
+    return "\n".join(lines)
+
+
+def write_points(points: Sequence[BenchmarkPoint], path: str):
+    """Write the points to a JSON file, with their throughput."""
+    content = [{**asdict(p), "throughput": p.throughput} for p in points]
+    with open(path, "w") as f:
+        json.dump(content, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Sweep download concurrency settings against local stand-in servers."
+    )
+    parser.add_argument("--values", type=int, nargs="+", default=list(DEFAULT_SWEEP))
+    parser.add_argument("--files", type=int, default=32)
+    parser.add_argument("--file-size", type=int, default=1024 * 1024)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--connection-bandwidth", type=float, default=8e6)
+    parser.add_argument("--bandwidth", type=float, default=64e6)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument(
+        "--targets",
+        nargs="+",
+        default=["http-threads", "http-async", "http-segments", "cds", "s3"],
+    )
+    parser.add_argument("--output", help="JSON file for the results")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    results = run_benchmarks(
+        values=args.values,
+        n_files=args.files,
+        file_size=args.file_size,
+        latency=args.latency,
+        connection_bandwidth=args.connection_bandwidth,
+        bandwidth=args.bandwidth,
+        failure_rate=args.failure_rate,
+        targets=args.targets,
+    )
+    print(format_curves(results))
+    if args.output:
+        write_points(results, args.output)
@@ -1,16 +1,23 @@
+import asyncio
+import functools
+import json
 import os
-import cdsapi
+import re
+import shutil
+import threading
+import zipfile
+from dataclasses import dataclass
 from pathlib import Path
 from dotenv import load_dotenv
-from typing import List, Dict, Any, Optional
+from typing import Callable, List, Dict, Any, Optional, Sequence, Tuple
+from src.utilities.download_cache_utilities import DownloadCache
 from src.utilities.download_utilities import download_and_extract_archive
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from src.utilities.telemetry_utilities import TransferRecord, get_telemetry
+from concurrent.futures import ThreadPoolExecutor
 from tqdm import tqdm
 import logging
 import time
 
-# Configuración del logger
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Suprimir logging de cdsapi
@@ -18,25 +25,67 @@ logging.getLogger("cdsapi").addHandler(logging.NullHandler())
 logging.getLogger("cdsapi").propagate = False
 logging.getLogger("cdsapi").setLevel(logging.CRITICAL)
 
-# Cargar variables de entorno
-load_dotenv()
 
-# Credenciales de CDS API
-cdsapi_url = os.getenv("CDSAPI_URL")
-cdsapi_key = os.getenv("CDSAPI_KEY")
+class CDSClientPool:
+    """Clientes de la API de CDS creados bajo demanda, uno por hilo.
 
-if not cdsapi_url or not cdsapi_key:
-    raise ValueError(
-        "CDS API URL or Key not found in environment variables. Check your .env file."
-    )
+    Las credenciales se toman de los argumentos o, en el primer uso, de las variables de entorno
+    CDSAPI_URL y CDSAPI_KEY (cargando el fichero .env). Los clientes reciben las credenciales
+    directamente, sin leer ni escribir ~/.cdsapirc, y cada hilo obtiene su propio cliente.
+
+    Args:
+        url (Optional[str], optional): URL de la API de CDS. Defaults to None.
+        key (Optional[str], optional): Clave de la API de CDS. Defaults to None.
+        **client_kwargs: Argumentos adicionales de `cdsapi.Client`.
+    """
+
+    def __init__(self, url: Optional[str] = None, key: Optional[str] = None, **client_kwargs):
+        self.url = url
+        self.key = key
+        self.client_kwargs = client_kwargs
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def credentials(self) -> Tuple[str, str]:
+        """URL y clave de la API, leídas del entorno la primera vez si no se proporcionaron."""
+        with self._lock:
+            if not self.url or not self.key:
+                load_dotenv()
+                self.url = self.url or os.getenv("CDSAPI_URL")
+                self.key = self.key or os.getenv("CDSAPI_KEY")
+        if not self.url or not self.key:
+            raise ValueError(
+                "CDS API URL or Key not found in environment variables. Check your .env file."
+            )
+        return self.url, self.key
+
+    def client(self):
+        """Cliente del hilo actual, creado en su primer uso."""
+        client = getattr(self._local, "client", None)
+        if client is None:
+            url, key = self.credentials()
+            import cdsapi
+
+            client = cdsapi.Client(url=url, key=key, **self.client_kwargs)
+            self._local.client = client
+        return client
 
-# Escribir configuración en .cdsapirc
-cdsapirc_path = os.path.expanduser("~/.cdsapirc")
-with open(cdsapirc_path, "w") as f:
-    f.write(f"url: {cdsapi_url}\nkey: {cdsapi_key}\n")
 
-# Crear cliente CDS API
-client = cdsapi.Client()
+_client_pool = CDSClientPool()
+
+
+def configure_cds_client(url: Optional[str] = None, key: Optional[str] = None, **client_kwargs):
+    """
+    Configura las credenciales (y otros argumentos de `cdsapi.Client`) de los clientes de CDS.
+    Sin argumentos, las credenciales se vuelven a leer del entorno en el siguiente uso.
+    """
+    global _client_pool
+    _client_pool = CDSClientPool(url, key, **client_kwargs)
+
+
+def get_cds_client():
+    """Cliente de CDS del hilo actual (ver `CDSClientPool`)."""
+    return _client_pool.client()
 
 def download_cds_dataset(
     dataset,
@@ -48,46 +97,63 @@ def download_cds_dataset(
     overwrite: bool = False,
     max_retries: int = 3,
     retry_delay: int = 5,
+    cache: Optional[DownloadCache] = None,
 ):
     """
     Descarga y extrae datos de CDS con manejo de reintentos.
+    Con `cache`, las descargas se guardan en la caché indexadas por (dataset, request) y una
+    petición ya descargada se enlaza desde la caché en lugar de volver a pedirse a CDS.
     """
     try:
         # Construir nombre único para el archivo
-        archive_name = (
-            f"{dataset}_{'_'.join(request['period'])}_{request['experiment']}_{request['product_type']}_{request['variable']}"
-        )
+        archive_name = _archive_name(dataset, request)
         # Descargar como archivo zip (no .nc)
         archive_path = output_dir / f"{archive_name}.zip"
 
+        cache_key = DownloadCache.key("cds", {"dataset": dataset, "request": request})
         # Verificar si el archivo ya existe
+        telemetry = get_telemetry()
         if not overwrite and archive_path.exists():
             logger.info(f"Archivo ya existe: {archive_path}. Skipping download.")
+            telemetry.record(TransferRecord("cds", archive_name, attempts=0, status="skipped"))
+        elif not overwrite and cache is not None and cache.get(cache_key, str(archive_path)):
+            logger.info(f"Archivo en caché: {archive_path}. Skipping download.")
+            telemetry.record(TransferRecord("cds", archive_name, attempts=0, status="cached"))
         else:
             # Intentar descargar con reintentos
-            for attempt in range(1, max_retries + 1):
-                try:
-                    logger.info(f"Descargando {archive_name} (Intento {attempt})...")
-                    client.retrieve(dataset, request).download(str(archive_path))
-                    logger.info(f"Descarga completada: {archive_path}")
-                    break  # Salir del loop si la descarga es exitosa
-                except Exception as e:
-                    logger.warning(f"Error en descarga de {archive_name}: {e}")
-                    if attempt < max_retries:
-                        logger.info(f"Reintentando en {retry_delay} segundos...")
-                        time.sleep(retry_delay)
-                    else:
-                        logger.error(f"Fallo en descarga de {archive_name} después de {max_retries} intentos.")
-                        raise
-        # ...
-        archive_path = output_dir / f"{archive_name}.zip"
-        # Luego, al llamar a la función de extracción:
+            with telemetry.transfer("cds", archive_name) as transfer:
+                for attempt in range(1, max_retries + 1):
+                    transfer.attempt()
+                    try:
+                        logger.info(f"Descargando {archive_name} (Intento {attempt})...")
+                        result = get_cds_client().retrieve(dataset, request)
+                        # time to first byte: the request waited in the CDS queue until here
+                        transfer.first_byte()
+                        result.download(str(archive_path))
+                        transfer.add_bytes(archive_path.stat().st_size)
+                        logger.info(f"Descarga completada: {archive_path}")
+                        if cache is not None:
+                            cache.put(
+                                cache_key,
+                                str(archive_path),
+                                source="cds",
+                                request={"dataset": dataset, "request": request},
+                            )
+                        break  # Salir del loop si la descarga es exitosa
+                    except Exception as e:
+                        logger.warning(f"Error en descarga de {archive_name}: {e}")
+                        if attempt < max_retries:
+                            logger.info(f"Reintentando en {retry_delay} segundos...")
+                            time.sleep(retry_delay)
+                        else:
+                            logger.error(f"Fallo en descarga de {archive_name} después de {max_retries} intentos.")
+                            raise
         if extract_by_extension:
-            download_and_extract_archive(
-                url=str(archive_path),  # Convertir a cadena para evitar problemas
+            _extract_cds_archive(
+                archive_path,
+                output_dir,
                 files_to_extract=files_to_extract,
                 extract_by_name=extract_by_name,
-                output_dir=str(output_dir),
                 extract_by_extension=extract_by_extension,
                 overwrite=overwrite,
             )
@@ -95,36 +161,342 @@ def download_cds_dataset(
         logger.error(f"Error al descargar o procesar {archive_name}: {e}")
         raise
 def parallel_download_cds(
-    download_tasks: list, max_workers: int = 2, output_dir: Path = Path("data_inputs")
-):
+    download_tasks: list,
+    max_workers: int = 2,
+    output_dir: Path = Path("data_inputs"),
+    cache: Optional[DownloadCache] = None,
+    metrics_path: Optional[str] = None,
+    max_queued: int = 10,
+    limits: Optional["CDSRequestLimits"] = None,
+) -> List[Dict[str, Any]]:
     """
     Descarga múltiples datasets de CDS en paralelo con manejo de reintentos.
+    Todas las peticiones se envían por adelantado (hasta `max_queued` en la cola de CDS a la vez)
+    y se descargan en cuanto están listas, con `max_workers` descargas simultáneas
+    (ver `schedule_cds_downloads`).
+    Las tareas comparten la caché de descargas `cache`, si se proporciona.
+    Con `limits`, las peticiones se planifican antes según su coste (`plan_cds_requests`).
+    Con `metrics_path`, al terminar se exportan las métricas de las transferencias de esta
+    llamada (`get_telemetry`): JSON si termina en ".json", formato de texto de Prometheus si no.
     """
     output_dir.mkdir(parents=True, exist_ok=True)
+    if limits is not None:
+        download_tasks = plan_cds_requests(download_tasks, limits)
 
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        futures = {
-            executor.submit(
-                download_cds_dataset,
-                task["dataset"],
-                task["request"],
+    with get_telemetry().scope() as telemetry:
+        results = _run_coroutine(
+            schedule_cds_downloads(
+                download_tasks,
                 output_dir,
-                task.get("files_to_extract"),
-                task.get("extract_by_name"),
-                task.get("extract_by_extension"),
-                task.get("overwrite", False),
-            ): task
-            for task in download_tasks
-        }
+                max_queued=max_queued,
+                max_downloads=max_workers,
+                cache=cache,
+            )
+        )
+
+    if metrics_path is not None:
+        telemetry.export(metrics_path)
+    return results
+
+
+# estados de los trabajos de CDS (cdsapi y cads-api-client) normalizados
+_CDS_JOB_STATES = {
+    "accepted": "queued",
+    "queued": "queued",
+    "running": "running",
+    "completed": "completed",
+    "successful": "completed",
+    "failed": "failed",
+    "rejected": "failed",
+    "dismissed": "failed",
+    "deleted": "failed",
+}
+
+
+async def schedule_cds_downloads(
+    download_tasks: List[Dict[str, Any]],
+    output_dir: Path,
+    max_queued: int = 10,
+    max_downloads: int = 4,
+    poll_interval: float = 5.0,
+    max_poll_interval: float = 60.0,
+    max_retries: int = 3,
+    retry_delay: int = 5,
+    cache: Optional[DownloadCache] = None,
+    client_pool: Optional[CDSClientPool] = None,
+    max_ready: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Descarga tareas de CDS enviando las peticiones sin esperar a que terminen y consultando su
+    estado desde un único bucle asyncio.
+
+    Cada petición se envía en cuanto hay hueco en la cola (`max_queued`, el límite de peticiones
+    por usuario de CDS); su estado se consulta con intervalos crecientes y, al completarse, libera
+    su hueco en la cola y se descarga en cuanto hay una de las `max_downloads` descargas libres.
+    Así ningún hilo local queda bloqueado mientras la petición espera en la cola de CDS. Las
+    llamadas bloqueantes de cdsapi se ejecutan en hilos con su propio cliente: cada trabajo se
+    envía, se consulta y se descarga siempre desde el mismo hilo, con el cliente que lo envió.
+    Hay un hilo por trabajo en curso: hasta `max_queued` en la cola, `max_ready` completados
+    esperando una descarga libre y `max_downloads` descargando. Los trabajos que esperan
+    descarga no ocupan hueco en la cola, así que se siguen enviando peticiones mientras tanto.
+
+    Args:
+        download_tasks (List[Dict[str, Any]]): Tareas de `create_general_download_tasks`.
+        output_dir (Path): Directorio de descarga.
+        max_queued (int, optional): Máximo de peticiones en la cola de CDS a la vez. Defaults to 10.
+        max_downloads (int, optional): Máximo de descargas simultáneas. Defaults to 4.
+        poll_interval (float, optional): Intervalo inicial de consulta en segundos. Defaults to 5.
+        max_poll_interval (float, optional): Intervalo máximo de consulta en segundos. Defaults to 60.
+        max_retries (int, optional): Intentos por petición. Defaults to 3.
+        retry_delay (int, optional): Espera entre intentos en segundos. Defaults to 5.
+        cache (Optional[DownloadCache], optional): Caché de descargas. Defaults to None.
+        client_pool (Optional[CDSClientPool], optional): Clientes a usar; deben crearse con
+            wait_until_complete=False. Por defecto, con las credenciales de `configure_cds_client`.
+        max_ready (Optional[int], optional): Máximo de trabajos completados esperando descarga.
+            Defaults to max_queued.
+
+    Returns:
+        List[Dict[str, Any]]: Por tarea, "archive_path", "state" ("downloaded", "skipped", "cached"
+                              o "failed") y "error".
+    """
+    if client_pool is None:
+        url, key = _client_pool.credentials()
+        client_kwargs = {**_client_pool.client_kwargs, "wait_until_complete": False}
+        client_pool = CDSClientPool(url, key, **client_kwargs)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    queue_slots = asyncio.Semaphore(max_queued)
+    download_slots = asyncio.Semaphore(max_downloads)
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=max_downloads)
+    # one single-thread lane per job in flight: a job is submitted, polled and downloaded from
+    # the same thread, hence with the client that submitted it (clients are not thread-safe).
+    # The lanes of the jobs waiting for a download are counted apart from the queue, so those
+    # jobs never keep new requests from being submitted
+    max_ready = max_queued if max_ready is None else max_ready
+    lanes = [
+        ThreadPoolExecutor(max_workers=1) for _ in range(max_queued + max_ready + max_downloads)
+    ]
+    idle_lanes: asyncio.Queue = asyncio.Queue()
+    for lane in lanes:
+        idle_lanes.put_nowait(lane)
+    telemetry = get_telemetry()
+
+    def blocking(function, *args, executor=executor, **kwargs):
+        return loop.run_in_executor(executor, functools.partial(function, *args, **kwargs))
+
+    def submit(dataset, request):
+        return client_pool.client().retrieve(dataset, request)
 
-        with tqdm(total=len(futures), desc="Downloading datasets") as pbar:
-            for future in as_completed(futures):
-                task = futures[future]
+    async def retrieve(dataset, request, archive_path, transfer):
+        lane = await idle_lanes.get()
+        try:
+            async with queue_slots:
+                job = await blocking(submit, dataset, request, executor=lane)
+                delay = poll_interval
+                while True:
+                    state = await blocking(_cds_job_state, job, executor=lane)
+                    if state in ("completed", "failed"):
+                        break
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 1.5, max_poll_interval)
+            if state == "failed":
+                raise RuntimeError(f"CDS request failed: {getattr(job, 'reply', job)}")
+            # time to first byte: the request waited in the CDS queue until here
+            transfer.first_byte()
+            async with download_slots:
+                await blocking(job.download, str(archive_path), executor=lane)
+            transfer.add_bytes(archive_path.stat().st_size)
+            await blocking(_delete_cds_job, job, executor=lane)
+        finally:
+            idle_lanes.put_nowait(lane)
+
+    async def download(dataset, request, archive_name, archive_path, overwrite):
+        """Download one request unless it is already there or cached; returns the state."""
+        cache_key = DownloadCache.key("cds", {"dataset": dataset, "request": request})
+        if not overwrite and archive_path.exists():
+            telemetry.record(TransferRecord("cds", archive_name, attempts=0, status="skipped"))
+            return "skipped"
+        if not overwrite and cache is not None and cache.get(cache_key, str(archive_path)):
+            telemetry.record(TransferRecord("cds", archive_name, attempts=0, status="cached"))
+            return "cached"
+        with telemetry.transfer("cds", archive_name) as transfer:
+            for attempt in range(1, max_retries + 1):
+                transfer.attempt()
                 try:
-                    future.result()
+                    logger.info(f"Enviando {archive_name} (Intento {attempt})...")
+                    await retrieve(dataset, request, archive_path, transfer)
+                    logger.info(f"Descarga completada: {archive_path}")
+                    break
                 except Exception as e:
-                    logger.error(f"Fallo en tarea de descarga: {e}")
+                    logger.warning(f"Error en descarga de {archive_name}: {e}")
+                    if attempt == max_retries:
+                        raise
+                    await asyncio.sleep(retry_delay)
+        if cache is not None:
+            cache.put(
+                cache_key,
+                str(archive_path),
+                source="cds",
+                request={"dataset": dataset, "request": request},
+            )
+        return "downloaded"
+
+    async def extract(task, paths):
+        if task.get("extract_by_extension"):
+            for path in paths:
+                await blocking(
+                    _extract_cds_archive,
+                    path,
+                    output_dir,
+                    files_to_extract=task.get("files_to_extract"),
+                    extract_by_name=task.get("extract_by_name"),
+                    extract_by_extension=task["extract_by_extension"],
+                    overwrite=task.get("overwrite", False),
+                )
+
+    async def run_task(task, pbar):
+        dataset, request = task["dataset"], task["request"]
+        overwrite = task.get("overwrite", False)
+        archive_name = task.get("archive_name") or _archive_name(dataset, request)
+        archive_path = output_dir / f"{archive_name}.zip"
+        targets = task.get("targets") or []
+        target_paths = [output_dir / f"{t['archive_name']}.zip" for t in targets]
+        outcome = {"archive_path": archive_path, "state": "downloaded", "error": None}
+        if targets:
+            outcome["archive_paths"] = target_paths
+        try:
+            # the archives left by a previous run: the pieces of a split request are joined
+            entries = zip(targets, target_paths) if targets else [(task, archive_path)]
+            done = [
+                output_dir / f"{entry['part_of']}.zip" if entry.get("part_of") else path
+                for entry, path in entries
+            ]
+            if not overwrite and not archive_path.exists() and all(p.exists() for p in done):
+                outcome["state"] = "skipped"
+                telemetry.record(TransferRecord("cds", archive_name, attempts=0, status="skipped"))
                 pbar.update(1)
+                return outcome
+            outcome["state"] = await download(dataset, request, archive_name, archive_path, overwrite)
+            if targets:
+                # merged request: split the archive back into one archive per original task
+                try:
+                    await blocking(
+                        split_merged_archive,
+                        archive_path,
+                        targets,
+                        output_dir,
+                        task.get("member_tokens"),
+                    )
+                except ValueError as e:
+                    logger.warning(f"{e} Se descargan sus tareas por separado.")
+                    for target, path in zip(targets, target_paths):
+                        await download(dataset, target["request"], target["archive_name"], path, overwrite)
+                archive_path.unlink()
+            # the pieces of a split request are extracted once joined, see join_parts
+            entries = zip(targets, target_paths) if targets else [(task, archive_path)]
+            await extract(task, [path for entry, path in entries if not entry.get("part_of")])
+        except Exception as e:
+            logger.error(f"Fallo en tarea de descarga {archive_name}: {e}")
+            outcome["state"] = "failed"
+            outcome["error"] = f"{type(e).__name__}: {e}"
+        pbar.update(1)
+        return outcome
+
+    async def join_parts(name, task, parts, outcomes):
+        """Join the pieces of a request split by `plan_cds_requests` into its own archive."""
+        path = output_dir / f"{name}.zip"
+        if all(p.exists() for p in parts):
+            await blocking(join_split_archives, parts, path)
+        elif not path.exists():
+            return
+        for outcome in outcomes:
+            if outcome["archive_path"] in parts:
+                outcome["archive_path"] = path
+            if "archive_paths" in outcome:
+                outcome["archive_paths"] = [path if p in parts else p for p in outcome["archive_paths"]]
+        await extract(task, [path])
+
+    try:
+        with tqdm(total=len(download_tasks), desc="Downloading datasets") as pbar:
+            outcomes = list(
+                await asyncio.gather(*(run_task(task, pbar) for task in download_tasks))
+            )
+        split: Dict[str, Tuple[Dict[str, Any], List[Path]]] = {}
+        for task in download_tasks:
+            for entry in task.get("targets") or [task]:
+                if entry.get("part_of"):
+                    parts = split.setdefault(entry["part_of"], (task, []))[1]
+                    parts.append(output_dir / f"{entry['archive_name']}.zip")
+        for name, (task, parts) in split.items():
+            try:
+                await join_parts(name, task, parts, outcomes)
+            except Exception as e:
+                logger.error(f"Fallo al unir las partes de {name}: {e}")
+                for outcome in outcomes:
+                    if outcome["archive_path"] in parts or set(outcome.get("archive_paths", [])) & set(parts):
+                        outcome["state"] = "failed"
+                        outcome["error"] = f"{type(e).__name__}: {e}"
+        return outcomes
+    finally:
+        for pool in [executor, *lanes]:
+            pool.shutdown(wait=False)
+
+
+def _cds_job_state(job) -> str:
+    """Refresh and return the normalized state of a CDS job submitted with wait_until_complete=False."""
+    if hasattr(job, "reply"):  # cdsapi.api.Result
+        job.update()
+        state = job.reply.get("state")
+    else:  # cads_api_client Remote
+        state = job.status
+    if state not in _CDS_JOB_STATES:
+        raise RuntimeError(f"Unknown CDS job state {state}")
+    return _CDS_JOB_STATES[state]
+
+
+def _extract_cds_archive(
+    archive_path: Path,
+    output_dir: Path,
+    files_to_extract: Optional[list] = None,
+    extract_by_name: Optional[str] = None,
+    extract_by_extension: Optional[str] = None,
+    overwrite: bool = False,
+):
+    """Extrae en output_dir los ficheros de un archivo descargado de CDS."""
+    download_and_extract_archive(
+        url=str(archive_path),  # Convertir a cadena para evitar problemas
+        files_to_extract=files_to_extract,
+        extract_by_name=extract_by_name,
+        output_dir=str(output_dir),
+        extract_by_extension=extract_by_extension,
+        overwrite=overwrite,
+    )
+
+
+def _delete_cds_job(job):
+    """Free the result of a downloaded job on the CDS servers; failures are only logged."""
+    delete = getattr(job, "delete", None)
+    if delete is not None:
+        try:
+            delete()
+        except Exception as e:
+            logger.debug(f"No se pudo borrar el trabajo de CDS: {e}")
+
+
+def _archive_name(dataset: str, request: Dict[str, Any]) -> str:
+    return (
+        f"{dataset}_{'_'.join(request['period'])}_{request['experiment']}_{request['product_type']}_{request['variable']}"
+    )
+
+
+def _run_coroutine(coroutine):
+    """Run a coroutine to completion, also from a thread with a running event loop (e.g. Jupyter)."""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, coroutine).result()
 
 def create_general_download_tasks(
     base_request: Dict[str, Any],
@@ -165,3 +537,380 @@ def create_general_download_tasks(
                     }
                 )
     return download_tasks
+
+
+# pasos temporales por año de cada agregación temporal
+_STEPS_PER_YEAR = {
+    "hourly": 8760,
+    "1_hourly": 8760,
+    "3_hourly": 2920,
+    "6_hourly": 1460,
+    "daily": 365,
+    "dekad": 36,
+    "10_day": 36,
+    "monthly": 12,
+    "season": 4,
+    "seasonal": 4,
+    "yearly": 1,
+    "annual": 1,
+}
+
+
+@dataclass
+class CDSRequestLimits:
+    """
+    Límites de coste de las peticiones a un dataset de CDS, usados por `plan_cds_requests`.
+
+    Attributes:
+        max_fields (int): Máximo de campos (variable × periodo × paso temporal × ...) por petición.
+        min_fields (int): Por debajo de este coste las peticiones se agrupan con otras.
+        max_bytes (Optional[float]): Tamaño máximo estimado por petición, si el dataset lo limita.
+        resolution (float): Resolución del dataset en grados, para estimar el tamaño del área.
+        bytes_per_value (float): Bytes por valor descargado.
+        split_keys (Sequence[str]): Claves por las que se dividen las peticiones, por preferencia.
+        merge_keys (Sequence[str]): Claves por las que se agrupan las peticiones pequeñas. Vacío
+            por defecto: solo se agrupa en datasets cuyos ficheros se pueden volver a separar
+            por su nombre (ver `split_merged_archive` y member_tokens).
+        member_tokens (Optional[Callable[[str, Any], Optional[Sequence[str]]]]): Palabras con
+            las que el valor de una clave de la petición aparece en los nombres de los ficheros
+            del dataset, p. ej. `cmip6_member_tokens`; None para usar las palabras del valor.
+    """
+
+    max_fields: int = 12000
+    min_fields: int = 1000
+    max_bytes: Optional[float] = None
+    resolution: float = 0.5
+    bytes_per_value: float = 4
+    split_keys: Sequence[str] = ("period", "year", "variable", "month", "experiment", "day")
+    merge_keys: Sequence[str] = ()
+    member_tokens: Optional[Callable[[str, Any], Optional[Sequence[str]]]] = None
+
+
+# nombres de las variables de CMIP6 en CDS y en los ficheros que se descargan
+CMIP6_VARIABLE_NAMES = {
+    "near_surface_air_temperature": "tas",
+    "daily_maximum_near_surface_air_temperature": "tasmax",
+    "daily_minimum_near_surface_air_temperature": "tasmin",
+    "precipitation": "pr",
+    "near_surface_specific_humidity": "huss",
+    "near_surface_relative_humidity": "hurs",
+    "sea_level_pressure": "psl",
+    "surface_downwelling_shortwave_radiation": "rsds",
+    "surface_downwelling_longwave_radiation": "rlds",
+    "near_surface_wind_speed": "sfcWind",
+    "eastward_near_surface_wind": "uas",
+    "northward_near_surface_wind": "vas",
+    "evaporation_including_sublimation_and_transpiration": "evspsbl",
+    "total_cloud_cover_percentage": "clt",
+    "surface_temperature": "ts",
+    "air_temperature": "ta",
+}
+
+
+def cmip6_member_tokens(key: str, value: Any) -> Optional[Sequence[str]]:
+    """
+    Palabras de un valor de una petición de CMIP6 en los nombres de sus ficheros, como
+    "tas_Amon_GFDL-ESM4_ssp585_r1i1p1f1_gr1_20150116-21001216.nc": las variables por su nombre
+    corto y los escenarios sin separadores ("ssp5_8_5" es "ssp585"). None para el resto.
+    """
+    if key == "variable" and value in CMIP6_VARIABLE_NAMES:
+        return [CMIP6_VARIABLE_NAMES[value]]
+    if key == "experiment" and re.fullmatch(r"ssp\d_\d_\d", str(value)):
+        return [str(value).replace("_", "")]
+    return None
+
+
+def estimate_request_cost(
+    request: Dict[str, Any], limits: Optional[CDSRequestLimits] = None
+) -> Tuple[float, float]:
+    """
+    Estima el coste de una petición de CDS a partir de sus variables, periodos, área y
+    resolución temporal.
+
+    El número de campos es el producto del número de valores de cada clave con una lista
+    (variables, experimentos, años, meses, ...) por los pasos temporales de cada periodo
+    ("201101_204012" con "temporal_aggregation": "monthly" son 30 años × 12 pasos). El tamaño
+    es el número de campos por las celdas del área ([N, O, S, E], global por defecto) a la
+    resolución del dataset.
+
+    Returns:
+        Tuple[float, float]: Número de campos y tamaño estimado en bytes.
+    """
+    limits = limits or CDSRequestLimits()
+    fields = 1.0
+    for key, value in request.items():
+        if key in ("area", "grid", "period") or not isinstance(value, (list, tuple)):
+            continue
+        fields *= max(len(value), 1)
+    aggregation = request.get("temporal_aggregation") or request.get("temporal_resolution")
+    steps_per_year = _STEPS_PER_YEAR.get(str(aggregation).lower(), 1) if aggregation else 1
+    periods = request.get("period")
+    if periods is not None:
+        periods = [periods] if isinstance(periods, str) else periods
+        fields *= sum(_period_years(period) * steps_per_year for period in periods)
+    else:
+        fields *= steps_per_year if aggregation else 1
+
+    north, west, south, east = request.get("area", (90, -180, -90, 180))
+    cells = max(abs(north - south), limits.resolution) * max(abs(east - west), limits.resolution)
+    cells /= limits.resolution**2
+    return fields, fields * cells * limits.bytes_per_value
+
+
+def plan_cds_requests(
+    download_tasks: List[Dict[str, Any]], limits: Optional[CDSRequestLimits] = None
+) -> List[Dict[str, Any]]:
+    """
+    Planifica las tareas de descarga de CDS según su coste (`estimate_request_cost`).
+
+    Las peticiones que superan los límites se dividen por la mitad según las `split_keys`
+    (cada parte se descarga como "<archivo>_partN.zip" y las partes se unen después en
+    "<archivo>.zip", ver `join_split_archives`). Las peticiones por debajo de `min_fields`
+    que solo difieren en una de las `merge_keys` (ninguna por defecto) se agrupan, sin superar
+    los límites, en una única petición; el archivo descargado se vuelve a dividir en los
+    archivos esperados por cada tarea original (`split_merged_archive`, con `member_tokens`).
+    Así se reduce el tiempo total de cola más descarga.
+
+    Args:
+        download_tasks (List[Dict[str, Any]]): Tareas de `create_general_download_tasks`.
+        limits (Optional[CDSRequestLimits], optional): Límites del dataset. Defaults to None.
+
+    Returns:
+        List[Dict[str, Any]]: Tareas para `schedule_cds_downloads`, con "archive_name",
+                              "part_of" (archivo de la petición dividida, o None) y
+                              "targets" (tareas originales de las agrupadas).
+    """
+    limits = limits or CDSRequestLimits()
+    planned = []
+    for task in download_tasks:
+        name = task.get("archive_name") or _archive_name(task["dataset"], task["request"])
+        parts = _split_request(task["request"], limits)
+        for i, request in enumerate(parts):
+            piece = dict(task, request=request)
+            piece["archive_name"] = name if len(parts) == 1 else f"{name}_part{i + 1}"
+            piece["part_of"] = None if len(parts) == 1 else name
+            piece["targets"] = []
+            planned.append(piece)
+
+    for key in limits.merge_keys:
+        groups: Dict[str, List[Dict[str, Any]]] = {}
+        kept = []
+        for piece in planned:
+            fields, size = estimate_request_cost(piece["request"], limits)
+            if key not in piece["request"] or fields >= limits.min_fields:
+                kept.append(piece)
+                continue
+            group = json.dumps(
+                {
+                    "dataset": piece["dataset"],
+                    "request": {k: v for k, v in piece["request"].items() if k != key},
+                    "extract": [piece.get(k) for k in _EXTRACTION_KEYS],
+                },
+                sort_keys=True,
+                default=str,
+            )
+            groups.setdefault(group, []).append(piece)
+        for pieces in groups.values():
+            kept.extend(_merge_pieces(pieces, key, limits))
+        planned = kept
+    for piece in planned:
+        if piece["targets"]:
+            piece["member_tokens"] = limits.member_tokens
+
+    n_merged = sum(1 for piece in planned if piece["targets"])
+    logger.info(
+        f"Planned {len(download_tasks)} tasks as {len(planned)} requests ({n_merged} merged)"
+    )
+    return planned
+
+
+def split_merged_archive(
+    archive_path: Path,
+    targets: List[Dict[str, Any]],
+    output_dir: Path,
+    member_tokens: Optional[Callable[[str, Any], Optional[Sequence[str]]]] = None,
+) -> List[Path]:
+    """
+    Divide el archivo ZIP de una petición agrupada en un ZIP por tarea original.
+
+    Cada miembro se asigna a la tarea cuyos valores de las claves agrupadas ("match") aparecen
+    como palabras de su nombre (sin mayúsculas, separadas por cualquier carácter no
+    alfanumérico; los periodos por sus años). Con `member_tokens` (ver `CDSRequestLimits`), los
+    valores se buscan por las palabras que devuelve, p. ej. "tas" para
+    "near_surface_air_temperature". Los miembros que no corresponden a ninguna tarea
+    (README, licencias...) se copian en todas.
+
+    Raises:
+        ValueError: Si un miembro corresponde a varias tareas o alguna tarea no recibe ninguno,
+                    p. ej. un único "data.nc" con todas las variables.
+
+    Returns:
+        List[Path]: Archivos de las tareas, en el orden de `targets`.
+    """
+    paths = [output_dir / f"{target['archive_name']}.zip" for target in targets]
+    with zipfile.ZipFile(archive_path) as merged:
+        assignment: Dict[int, List[zipfile.ZipInfo]] = {i: [] for i in range(len(targets))}
+        shared = []
+        for info in merged.infolist():
+            matches = [
+                i for i, target in enumerate(targets) if _member_matches(info.filename, target["match"], member_tokens)
+            ]
+            if len(matches) > 1:
+                raise ValueError(f"{info.filename} de {archive_path} corresponde a varias tareas.")
+            if matches:
+                assignment[matches[0]].append(info)
+            else:
+                shared.append(info)
+        missing = [targets[i]["archive_name"] for i, members in assignment.items() if not members]
+        if missing:
+            raise ValueError(f"{archive_path} no contiene ningún fichero de {', '.join(missing)}.")
+        for i, path in enumerate(paths):
+            tmp_path = path.with_name(path.name + ".part")
+            with zipfile.ZipFile(tmp_path, "w") as archive:
+                for info in assignment[i] + shared:
+                    _copy_member(merged, info, archive, info.filename)
+            os.replace(tmp_path, path)
+    return paths
+
+
+def join_split_archives(parts: Sequence[Path], archive_path: Path) -> Path:
+    """
+    Une en un único ZIP los archivos de las partes de una petición dividida y las borra.
+
+    Un miembro repetido en varias partes (p. ej. "data.nc") se guarda como "<nombre>_partN".
+
+    Returns:
+        Path: archive_path.
+    """
+    tmp_path = archive_path.with_name(archive_path.name + ".part")
+    seen = set()
+    with zipfile.ZipFile(tmp_path, "w") as archive:
+        for n, part in enumerate(parts, start=1):
+            with zipfile.ZipFile(part) as source:
+                for info in source.infolist():
+                    name = info.filename
+                    if name in seen:
+                        stem, ext = os.path.splitext(name)
+                        name = f"{stem}_part{n}{ext}"
+                    seen.add(name)
+                    _copy_member(source, info, archive, name)
+    os.replace(tmp_path, archive_path)
+    for part in parts:
+        part.unlink()
+    return archive_path
+
+
+def _copy_member(source: zipfile.ZipFile, info: zipfile.ZipInfo, archive: zipfile.ZipFile, name: str):
+    # a new ZipInfo: writing updates its offsets, which the source archive still needs
+    member = zipfile.ZipInfo(name, info.date_time)
+    member.compress_type = info.compress_type
+    member.external_attr = info.external_attr
+    with source.open(info) as src, archive.open(member, "w", force_zip64=True) as destination:
+        shutil.copyfileobj(src, destination, 8 * 1024 * 1024)
+
+
+_EXTRACTION_KEYS = ("files_to_extract", "extract_by_name", "extract_by_extension", "overwrite")
+
+
+def _period_years(period: str) -> int:
+    """Años de un periodo como "201101_204012" o "1981-2010"; 1 si no se reconoce."""
+    years = re.findall(r"(\d{4})\d*", str(period))
+    if len(years) >= 2:
+        return max(int(years[-1]) - int(years[0]) + 1, 1)
+    return 1
+
+
+def _split_request(request: Dict[str, Any], limits: CDSRequestLimits) -> List[Dict[str, Any]]:
+    """Divide recursivamente por la mitad una petición que supera los límites."""
+    fields, size = estimate_request_cost(request, limits)
+    if fields <= limits.max_fields and (limits.max_bytes is None or size <= limits.max_bytes):
+        return [request]
+    for key in limits.split_keys:
+        values = request.get(key)
+        if isinstance(values, (list, tuple)) and len(values) > 1:
+            half = len(values) // 2
+            return _split_request(dict(request, **{key: list(values[:half])}), limits) + (
+                _split_request(dict(request, **{key: list(values[half:])}), limits)
+            )
+    logger.warning(f"La petición supera los límites de CDS y no se puede dividir: {request}")
+    return [request]
+
+
+def _merge_pieces(
+    pieces: List[Dict[str, Any]], key: str, limits: CDSRequestLimits
+) -> List[Dict[str, Any]]:
+    """Agrupa peticiones que solo difieren en `key` sin superar los límites."""
+    merged = []
+    current: Optional[Dict[str, Any]] = None
+    for piece in pieces:
+        if current is not None:
+            candidate = _merge_two(current, piece, key)
+            fields, size = estimate_request_cost(candidate["request"], limits)
+            if fields <= limits.max_fields and (limits.max_bytes is None or size <= limits.max_bytes):
+                current = candidate
+                continue
+            merged.append(current)
+        current = piece
+    if current is not None:
+        merged.append(current)
+    return merged
+
+
+def _merge_two(a: Dict[str, Any], b: Dict[str, Any], key: str) -> Dict[str, Any]:
+    values = []
+    for piece in (a, b):
+        value = piece["request"][key]
+        values.extend(value if isinstance(value, (list, tuple)) else [value])
+    merged = dict(a, request=dict(a["request"], **{key: values}))
+    merged["targets"] = _targets(a, key) + _targets(b, key)
+    merged["part_of"] = None
+    merged["archive_name"] = f"merged_{DownloadCache.key('cds', merged['request'])[:16]}"
+    return merged
+
+
+def _targets(piece: Dict[str, Any], key: str) -> List[Dict[str, Any]]:
+    """Tareas originales de una petición, con los valores de `key` que las identifican."""
+    if piece["targets"]:
+        return [
+            dict(target, match=dict(target["match"], **{key: piece["request"][key]}))
+            for target in piece["targets"]
+        ]
+    return [
+        {
+            "archive_name": piece["archive_name"],
+            "part_of": piece.get("part_of"),
+            "request": piece["request"],
+            "match": {key: piece["request"][key]},
+        }
+    ]
+
+
+def _member_matches(
+    name: str,
+    match: Dict[str, Any],
+    member_tokens: Optional[Callable[[str, Any], Optional[Sequence[str]]]] = None,
+) -> bool:
+    tokens = re.findall(r"[a-z0-9]+", name.lower())
+    for key, value in match.items():
+        values = value if isinstance(value, (list, tuple)) else [value]
+        if not any(_value_in_name(key, v, tokens, member_tokens) for v in values):
+            return False
+    return True
+
+
+def _value_in_name(
+    key: str,
+    value: Any,
+    tokens: List[str],
+    member_tokens: Optional[Callable[[str, Any], Optional[Sequence[str]]]] = None,
+) -> bool:
+    """Whether the words of value appear in a row among tokens, or its years start some of them."""
+    mapped = member_tokens(key, value) if member_tokens is not None else None
+    text = " ".join(mapped) if mapped is not None else str(value)
+    words = re.findall(r"[a-z0-9]+", text.lower())
+    if words and any(tokens[i : i + len(words)] == words for i in range(len(tokens))):
+        return True
+    years = re.findall(r"(\d{4})\d*", text)
+    return len(years) >= 2 and all(
+        any(token.isdigit() and token.startswith(year) for token in tokens) for year in years
+    )
@@ -0,0 +1,264 @@
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class DownloadCache:
+    """Local cache of downloaded artifacts shared by the HTTP, CDS and GEE downloaders.
+
+    Every artifact is keyed by a canonical hash of the request that produced it (URL, CDS request
+    dictionary or GEE parameters) and stored once per content checksum under "objects/", so two
+    requests returning the same bytes share the same file. A SQLite manifest ("manifest.sqlite")
+    records the size, checksum, source and timestamps of every entry. Cached artifacts are
+    hard-linked into the requested output location (copied if the cache is on another device),
+    and the least recently used entries are evicted once the cache exceeds `max_bytes`.
+
+    Args:
+        cache_dir (str): Directory of the cache.
+        max_bytes (int, optional): Maximum total size of the cached objects. Defaults to 50 GiB.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = 50 * 1024**3):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.objects_dir = os.path.join(cache_dir, "objects")
+        self.manifest_path = os.path.join(cache_dir, "manifest.sqlite")
+        self._lock = threading.Lock()
+        os.makedirs(self.objects_dir, exist_ok=True)
+        with self._connect() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS artifacts ("
+                "key TEXT PRIMARY KEY, sha256 TEXT NOT NULL, size INTEGER NOT NULL, "
+                "source TEXT, request TEXT, created REAL NOT NULL, last_access REAL NOT NULL)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS by_sha256 ON artifacts (sha256)")
+
+    @staticmethod
+    def key(source: str, request: Any) -> str:
+        """Canonical hash of a request: key order of dictionaries and list/tuple types do not matter.
+
+        Args:
+            source (str): Name of the source, e.g. "http", "cds" or "gee".
+            request (Any): URL or JSON-serializable request parameters.
+
+        Returns:
+            str: Hex digest identifying the request.
+        """
+        canonical = json.dumps(
+            {"source": source, "request": request},
+            sort_keys=True,
+            separators=(",", ":"),
+            default=str,
+        )
+        return hashlib.sha256(canonical.encode()).hexdigest()
+
+    def get(self, key: str, output_path: str, verify: bool = False) -> Optional[str]:
+        """Place the artifact cached under `key` at `output_path`.
+
+        The size of the cached object is always checked and, with `verify`, its checksum; a
+        corrupted object is dropped from the cache and reported as a miss.
+
+        Args:
+            key (str): Key from `DownloadCache.key`.
+            output_path (str): Where the artifact is needed.
+            verify (bool, optional): Whether to recompute the checksum. Defaults to False.
+
+        Returns:
+            Optional[str]: output_path on a hit, None on a miss.
+        """
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT sha256, size FROM artifacts WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        sha256, size = row
+        object_path = self._object_path(sha256)
+        if not self._is_valid(object_path, sha256, size, verify):
+            logger.warning(f"Dropping corrupted cache entry {key}")
+            self._forget(key)
+            return None
+        self._link(object_path, output_path)
+        with self._lock, self._connect() as connection:
+            connection.execute(
+                "UPDATE artifacts SET last_access = ? WHERE key = ?", (time.time(), key)
+            )
+        return output_path
+
+    def put(
+        self, key: str, path: str, source: Optional[str] = None, request: Any = None
+    ) -> str:
+        """Add a downloaded file to the cache under `key`; `path` is replaced by a link to the cached object.
+
+        Args:
+            key (str): Key from `DownloadCache.key`.
+            path (str): Downloaded file.
+            source (Optional[str], optional): Name of the source, stored in the manifest. Defaults to None.
+            request (Any, optional): Request parameters, stored in the manifest. Defaults to None.
+
+        Returns:
+            str: path.
+        """
+        sha256 = _sha256(path)
+        size = os.path.getsize(path)
+        object_path = self._object_path(sha256)
+        if not os.path.exists(object_path):
+            os.makedirs(os.path.dirname(object_path), exist_ok=True)
+            tmp_path = f"{object_path}.{uuid.uuid4().hex}.tmp"
+            try:
+                os.link(path, tmp_path)
+            except OSError:
+                shutil.copyfile(path, tmp_path)
+            os.replace(tmp_path, object_path)
+        self._link(object_path, path)
+        now = time.time()
+        with self._lock, self._connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO artifacts VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    key,
+                    sha256,
+                    size,
+                    source,
+                    json.dumps(request, sort_keys=True, default=str),
+                    now,
+                    now,
+                ),
+            )
+        self.evict()
+        return path
+
+    def fetch(
+        self,
+        key: str,
+        output_path: str,
+        download: Callable[[str], Any],
+        source: Optional[str] = None,
+        request: Any = None,
+    ) -> str:
+        """Get an artifact from the cache, or download it with `download(output_path)` and cache it.
+
+        Args:
+            key (str): Key from `DownloadCache.key`.
+            output_path (str): Where the artifact is needed.
+            download (Callable[[str], Any]): Function writing the artifact to the given path.
+            source (Optional[str], optional): Name of the source. Defaults to None.
+            request (Any, optional): Request parameters. Defaults to None.
+
+        Returns:
+            str: output_path.
+        """
+        if self.get(key, output_path) is not None:
+            return output_path
+        download(output_path)
+        return self.put(key, output_path, source=source, request=request)
+
+    def entries(self) -> List[Dict[str, Any]]:
+        """Rows of the manifest, most recently used first."""
+        with self._connect() as connection:
+            connection.row_factory = sqlite3.Row
+            rows = connection.execute(
+                "SELECT * FROM artifacts ORDER BY last_access DESC"
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def total_size(self) -> int:
+        """Total size of the distinct cached objects in bytes."""
+        with self._connect() as connection:
+            (total,) = connection.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM "
+                "(SELECT sha256, MAX(size) AS size FROM artifacts GROUP BY sha256)"
+            ).fetchone()
+        return total
+
+    def verify(self) -> List[str]:
+        """Recompute the checksum of every entry, dropping the corrupted ones.
+
+        Returns:
+            List[str]: Keys of the dropped entries.
+        """
+        dropped = []
+        for entry in self.entries():
+            object_path = self._object_path(entry["sha256"])
+            if not self._is_valid(object_path, entry["sha256"], entry["size"], True):
+                self._forget(entry["key"])
+                dropped.append(entry["key"])
+        return dropped
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits in max_bytes."""
+        while self.total_size() > self.max_bytes:
+            with self._connect() as connection:
+                row = connection.execute(
+                    "SELECT key FROM artifacts ORDER BY last_access ASC LIMIT 1"
+                ).fetchone()
+            if row is None:
+                return
+            self._forget(row[0])
+
+    def _forget(self, key: str):
+        """Drop an entry, deleting its object when no other entry references it."""
+        with self._lock, self._connect() as connection:
+            row = connection.execute(
+                "SELECT sha256 FROM artifacts WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return
+            connection.execute("DELETE FROM artifacts WHERE key = ?", (key,))
+            (references,) = connection.execute(
+                "SELECT COUNT(*) FROM artifacts WHERE sha256 = ?", row
+            ).fetchone()
+        if references == 0:
+            object_path = self._object_path(row[0])
+            if os.path.exists(object_path):
+                os.remove(object_path)
+
+    def _object_path(self, sha256: str) -> str:
+        return os.path.join(self.objects_dir, sha256[:2], sha256)
+
+    @contextlib.contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """SQLite connection committing on success and always closed on exit."""
+        connection = sqlite3.connect(self.manifest_path, timeout=60)
+        try:
+            yield connection
+            connection.commit()
+        finally:
+            connection.close()
+
+    @staticmethod
+    def _is_valid(object_path: str, sha256: str, size: int, verify: bool) -> bool:
+        if not os.path.exists(object_path) or os.path.getsize(object_path) != size:
+            return False
+        return not verify or _sha256(object_path) == sha256
+
+    @staticmethod
+    def _link(object_path: str, output_path: str):
+        """Hard-link (or copy, across devices) the object to output_path, replacing any file there."""
+        if os.path.exists(output_path) and os.path.samefile(object_path, output_path):
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+        tmp_path = f"{output_path}.{uuid.uuid4().hex}.tmp"
+        try:
+            os.link(object_path, tmp_path)
+        except OSError:
+            shutil.copyfile(object_path, tmp_path)
+        os.replace(tmp_path, output_path)
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
@@ -1,49 +1,560 @@
+import contextlib
+import hashlib
+import io
+import json
+import logging
+import math
 import os
+import random
 import re
+import shutil
+import struct
+import threading
+import time
 import zipfile
-from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 import aiohttp
 import asyncio
 import requests
-from typing import Union, List
-import zipfile
 import urllib.parse
-from typing import List, Union, Optional, Dict
-
-def download_file(url: str, directory: str, filename: Optional[str] = None):
-    """Download a file in chunks, with timeout and existence check."""
-    import os
-    import requests
-
-    # Si se proporciona el nombre, construye la ruta y verifica si ya existe
-    if filename is not None:
-        filepath = os.path.join(directory, filename)
-        if os.path.exists(filepath):
-            # Puedes usar logging.info en lugar de print si tienes configurado un logger.
-            print(f"File already exists, skipping: {filepath}")
-            return filename
-
-    # Realiza la solicitud con timeout
-    with requests.get(url, stream=True, timeout=60) as r:
-        # Si no se proporcionó un nombre, intenta obtenerlo de los headers
-        if filename is None:
+from typing import List, Union, Optional, Dict, Sequence, Tuple
+
+from requests.adapters import HTTPAdapter
+
+from src.utilities.download_cache_utilities import DownloadCache
+from src.utilities.telemetry_utilities import TransferRecord, get_telemetry
+
+logger = logging.getLogger(__name__)
+
+# Size of the chunks read from the network and written to disk
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+DEFAULT_POOL_SIZE = 16
+# responses worth another attempt: timeouts, throttling and transient server errors
+RETRY_STATUSES = (408, 429, 500, 502, 503, 504)
+
+
+class HTTPSessionPool:
+    """Thread-safe pool of keep-alive HTTP connections for the synchronous downloaders.
+
+    Every thread gets its own `requests.Session` (sessions are not thread-safe), but all sessions
+    mount the same `HTTPAdapter`, so connections (and their TLS handshakes) are reused across the
+    threads of an executor. The adapter does not retry: the downloaders retry failed attempts
+    themselves (see `download_file`), resuming from the bytes on disk and recording every
+    attempt in the telemetry.
+
+    Args:
+        pool_size (int, optional): Maximum number of connections kept per host; should be at least
+                                   the number of threads downloading at once. Defaults to 16.
+    """
+
+    def __init__(self, pool_size: int = DEFAULT_POOL_SIZE):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._set_adapter(pool_size)
+
+    def _set_adapter(self, pool_size: int):
+        self.pool_size = pool_size
+        self.adapter = HTTPAdapter(
+            pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0
+        )
+
+    def resize(self, pool_size: int):
+        """Grow the pool to at least pool_size connections per host."""
+        with self._lock:
+            if pool_size > self.pool_size:
+                self._set_adapter(pool_size)
+
+    def session(self) -> requests.Session:
+        """Session of the calling thread, mounting the shared adapter."""
+        session = getattr(self._local, "session", None)
+        # a thread keeps its session until the pool is resized
+        if session is None or session.get_adapter("https://") is not self.adapter:
+            session = requests.Session()
+            session.mount("http://", self.adapter)
+            session.mount("https://", self.adapter)
+            self._local.session = session
+        return session
+
+
+_session_pool: Optional[HTTPSessionPool] = None
+_session_pool_lock = threading.Lock()
+
+
+def get_http_session(pool_size: Optional[int] = None) -> requests.Session:
+    """Keep-alive session of the calling thread from the package-wide `HTTPSessionPool`.
+
+    Args:
+        pool_size (Optional[int], optional): Number of threads that will download at once, e.g. the
+                                             max_workers of an executor; the pool grows to fit it.
+                                             Defaults to None.
+
+    Returns:
+        requests.Session: Session to use from the calling thread only.
+    """
+    global _session_pool
+    with _session_pool_lock:
+        if _session_pool is None:
+            _session_pool = HTTPSessionPool(max(pool_size or 0, DEFAULT_POOL_SIZE))
+    if pool_size is not None:
+        _session_pool.resize(pool_size)
+    return _session_pool.session()
+
+def download_file(
+    url: str,
+    directory: str,
+    filename: Optional[str] = None,
+    expected_size: Optional[int] = None,
+    expected_sha256: Optional[str] = None,
+    max_attempts: int = 5,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    timeout: int = 60,
+    cache: Optional[DownloadCache] = None,
+    session: Optional[requests.Session] = None,
+    source: str = "http",
+):
+    """Download a file in chunks, resuming interrupted downloads.
+
+    Data is streamed to "<filename>.part"; if a previous attempt left a partial file, only the
+    missing bytes are requested with an HTTP Range request (guarded by If-Range with the ETag or
+    Last-Modified of the first attempt, so a changed file is downloaded again from the start).
+    Once complete, the size (and the SHA-256, if provided) is checked and the file is atomically
+    renamed to its final name; an existing final file is therefore always complete.
+
+    Args:
+        url (str): URL of the file to download.
+        directory (str): Directory where the file will be saved.
+        filename (Optional[str], optional): Target filename. If None, inferred from content-disposition.
+        expected_size (Optional[int], optional): Expected size in bytes. Defaults to None.
+        expected_sha256 (Optional[str], optional): Expected SHA-256 hex digest. Defaults to None.
+        max_attempts (int, optional): Maximum number of attempts; each resumes where the last stopped.
+        chunk_size (int, optional): Size of the chunks written to disk. Defaults to 1 MB.
+        timeout (int, optional): Connect/read timeout in seconds. Defaults to 60.
+        cache (Optional[DownloadCache], optional): Cache of downloads keyed by URL. If the URL is
+                                                   cached, the file is linked from the cache instead
+                                                   of downloaded. Defaults to None.
+        session (Optional[requests.Session], optional): Session to use. Defaults to the keep-alive
+                                                        session of the calling thread (`get_http_session`).
+        source (str, optional): Source under which the transfer is recorded in the telemetry
+                                (`get_telemetry`), e.g. "gee". Defaults to "http".
+
+    Returns:
+        str: The filename.
+    """
+    if session is None:
+        session = get_http_session()
+    # Si no se proporcionó un nombre, intenta obtenerlo de los headers
+    if filename is None:
+        with _request(session, "GET", url, max_attempts, stream=True, timeout=timeout) as r:
             filename = get_filename_from_cd(r.headers.get("content-disposition", ""))
-            if not filename:
-                raise ValueError("filename not provided and cannot infer from content-disposition")
-        # Construir la ruta completa del archivo
-        filepath = os.path.join(directory, filename)
-        # Verificar nuevamente por si el archivo ya se descargó en otra ocasión
-        if os.path.exists(filepath):
-            print(f"File already exists, skipping: {filepath}")
-            return filename
-
-        r.raise_for_status()
-        with open(filepath, "wb") as f:
-            for chunk in r.iter_content(chunk_size=8192):
-                f.write(chunk)
+        if not filename:
+            raise ValueError("filename not provided and cannot infer from content-disposition")
+    filepath = os.path.join(directory, filename)
+    telemetry = get_telemetry()
+    if os.path.exists(filepath):
+        logger.info(f"File already exists, skipping: {filepath}")
+        telemetry.record(TransferRecord(source, filename, attempts=0, status="skipped"))
+        return filename
+
+    with telemetry.transfer(source, filename) as transfer:
+        if cache is not None:
+            key = DownloadCache.key("http", url)
+            if cache.get(key, filepath) is not None:
+                transfer.set_status("cached")
+                return filename
+
+        part = _PartialDownload(filepath)
+        for attempt in range(1, max_attempts + 1):
+            transfer.attempt()
+            try:
+                headers = part.request_headers()
+                with session.get(url, stream=True, timeout=timeout, headers=headers) as r:
+                    transfer.first_byte()
+                    # 416, range not satisfiable: nothing left to download
+                    if r.status_code != 416:
+                        r.raise_for_status()
+                        with part.open(r.status_code, r.headers) as f:
+                            for chunk in r.iter_content(chunk_size=chunk_size):
+                                f.write(chunk)
+                                transfer.add_bytes(len(chunk))
+                part.finalize(expected_size, expected_sha256)
+                if cache is not None:
+                    cache.put(key, filepath, source="http", request=url)
+                return filename
+            except (
+                requests.ConnectionError,
+                requests.Timeout,
+                requests.exceptions.ChunkedEncodingError,
+                requests.HTTPError,
+                IncompleteDownloadError,
+            ) as exc:
+                wait_time = _retry_wait(exc, attempt)
+                if wait_time is None or attempt == max_attempts:
+                    raise
+                logger.warning(
+                    f"Download of {filename} interrupted at {part.size()} bytes ({exc}); "
+                    f"resuming in {wait_time:.2f} s"
+                )
+                time.sleep(wait_time)
     return filename
 
 
+def _request(
+    session: requests.Session, method: str, url: str, max_attempts: int = 5, **kwargs
+) -> requests.Response:
+    """Send an idempotent request (HEAD, ranged or streamed GET), retried as the downloads are
+    (`_retry_wait`), and return the successful response."""
+    for attempt in range(1, max_attempts + 1):
+        try:
+            response = session.request(method, url, **kwargs)
+            response.raise_for_status()
+            return response
+        except (
+            requests.ConnectionError,
+            requests.Timeout,
+            requests.exceptions.ChunkedEncodingError,
+            requests.HTTPError,
+        ) as exc:
+            if isinstance(exc, requests.HTTPError) and exc.response is not None:
+                exc.response.close()
+            wait_time = _retry_wait(exc, attempt)
+            if wait_time is None or attempt == max_attempts:
+                raise
+            logger.warning(f"{method} {url} failed ({exc}); retrying in {wait_time:.2f} s")
+            time.sleep(wait_time)
+    raise ValueError("max_attempts must be at least 1.")
+
+
+def _retry_wait(exc: Exception, attempt: int) -> Optional[float]:
+    """Seconds to wait before another attempt after exc, honouring Retry-After, or None if
+    the error is not worth retrying (e.g. 404)."""
+    wait_time = 0.32 * attempt  # Simple backoff strategy.
+    if isinstance(exc, requests.HTTPError):
+        response = exc.response
+        if response is None or response.status_code not in RETRY_STATUSES:
+            return None
+        retry_after = response.headers.get("Retry-After", "")
+        if retry_after.isdigit():
+            wait_time = max(wait_time, float(retry_after))
+    return wait_time
+
+
+class IncompleteDownloadError(IOError):
+    """Raised when fewer bytes than expected were received."""
+
+
+class _PartialDownload:
+    """State of a download written to "<filepath>.part", with its validators in "<filepath>.part.json"."""
+
+    def __init__(self, filepath: str):
+        self.filepath = filepath
+        self.part_path = filepath + ".part"
+        self.meta_path = filepath + ".part.json"
+        self.meta: Dict[str, Optional[str]] = {}
+        if os.path.exists(self.part_path) and os.path.exists(self.meta_path):
+            try:
+                with open(self.meta_path) as f:
+                    self.meta = json.load(f)
+            except (OSError, ValueError):
+                self.meta = {}
+
+    def size(self) -> int:
+        return os.path.getsize(self.part_path) if os.path.exists(self.part_path) else 0
+
+    def request_headers(self) -> Dict[str, str]:
+        """Range headers resuming from the bytes already present, if they can be validated."""
+        offset = self.size()
+        validator = self.meta.get("etag") or self.meta.get("last_modified")
+        if offset == 0 or not validator:
+            return {}
+        return {"Range": f"bytes={offset}-", "If-Range": validator}
+
+    @contextlib.contextmanager
+    def open(self, status: int, headers):
+        """Open the partial file for appending (206 response) or rewriting (200 response)."""
+        if status == 206:
+            mode = "ab"
+            total = _total_from_content_range(headers.get("Content-Range", ""))
+        else:
+            mode = "wb"
+            length = headers.get("Content-Length")
+            total = int(length) if length is not None else None
+            # only identity-encoded lengths match the bytes written to disk
+            if headers.get("Content-Encoding", "identity") != "identity":
+                total = None
+            self.meta = {
+                "etag": headers.get("ETag"),
+                "last_modified": headers.get("Last-Modified"),
+            }
+        if total is not None:
+            self.meta["total"] = str(total)
+        with open(self.meta_path, "w") as f:
+            json.dump(self.meta, f)
+        with open(self.part_path, mode) as f:
+            yield f
+
+    def finalize(self, expected_size: Optional[int], expected_sha256: Optional[str]):
+        """Check size and checksum, then atomically move the partial file to its final path."""
+        size = self.size()
+        total = self.meta.get("total")
+        expected = expected_size if expected_size is not None else total
+        if expected is not None and size < int(expected):
+            raise IncompleteDownloadError(f"received {size} of {expected} bytes")
+        if expected is not None and size > int(expected):
+            self.discard()
+            raise ValueError(f"received {size} bytes, more than the expected {expected}")
+        if expected_sha256 is not None:
+            digest = hashlib.sha256()
+            with open(self.part_path, "rb") as f:
+                for block in iter(lambda: f.read(1024 * 1024), b""):
+                    digest.update(block)
+            if digest.hexdigest() != expected_sha256.lower():
+                self.discard()
+                raise ValueError(f"checksum mismatch for {self.filepath}")
+        os.replace(self.part_path, self.filepath)
+        if os.path.exists(self.meta_path):
+            os.remove(self.meta_path)
+
+    def discard(self):
+        for path in (self.part_path, self.meta_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def _total_from_content_range(content_range: str) -> Optional[int]:
+    """Total size from a Content-Range header such as "bytes 100-199/1000"."""
+    match = re.match(r"bytes \d+-\d+/(\d+)", content_range)
+    return int(match.group(1)) if match else None
+
+
+@dataclass
+class DownloadResult:
+    """Outcome of a download: bytes transferred by this call, wall time, attempts and error."""
+
+    url: str
+    filename: Optional[str]
+    bytes: int = 0
+    duration: float = 0.0
+    attempts: int = 0
+    segments: int = 1
+    error: Optional[str] = None
+
+    @property
+    def throughput(self) -> float:
+        """Achieved throughput in bytes per second."""
+        return self.bytes / self.duration if self.duration > 0 else 0.0
+
+
+def download_file_segmented(
+    url: str,
+    directory: str,
+    filename: str,
+    n_segments: int = 8,
+    min_segment_size: int = 16 * 1024 * 1024,
+    expected_size: Optional[int] = None,
+    expected_sha256: Optional[str] = None,
+    max_attempts: int = 5,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    timeout: int = 60,
+    session: Optional[requests.Session] = None,
+    cache: Optional[DownloadCache] = None,
+) -> DownloadResult:
+    """Download a large file over several connections at once.
+
+    A HEAD request probes "Accept-Ranges" and the file size; the file is then split into up to
+    `n_segments` byte ranges fetched concurrently over a pooled session, each written at its
+    offset in a preallocated "<filename>.part". The progress of every segment is kept in
+    "<filename>.part.json", so an interrupted download resumes segment by segment. When the
+    server does not support ranges (or the file is smaller than two segments) the file is
+    fetched as a single stream with `download_file`.
+
+    Args:
+        url (str): URL of the file to download.
+        directory (str): Directory where the file will be saved.
+        filename (str): Target filename.
+        n_segments (int, optional): Maximum number of concurrent connections. Defaults to 8.
+        min_segment_size (int, optional): Minimum size of a segment in bytes. Defaults to 16 MB.
+        expected_size (Optional[int], optional): Expected size in bytes. Defaults to None.
+        expected_sha256 (Optional[str], optional): Expected SHA-256 hex digest. Defaults to None.
+        max_attempts (int, optional): Maximum number of attempts per segment. Defaults to 5.
+        chunk_size (int, optional): Size of the chunks written to disk. Defaults to 1 MB.
+        timeout (int, optional): Connect/read timeout in seconds. Defaults to 60.
+        session (Optional[requests.Session], optional): Session shared by all segments. If None,
+                                                        every segment uses the keep-alive session of its
+                                                        thread, from a pool grown to `n_segments`.
+        cache (Optional[DownloadCache], optional): Cache of downloads keyed by URL, as in `download_file`.
+
+    Returns:
+        DownloadResult: Bytes transferred, duration and throughput of the download.
+    """
+    filepath = os.path.join(directory, filename)
+    if os.path.exists(filepath):
+        logger.info(f"File already exists, skipping: {filepath}")
+        return DownloadResult(url, filename)
+    if cache is not None and cache.get(DownloadCache.key("http", url), filepath) is not None:
+        return DownloadResult(url, filename)
+
+    start_time = time.perf_counter()
+    http = session if session is not None else get_http_session(n_segments)
+    head = _request(http, "HEAD", url, max_attempts, allow_redirects=True, timeout=timeout)
+    head_time = time.perf_counter() - start_time
+    size = int(head.headers.get("Content-Length", 0))
+    accepts_ranges = head.headers.get("Accept-Ranges", "").lower() == "bytes"
+    identity = head.headers.get("Content-Encoding", "identity") == "identity"
+    n = min(n_segments, size // max(min_segment_size, 1))
+    if not (accepts_ranges and identity and n > 1):
+        part_size = _PartialDownload(filepath).size()
+        download_file(
+            url,
+            directory,
+            filename,
+            expected_size=expected_size,
+            expected_sha256=expected_sha256,
+            max_attempts=max_attempts,
+            chunk_size=chunk_size,
+            timeout=timeout,
+            cache=cache,
+            session=session,
+        )
+        result = DownloadResult(
+            url,
+            filename,
+            bytes=os.path.getsize(filepath) - part_size,
+            duration=time.perf_counter() - start_time,
+            attempts=1,
+        )
+    else:
+        with get_telemetry().transfer("http", filename) as transfer:
+            transfer.record.ttfb = head_time
+            validator = head.headers.get("ETag") or head.headers.get("Last-Modified")
+            part = _SegmentedDownload(filepath, size, validator, n)
+            result = part.fetch(url, session, max_attempts, chunk_size, timeout)
+            transfer.record.bytes = result.bytes
+            transfer.record.attempts = result.attempts
+            part.finalize(expected_size, expected_sha256)
+            result.duration = time.perf_counter() - start_time
+            if cache is not None:
+                cache.put(DownloadCache.key("http", url), filepath, source="http", request=url)
+    logger.info(
+        f"Downloaded {filename}: {result.bytes / 1e6:.1f} MB in {result.duration:.1f} s "
+        f"({result.throughput / 1e6:.1f} MB/s, {result.segments} segment(s))"
+    )
+    return result
+
+
+class _SegmentedDownload(_PartialDownload):
+    """Partial download split into byte ranges, whose progress is kept in "<filepath>.part.json"."""
+
+    def __init__(self, filepath: str, size: int, validator: Optional[str], n_segments: int):
+        super().__init__(filepath)
+        self.validator = validator
+        self.lock = threading.Lock()
+        resumable = (
+            validator is not None
+            and self.meta.get("validator") == validator
+            and self.meta.get("total") == str(size)
+            and self.size() == size
+            and "segments" in self.meta
+        )
+        if not resumable:
+            bounds = [size * i // n_segments for i in range(n_segments + 1)]
+            self.meta = {
+                "validator": validator,
+                "total": str(size),
+                "segments": [
+                    {"start": bounds[i], "end": bounds[i + 1] - 1, "written": 0}
+                    for i in range(n_segments)
+                ],
+            }
+            with open(self.part_path, "wb") as f:
+                f.truncate(size)
+            self.save()
+
+    def save(self):
+        with self.lock:
+            with open(self.meta_path, "w") as f:
+                json.dump(self.meta, f)
+
+    def fetch(
+        self,
+        url: str,
+        session: Optional[requests.Session],
+        max_attempts: int,
+        chunk_size: int,
+        timeout: int,
+    ) -> DownloadResult:
+        """Fetch the missing part of every segment concurrently."""
+        segments = self.meta["segments"]
+        missing_before = sum(s["end"] - s["start"] + 1 - s["written"] for s in segments)
+        with ThreadPoolExecutor(max_workers=len(segments)) as executor:
+            attempts = list(
+                executor.map(
+                    lambda segment: self._fetch_segment(
+                        url, session, segment, max_attempts, chunk_size, timeout
+                    ),
+                    segments,
+                )
+            )
+        missing_after = sum(s["end"] - s["start"] + 1 - s["written"] for s in segments)
+        return DownloadResult(
+            url,
+            os.path.basename(self.filepath),
+            bytes=missing_before - missing_after,
+            attempts=max(attempts),
+            segments=len(segments),
+        )
+
+    def _fetch_segment(
+        self,
+        url: str,
+        session: Optional[requests.Session],
+        segment: Dict[str, int],
+        max_attempts: int,
+        chunk_size: int,
+        timeout: int,
+    ) -> int:
+        for attempt in range(1, max_attempts + 1):
+            offset = segment["start"] + segment["written"]
+            if offset > segment["end"]:
+                return attempt - 1
+            headers = {"Range": f"bytes={offset}-{segment['end']}"}
+            if self.validator:
+                headers["If-Range"] = self.validator
+            try:
+                http = session if session is not None else get_http_session()
+                with http.get(url, stream=True, timeout=timeout, headers=headers) as r:
+                    r.raise_for_status()
+                    if r.status_code != 206:
+                        raise ValueError(f"{url} changed during download or ignored the range request")
+                    with open(self.part_path, "r+b") as f:
+                        f.seek(offset)
+                        for chunk in r.iter_content(chunk_size=chunk_size):
+                            chunk = chunk[: segment["end"] + 1 - f.tell()]
+                            f.write(chunk)
+                            segment["written"] += len(chunk)
+                if segment["start"] + segment["written"] <= segment["end"]:
+                    raise IncompleteDownloadError(
+                        f"segment {segment['start']}-{segment['end']} interrupted"
+                    )
+                return attempt
+            except (
+                requests.ConnectionError,
+                requests.Timeout,
+                requests.exceptions.ChunkedEncodingError,
+                requests.HTTPError,
+                IncompleteDownloadError,
+            ) as exc:
+                wait_time = _retry_wait(exc, attempt)
+                if wait_time is None or attempt == max_attempts:
+                    raise
+                logger.warning(f"{exc}; resuming in {wait_time:.2f} s")
+                time.sleep(wait_time)
+            finally:
+                self.save()
+        return max_attempts
+
+
+
 def get_filename_from_cd(content_disp):
     """Get filename from content-disposition."""
     if not content_disp:
@@ -59,10 +570,21 @@ def download_and_extract_archive(
     extract_by_name: str = None,
     extract_by_extension: str = None,
     overwrite: bool = False,
+    n_segments: int = 1,
+    cache: Optional[DownloadCache] = None,
+    stream: bool = False,
+    max_workers: int = 4,
+    buffer_size: int = 8 * 1024 * 1024,
 ):
     """
     Descarga un archivo comprimido desde la URL especificada o, si ya existe localmente,
     lo utiliza para extraer los archivos especificados.
+    Con n_segments > 1 el archivo se descarga por rangos en paralelo (`download_file_segmented`).
+    Con `cache`, el archivo comprimido se guarda en la caché de descargas y no se vuelve a descargar.
+    Con `stream`, si el servidor admite peticiones por rangos, el ZIP no se escribe en disco: se lee
+    su directorio central y solo se descargan los miembros seleccionados, que se escriben
+    directamente en su destino. Los miembros se filtran por nombre/extensión sin descomprimir el
+    resto y se extraen en paralelo (`max_workers` hilos, bloques de `buffer_size` bytes).
     """
     os.makedirs(output_dir, exist_ok=True)
 
@@ -76,32 +598,45 @@ def download_and_extract_archive(
         archive_path = os.path.join(output_dir, filename)
         if not overwrite and os.path.exists(archive_path):
             pass  # El archivo ya existe, se asume que es correcto
-        else:
+        elif stream and (
+            cache is None or cache.get(DownloadCache.key("http", url), archive_path) is None
+        ):
+            try:
+                remote = _HTTPRangeFile(url, session=get_http_session(max_workers))
+            except RangeRequestsNotSupported as exc:
+                logger.info(f"{exc}; downloading the whole archive")
+            else:
+                with remote, zipfile.ZipFile(remote) as zip_ref:
+                    members = _select_members(
+                        zip_ref.namelist(), files_to_extract, extract_by_name, extract_by_extension
+                    )
+                    # every extraction thread reads through its own pooled session
+                    _extract_members(
+                        zip_ref,
+                        lambda: _HTTPRangeFile(url, size=remote.size, block_size=buffer_size),
+                        members,
+                        output_dir,
+                        max_workers,
+                        buffer_size,
+                    )
+                return
+        if not os.path.exists(archive_path):
             # Aquí se debe implementar o llamar a la función de descarga
-            download_file(url, output_dir, filename)
+            if n_segments > 1:
+                download_file_segmented(
+                    url, output_dir, filename, n_segments=n_segments, cache=cache
+                )
+            else:
+                download_file(url, output_dir, filename, cache=cache)
 
     # Abrir el archivo ZIP y extraer los archivos que cumplan el criterio
     with zipfile.ZipFile(archive_path, "r") as zip_ref:
-        available_files = zip_ref.namelist()
-
-        if extract_by_name:
-            files_to_extract = [
-                file for file in available_files if os.path.splitext(file)[0] == extract_by_name
-            ]
-        elif extract_by_extension:
-            files_to_extract = [
-                file for file in available_files if file.endswith(extract_by_extension)
-            ]
-
-        # Asegurarse de que files_to_extract sea una lista
-        if isinstance(files_to_extract, str):
-            files_to_extract = [files_to_extract]
-
-        if not files_to_extract:
-            raise ValueError("No se encontraron archivos que coincidan con el criterio de extracción.")
-
-        for file in files_to_extract:
-            zip_ref.extract(file, output_dir)
+        members = _select_members(
+            zip_ref.namelist(), files_to_extract, extract_by_name, extract_by_extension
+        )
+        _extract_members(
+            zip_ref, lambda: open(archive_path, "rb"), members, output_dir, max_workers, buffer_size
+        )
 
     # Eliminar el archivo ZIP después de la extracción
     try:
@@ -109,18 +644,181 @@ def download_and_extract_archive(
     except OSError as e:
         raise RuntimeError(f"Error al eliminar el archivo '{archive_path}': {e}")
 
-def get_filename_from_cd(content_disp):
-    """Get filename from content-disposition."""
-    if not content_disp:
-        return None
-    filename = re.findall("filename=(.+)", content_disp)
-    if len(filename) == 0:
-        return None
-    return filename[0]
+
+class RangeRequestsNotSupported(IOError):
+    """Raised when a server does not support HTTP Range requests."""
+
+
+class _HTTPRangeFile(io.RawIOBase):
+    """Read-only, seekable file over HTTP Range requests, reading ahead `block_size` bytes.
+
+    Lets `zipfile` read the central directory and the selected members of a remote archive
+    without downloading the rest.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        session: Optional[requests.Session] = None,
+        size: Optional[int] = None,
+        block_size: int = 8 * 1024 * 1024,
+        timeout: int = 60,
+        max_attempts: int = 5,
+    ):
+        super().__init__()
+        self.url = url
+        self.session = session if session is not None else get_http_session()
+        self.block_size = block_size
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        if size is None:
+            head = _request(
+                self.session, "HEAD", url, max_attempts, allow_redirects=True, timeout=timeout
+            )
+            if head.headers.get("Accept-Ranges", "").lower() != "bytes" or (
+                "Content-Length" not in head.headers
+            ):
+                raise RangeRequestsNotSupported(f"{url} does not support range requests")
+            size = int(head.headers["Content-Length"])
+        self.size = size
+        self.position = 0
+        self._buffer = b""
+        self._buffer_start = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self.position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            self.position = offset
+        elif whence == io.SEEK_CUR:
+            self.position += offset
+        elif whence == io.SEEK_END:
+            self.position = self.size + offset
+        else:
+            raise ValueError(f"invalid whence {whence}")
+        return self.position
+
+    def readinto(self, b) -> int:
+        if self.position >= self.size:
+            return 0
+        offset = self.position - self._buffer_start
+        if not 0 <= offset < len(self._buffer):
+            end = min(self.position + max(len(b), self.block_size), self.size) - 1
+            response = _request(
+                self.session,
+                "GET",
+                self.url,
+                self.max_attempts,
+                headers={"Range": f"bytes={self.position}-{end}"},
+                timeout=self.timeout,
+            )
+            if response.status_code != 206:
+                raise RangeRequestsNotSupported(f"{self.url} ignored the range request")
+            self._buffer = response.content
+            self._buffer_start = self.position
+            offset = 0
+        n = min(len(b), len(self._buffer) - offset)
+        b[:n] = self._buffer[offset : offset + n]
+        self.position += n
+        return n
+
+
+def _select_members(
+    available_files: List[str],
+    files_to_extract: Union[str, List[str], None],
+    extract_by_name: Optional[str],
+    extract_by_extension: Optional[str],
+) -> List[str]:
+    """Members of an archive matching the extraction criteria of `download_and_extract_archive`."""
+    if extract_by_name:
+        files_to_extract = [
+            file for file in available_files if os.path.splitext(file)[0] == extract_by_name
+        ]
+    elif extract_by_extension:
+        files_to_extract = [
+            file for file in available_files if file.endswith(extract_by_extension)
+        ]
+
+    # Asegurarse de que files_to_extract sea una lista
+    if isinstance(files_to_extract, str):
+        files_to_extract = [files_to_extract]
+
+    if not files_to_extract:
+        raise ValueError("No se encontraron archivos que coincidan con el criterio de extracción.")
+    return files_to_extract
+
+
+def _extract_members(
+    zip_ref: zipfile.ZipFile,
+    open_archive,
+    members: List[str],
+    output_dir: str,
+    max_workers: int,
+    buffer_size: int,
+):
+    """Extract members of an open archive in parallel threads.
+
+    The central directory is only read once, by zip_ref; every member is then read through its
+    own handle from `open_archive()`, starting at its local header, so the threads do not share
+    a file position (or, over HTTP, a read-ahead buffer). Members are written to "<target>.part"
+    with copies of `buffer_size` bytes and renamed once complete. Paths are sanitized as in
+    `zipfile.ZipFile.extract`.
+    """
+
+    def extract(member: str):
+        target = _member_target(output_dir, member)
+        if member.endswith("/"):
+            os.makedirs(target, exist_ok=True)
+            return
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open_archive() as f, _open_member(f, zip_ref.getinfo(member)) as source:
+            with open(target + ".part", "wb") as destination:
+                shutil.copyfileobj(source, destination, length=buffer_size)
+        os.replace(target + ".part", target)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(members)))) as executor:
+        list(executor.map(extract, members))
+
+
+def _open_member(f, info: zipfile.ZipInfo) -> zipfile.ZipExtFile:
+    """Open a member from a raw handle of its archive, skipping its local header as
+    `zipfile.ZipFile.open` does."""
+    f.seek(info.header_offset)
+    header = f.read(zipfile.sizeFileHeader)
+    if len(header) != zipfile.sizeFileHeader:
+        raise zipfile.BadZipFile(f"truncated local header of {info.filename}")
+    fields = struct.unpack(zipfile.structFileHeader, header)
+    if fields[0] != zipfile.stringFileHeader:
+        raise zipfile.BadZipFile(f"bad magic number for the local header of {info.filename}")
+    # skip the file name and extra field
+    f.seek(fields[10] + fields[11], io.SEEK_CUR)
+    return zipfile.ZipExtFile(f, "r", info)
+
+
+def _member_target(output_dir: str, member: str) -> str:
+    """Path of an archive member below output_dir, without drive, absolute or parent components."""
+    arcname = member.replace("/", os.path.sep)
+    if os.path.altsep:
+        arcname = arcname.replace(os.path.altsep, os.path.sep)
+    arcname = os.path.splitdrive(arcname)[1]
+    parts = [p for p in arcname.split(os.path.sep) if p not in ("", os.path.curdir, os.path.pardir)]
+    return os.path.join(output_dir, *parts)
+
+
 async def download_file_async(url: str, directory: str, filename: Optional[str] = None, 
-                                session: Optional[aiohttp.ClientSession] = None, max_attempts: int = 5) -> Optional[str]:
+                                session: Optional[aiohttp.ClientSession] = None, max_attempts: int = 5,
+                                expected_size: Optional[int] = None, expected_sha256: Optional[str] = None,
+                                chunk_size: int = DEFAULT_CHUNK_SIZE) -> Optional[str]:
     """
     Asynchronously download a file in chunks using aiohttp with persistent session support.
+    Interrupted downloads are resumed and completed files atomically renamed, as for `download_file`.
     
     Args:
         url (str): URL of the file to download.
@@ -128,6 +826,9 @@ async def download_file_async(url: str, directory: str, filename: Optional[str]
         filename (Optional[str], optional): The target filename. If None, a HEAD request is used to infer it.
         session (Optional[aiohttp.ClientSession], optional): A persistent aiohttp session.
         max_attempts (int, optional): Maximum number of download attempts. Defaults to 5.
+        expected_size (Optional[int], optional): Expected size in bytes. Defaults to None.
+        expected_sha256 (Optional[str], optional): Expected SHA-256 hex digest. Defaults to None.
+        chunk_size (int, optional): Size of the chunks written to disk. Defaults to 1 MB.
     
     Returns:
         Optional[str]: The filename if the download was successful, or None otherwise.
@@ -135,7 +836,9 @@ async def download_file_async(url: str, directory: str, filename: Optional[str]
     # If no persistent session is provided, create one and use it locally.
     if session is None:
         async with aiohttp.ClientSession() as new_session:
-            return await download_file_async(url, directory, filename, session=new_session, max_attempts=max_attempts)
+            return await download_file_async(url, directory, filename, session=new_session, max_attempts=max_attempts,
+                                             expected_size=expected_size, expected_sha256=expected_sha256,
+                                             chunk_size=chunk_size)
 
     if filename is None:
         async with session.head(url) as head_response:
@@ -144,22 +847,182 @@ async def download_file_async(url: str, directory: str, filename: Optional[str]
             filename = get_filename_from_cd(content_disp)
             if not filename:
                 raise ValueError("filename not provided and cannot infer from content-disposition")
-    filepath = os.path.join(directory, filename)
+    result = await _fetch_async(
+        session,
+        url,
+        os.path.join(directory, filename),
+        max_attempts=max_attempts,
+        expected_size=expected_size,
+        expected_sha256=expected_sha256,
+        chunk_size=chunk_size,
+    )
+    return filename if result.error is None else None
+
+
+async def download_many(
+    tasks: Sequence[Tuple[str, str]],
+    max_concurrency: int = 32,
+    max_per_host: int = 8,
+    max_attempts: int = 5,
+    backoff_base: float = 0.5,
+    backoff_max: float = 30.0,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    timeout: int = 60,
+    session: Optional[aiohttp.ClientSession] = None,
+    source: str = "http",
+    metrics_path: Optional[str] = None,
+) -> List[DownloadResult]:
+    """Download many files concurrently over one connection-pooled session.
+
+    At most `max_concurrency` transfers run at once, and at most `max_per_host` against the same
+    host. Failed transfers are retried with exponential backoff and full jitter, resuming from
+    the bytes already on disk (see `download_file_async`); the concurrency slot is released while
+    waiting. Client errors other than 408 and 429 are not retried. Failures never raise: they are
+    reported in the result of the file.
+
+    Args:
+        tasks (Sequence[Tuple[str, str]]): Pairs of (url, target file path).
+        max_concurrency (int, optional): Maximum number of simultaneous transfers. Defaults to 32.
+        max_per_host (int, optional): Maximum number of simultaneous transfers per host. Defaults to 8.
+        max_attempts (int, optional): Maximum number of attempts per file. Defaults to 5.
+        backoff_base (float, optional): Base of the exponential backoff in seconds. Defaults to 0.5.
+        backoff_max (float, optional): Maximum wait between attempts in seconds. Defaults to 30.
+        chunk_size (int, optional): Size of the chunks written to disk. Defaults to 1 MB.
+        timeout (int, optional): Connect/read timeout in seconds. Defaults to 60.
+        session (Optional[aiohttp.ClientSession], optional): Session to reuse. If None, one is created
+                                                             with a connector sized to the limits.
+        source (str, optional): Source under which the transfers are recorded in the telemetry
+                                (`get_telemetry`), e.g. "gee". Defaults to "http".
+        metrics_path (Optional[str], optional): If given, the telemetry of this call is exported
+                                                there at the end (JSON for ".json", Prometheus
+                                                text otherwise).
+
+    Returns:
+        List[DownloadResult]: One result per task, in the order of the tasks.
+    """
+    if session is None:
+        connector = aiohttp.TCPConnector(limit=max_concurrency, limit_per_host=max_per_host)
+        client_timeout = aiohttp.ClientTimeout(sock_connect=timeout, sock_read=timeout)
+        async with aiohttp.ClientSession(connector=connector, timeout=client_timeout) as new_session:
+            return await download_many(
+                tasks,
+                max_concurrency=max_concurrency,
+                max_per_host=max_per_host,
+                max_attempts=max_attempts,
+                backoff_base=backoff_base,
+                backoff_max=backoff_max,
+                chunk_size=chunk_size,
+                timeout=timeout,
+                session=new_session,
+                source=source,
+                metrics_path=metrics_path,
+            )
+
+    global_slots = asyncio.Semaphore(max_concurrency)
+    host_slots: Dict[str, asyncio.Semaphore] = {}
+    for url, _ in tasks:
+        host = urllib.parse.urlparse(url).netloc
+        host_slots.setdefault(host, asyncio.Semaphore(max_per_host))
+
+    async def fetch(url: str, filepath: str) -> DownloadResult:
+        os.makedirs(os.path.dirname(filepath) or ".", exist_ok=True)
+        return await _fetch_async(
+            session,
+            url,
+            filepath,
+            max_attempts=max_attempts,
+            chunk_size=chunk_size,
+            backoff_base=backoff_base,
+            backoff_max=backoff_max,
+            # host slot first: a task waiting for a busy host must not hold a global slot
+            slots=(host_slots[urllib.parse.urlparse(url).netloc], global_slots),
+            source=source,
+        )
+
+    with get_telemetry().scope() as telemetry:
+        results = await asyncio.gather(*(fetch(url, filepath) for url, filepath in tasks))
+    failed = [r for r in results if r.error is not None]
+    total_bytes = sum(r.bytes for r in results)
+    logger.info(
+        f"Downloaded {len(results) - len(failed)} of {len(results)} files "
+        f"({total_bytes / 1e6:.1f} MB), {len(failed)} failed"
+    )
+    if metrics_path is not None:
+        telemetry.export(metrics_path)
+    return list(results)
+
+
+async def _fetch_async(
+    session: aiohttp.ClientSession,
+    url: str,
+    filepath: str,
+    max_attempts: int = 5,
+    expected_size: Optional[int] = None,
+    expected_sha256: Optional[str] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    backoff_base: float = 0.32,
+    backoff_max: float = 30.0,
+    slots: Sequence[asyncio.Semaphore] = (),
+    source: str = "http",
+) -> DownloadResult:
+    """Resumable download of one file; `slots` are held during each attempt, not while waiting."""
+    filename = os.path.basename(filepath)
+    result = DownloadResult(url, filename)
     if os.path.exists(filepath):
-        return filename
+        get_telemetry().record(TransferRecord(source, filename, attempts=0, status="skipped"))
+        return result
+    ttfb = None
 
+    start_time = time.perf_counter()
+    part = _PartialDownload(filepath)
+    initial_size = part.size()
     for attempt in range(1, max_attempts + 1):
+        result.attempts = attempt
         try:
-            async with session.get(url) as response:
-                response.raise_for_status()
-                with open(filepath, "wb") as f:
-                    while True:
-                        chunk = await response.content.read(8192)
-                        if not chunk:
-                            break
-                        f.write(chunk)
-                return filename
+            async with contextlib.AsyncExitStack() as stack:
+                for slot in slots:
+                    await stack.enter_async_context(slot)
+                async with session.get(url, headers=part.request_headers()) as response:
+                    if ttfb is None:
+                        ttfb = time.perf_counter() - start_time
+                    if response.status != 416:
+                        response.raise_for_status()
+                        with part.open(response.status, response.headers) as f:
+                            if response.status == 200:
+                                initial_size = 0
+                            async for chunk in response.content.iter_chunked(chunk_size):
+                                f.write(chunk)
+            part.finalize(expected_size, expected_sha256)
+            result.error = None
+            break
         except Exception as exc:
-            wait_time = 0.32 * attempt  # Simple backoff strategy.
-            await asyncio.sleep(wait_time)
-    return None
\ No newline at end of file
+            result.error = f"{type(exc).__name__}: {exc}"
+            retriable = not (
+                isinstance(exc, aiohttp.ClientResponseError)
+                and 400 <= exc.status < 500
+                and exc.status not in (408, 429)
+            )
+            logger.warning(
+                f"Download of {filename} failed (attempt {attempt} of {max_attempts}) "
+                f"at {part.size()} bytes: {exc}"
+            )
+            if not retriable or attempt == max_attempts:
+                break
+            # exponential backoff with full jitter
+            await asyncio.sleep(random.uniform(0, min(backoff_max, backoff_base * 2 ** (attempt - 1))))
+    final_size = os.path.getsize(filepath) if os.path.exists(filepath) else part.size()
+    result.bytes = final_size - initial_size
+    result.duration = time.perf_counter() - start_time
+    get_telemetry().record(
+        TransferRecord(
+            source,
+            filename,
+            bytes=result.bytes,
+            ttfb=ttfb,
+            duration=result.duration,
+            attempts=result.attempts,
+            status="ok" if result.error is None else "error",
+            error=result.error,
+        )
+    )
+    return result
@@ -0,0 +1,227 @@
+import contextlib
+import logging
+import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+import rasterio
+import shapely
+from pyproj import CRS, Transformer
+from shapely.strtree import STRtree
+
+logger = logging.getLogger(__name__)
+
+FOOTPRINT_CATALOG_NAME = ".footprints.sqlite"
+
+
+@dataclass
+class Footprint:
+    """Footprint and format of a raster file, as recorded in a `FootprintCatalog`.
+
+    Attributes:
+        path (str): Absolute path of the file.
+        bounds (Tuple[float, float, float, float]): (minx, miny, maxx, maxy) in the CRS of the file.
+        crs (Optional[str]): CRS of the file as WKT, None if it has none.
+        res (Tuple[float, float]): Pixel size.
+        dtype (str): Data type of the first band.
+        count (int): Number of bands.
+        mtime_ns (int): Modification time when the file was read.
+        size (int): Size in bytes when the file was read.
+    """
+
+    path: str
+    bounds: Tuple[float, float, float, float]
+    crs: Optional[str]
+    res: Tuple[float, float]
+    dtype: str
+    count: int
+    mtime_ns: int
+    size: int
+
+
+class FootprintCatalog:
+    """Persistent catalog of the footprints of the rasters of a directory tree.
+
+    The footprints are kept in a SQLite file, so finding the rasters to merge does not reopen
+    every file on every run: `update` only reads the headers of files that are new or whose
+    modification time or size changed, and forgets deleted files. `select` then finds the
+    rasters intersecting a geometry with an STRtree of the footprints.
+
+    Args:
+        catalog_path (str): SQLite file of the catalog, created if missing.
+    """
+
+    def __init__(self, catalog_path: str):
+        self.catalog_path = catalog_path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(catalog_path)), exist_ok=True)
+        with self._connect() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS footprints ("
+                "path TEXT PRIMARY KEY, minx REAL, miny REAL, maxx REAL, maxy REAL, crs TEXT, "
+                "res_x REAL, res_y REAL, dtype TEXT, count INTEGER, mtime_ns INTEGER, size INTEGER)"
+            )
+
+    def update(
+        self, directory: str, extension: str = ".tif", max_workers: int = 8
+    ) -> List[Footprint]:
+        """Bring the catalog up to date with the rasters under a directory.
+
+        Hidden files and directories are skipped, as with a recursive glob. Files that cannot be
+        opened are logged and left out of the catalog, also if an earlier version was in it.
+
+        Args:
+            directory (str): Directory searched recursively.
+            extension (str, optional): Extension of the rasters. Defaults to ".tif".
+            max_workers (int, optional): Threads reading the headers of new files. Defaults to 8.
+
+        Returns:
+            List[Footprint]: Footprints of every raster under the directory, sorted by path.
+        """
+        found = _scan(os.path.abspath(directory), extension)
+        known = {f.path: f for f in self.footprints(directory)}
+        changed = [
+            (path, stat)
+            for path, stat in found.items()
+            if path not in known
+            or (known[path].mtime_ns, known[path].size) != (stat.st_mtime_ns, stat.st_size)
+        ]
+        removed = [path for path in known if path not in found]
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            footprints = list(executor.map(lambda item: _read_footprint(*item), changed))
+        read = [f for f in footprints if f]
+        # a changed file that can no longer be read is forgotten, not kept with its old footprint
+        unreadable = [path for (path, _), f in zip(changed, footprints) if f is None]
+        with self._lock, self._connect() as connection:
+            connection.executemany(
+                "DELETE FROM footprints WHERE path = ?", [(p,) for p in removed + unreadable]
+            )
+            connection.executemany(
+                "INSERT OR REPLACE INTO footprints VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [_to_row(f) for f in read],
+            )
+        if changed or removed:
+            logger.info(
+                f"Footprint catalog of {directory}: {len(read)} files read, {len(removed)} removed"
+            )
+        for path in unreadable:
+            known.pop(path, None)
+        for footprint in read:
+            known[footprint.path] = footprint
+        return [known[path] for path in sorted(found) if path in known]
+
+    def footprints(self, directory: Optional[str] = None) -> List[Footprint]:
+        """Footprints in the catalog, only those under directory if given, sorted by path."""
+        with self._connect() as connection:
+            if directory is None:
+                rows = connection.execute("SELECT * FROM footprints ORDER BY path").fetchall()
+            else:
+                prefix = os.path.join(os.path.abspath(directory), "")
+                rows = connection.execute(
+                    "SELECT * FROM footprints WHERE substr(path, 1, ?) = ? ORDER BY path",
+                    (len(prefix), prefix),
+                ).fetchall()
+        return [_from_row(row) for row in rows]
+
+    def select(
+        self,
+        geometry: Any,
+        crs: Any,
+        footprints: Optional[Sequence[Footprint]] = None,
+    ) -> List[str]:
+        """Paths of the rasters whose footprint intersects a geometry.
+
+        The footprints are reprojected to the CRS of the geometry once per source CRS, and
+        matched against the prepared geometry through an STRtree.
+
+        Args:
+            geometry (BaseGeometry): Geometry to intersect, e.g. the union of a GeoDataFrame.
+            crs (Any): CRS of the geometry, in any form accepted by pyproj.
+            footprints (Optional[Sequence[Footprint]], optional): Candidates. Defaults to the
+                                                                  whole catalog.
+
+        Returns:
+            List[str]: Paths of the intersecting rasters, in the order of footprints.
+        """
+        if footprints is None:
+            footprints = self.footprints()
+        target = CRS.from_user_input(crs)
+        by_crs: Dict[Optional[str], List[int]] = {}
+        for index, footprint in enumerate(footprints):
+            by_crs.setdefault(footprint.crs, []).append(index)
+
+        boxes = np.empty(len(footprints), dtype=object)
+        for source_crs, indices in by_crs.items():
+            if source_crs is None:
+                for index in indices:
+                    logger.warning(f"{footprints[index].path} has no CRS. Skipping it.")
+                continue
+            bounds = np.array([footprints[index].bounds for index in indices])
+            geometries = shapely.box(*bounds.T)
+            source = CRS.from_wkt(source_crs)
+            if source != target:
+                transformer = Transformer.from_crs(source, target, always_xy=True)
+                geometries = shapely.transform(
+                    geometries, lambda xy: np.column_stack(transformer.transform(xy[:, 0], xy[:, 1]))
+                )
+            boxes[indices] = geometries
+        valid = np.flatnonzero([box is not None for box in boxes])
+        if len(valid) == 0:
+            return []
+        shapely.prepare(geometry)
+        hits = STRtree(list(boxes[valid])).query(geometry, predicate="intersects")
+        return [footprints[index].path for index in sorted(valid[hits])]
+
+    @contextlib.contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """SQLite connection committing on success and always closed on exit."""
+        connection = sqlite3.connect(self.catalog_path, timeout=60)
+        try:
+            yield connection
+            connection.commit()
+        finally:
+            connection.close()
+
+
+def _scan(directory: str, extension: str) -> Dict[str, os.stat_result]:
+    """Stat of every non-hidden file with the extension under directory."""
+    found = {}
+    for root, dirs, files in os.walk(directory):
+        dirs[:] = [d for d in dirs if not d.startswith(".")]
+        for name in files:
+            if name.endswith(extension) and not name.startswith("."):
+                path = os.path.join(root, name)
+                found[path] = os.stat(path)
+    return found
+
+
+def _read_footprint(path: str, stat: os.stat_result) -> Optional[Footprint]:
+    try:
+        with rasterio.open(path) as src:
+            return Footprint(
+                path,
+                tuple(src.bounds),
+                src.crs.to_wkt() if src.crs else None,
+                src.res,
+                src.dtypes[0],
+                src.count,
+                stat.st_mtime_ns,
+                stat.st_size,
+            )
+    except Exception as exc:
+        logger.error(f"Error reading the footprint of {path}: {exc}")
+        return None
+
+
+def _to_row(f: Footprint) -> tuple:
+    return (f.path, *f.bounds, f.crs, *f.res, f.dtype, f.count, f.mtime_ns, f.size)
+
+
+def _from_row(row: tuple) -> Footprint:
+    path, minx, miny, maxx, maxy, crs, res_x, res_y, dtype, count, mtime_ns, size = row
+    return Footprint(path, (minx, miny, maxx, maxy), crs, (res_x, res_y), dtype, count, mtime_ns, size)
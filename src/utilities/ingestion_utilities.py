@@ -0,0 +1,304 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, List, Optional, Sequence, Tuple
+
+import dask.array
+import numpy as np
+import xarray as xr
+import zarr  # type: ignore
+
+from src.utilities.xarray_utilities import zarr_v2_compressor
+
+logger = logging.getLogger(__name__)
+
+CHUNK_LAYOUTS = ("timeseries", "map")
+
+# default time dimensions of CDS NetCDF files, by order of preference
+_TIME_DIMS = ("valid_time", "time")
+
+
+@dataclass
+class _SourceFile:
+    """Time steps and variables of one NetCDF file to ingest."""
+
+    path: str
+    times: np.ndarray
+    variables: FrozenSet[str]
+    start: int = 0
+
+    @property
+    def stop(self) -> int:
+        return self.start + len(self.times)
+
+
+def ingest_netcdf_to_zarr(
+    files: Sequence[str],
+    store: str,
+    time_dim: Optional[str] = None,
+    layout: str = "map",
+    chunks: Optional[Dict[str, int]] = None,
+    dtype: str = "float32",
+    compressor: Optional[str] = "blosc-zstd",
+    clevel: int = 5,
+    target_chunk_bytes: int = 16 * 1024 * 1024,
+    max_workers: int = 4,
+) -> xr.Dataset:
+    """Stream NetCDF files (e.g. those extracted by `download_cds_dataset`) into one consolidated
+    Zarr store that can be appended along time.
+
+    The files are first scanned for their time steps and variables only. The store is then
+    created, or extended along time if it already exists, with metadata only; each file (or group
+    of consecutive files sharing a Zarr chunk along time) is finally read by a worker of a thread
+    pool and written straight into its region of the store, so no file is ever concatenated in
+    memory and concurrent writes never touch the same chunk. Files whose time steps are all
+    already in the store are skipped, so new years are appended without rewriting the store.
+
+    Args:
+        files (Sequence[str]): NetCDF files; each holds one or more variables on the same spatial grid.
+        store (str): Path of the Zarr store.
+        time_dim (Optional[str], optional): Time dimension. Defaults to "valid_time" or "time".
+        layout (str, optional): "map" for one time step per chunk (fast maps of a date) or
+                                "timeseries" for long time chunks over small tiles (fast series
+                                of a location). Ignored when the store exists. Defaults to "map".
+        chunks (Optional[Dict[str, int]], optional): Chunk size by dimension, overriding the layout.
+                                                     Defaults to None.
+        dtype (str, optional): Floating-point data type of the stored variables. Defaults to "float32".
+        compressor (Optional[str], optional): One of "blosc-zstd", "blosc-lz4", "zstd" or None.
+                                              Defaults to "blosc-zstd".
+        clevel (int, optional): Compression level. Defaults to 5.
+        target_chunk_bytes (int, optional): Approximate size of a chunk. Defaults to 16 MiB.
+        max_workers (int, optional): Number of files written concurrently. Defaults to 4.
+
+    Returns:
+        xr.Dataset: The store, opened lazily.
+    """
+    if layout not in CHUNK_LAYOUTS:
+        raise ValueError(f"layout {layout} not in {CHUNK_LAYOUTS}.")
+    if not np.issubdtype(np.dtype(dtype), np.floating):
+        raise ValueError(f"floating-point dtype expected, got {dtype}.")
+    if not files:
+        raise ValueError("no files to ingest.")
+
+    with xr.open_dataset(files[0]) as reference:
+        if time_dim is None:
+            time_dim = next((d for d in _TIME_DIMS if d in reference.dims), None)
+            if time_dim is None:
+                raise ValueError(f"no time dimension among {_TIME_DIMS}; set time_dim.")
+        reference = _template(reference, time_dim)
+    sources = []
+    templates: Dict[str, xr.DataArray] = {}
+    for path in files:
+        source, template = _scan(path, time_dim, reference)
+        for name in source.variables:
+            if name in templates and templates[name].dims != template[name].dims:
+                raise ValueError(f"variable {name} of {path} has dims {template[name].dims}.")
+            templates.setdefault(name, template[name])
+        sources.append(source)
+
+    existing_times = np.array([], dtype="datetime64[ns]")
+    existing_chunks: Dict[str, Tuple[int, ...]] = {}
+    if os.path.exists(store):
+        with xr.open_zarr(store) as ds_store:
+            existing_times = ds_store[time_dim].values
+            existing_variables = set(ds_store.data_vars)
+        group = zarr.open_consolidated(store, mode="r")
+        existing_chunks = {name: group[name].chunks for name in existing_variables}
+        sources = _new_sources(sources, existing_times)
+        unknown = set().union(*[s.variables for s in sources]) - existing_variables
+        if unknown:
+            raise ValueError(f"variables {sorted(unknown)} are not in the store {store}.")
+    if not sources:
+        logger.info(f"Nothing to ingest into {store}")
+        return xr.open_zarr(store)
+
+    new_times = np.unique(np.concatenate([s.times for s in sources]))
+    for source in sources:
+        positions = np.searchsorted(new_times, source.times)
+        if np.any(np.diff(positions) != 1):
+            raise ValueError(f"time steps of {source.path} are not contiguous.")
+        source.start = len(existing_times) + int(positions[0])
+
+    variables = sorted(set().union(*[s.variables for s in sources]))
+    if existing_chunks:
+        var_chunks = {name: existing_chunks[name] for name in variables}
+    else:
+        var_chunks = {
+            name: _layout_chunks(
+                templates[name], time_dim, len(new_times), layout, chunks,
+                np.dtype(dtype).itemsize, target_chunk_bytes,
+            )
+            for name in variables
+        }
+
+    new_template = xr.Dataset(
+        {
+            name: (
+                templates[name].dims,
+                dask.array.empty(
+                    (len(new_times),) + templates[name].shape[1:],
+                    dtype=dtype,
+                    chunks=var_chunks[name],
+                ),
+                templates[name].attrs,
+            )
+            for name in variables
+        },
+        coords={time_dim: new_times},
+    )
+    if existing_chunks:
+        # only the metadata and the time coordinate are written; arrays are resized lazily
+        new_template.to_zarr(store, append_dim=time_dim, compute=False, consolidated=True)
+    else:
+        new_template = new_template.assign_coords(
+            {
+                dim: da[dim]
+                for da in templates.values()
+                for dim in da.dims
+                if dim != time_dim and dim in da.coords
+            }
+        )
+        encoding = {
+            name: {
+                "chunks": var_chunks[name],
+                "dtype": dtype,
+                "compressor": zarr_v2_compressor(compressor, clevel),
+                "_FillValue": np.nan,
+            }
+            for name in variables
+        }
+        new_template.to_zarr(
+            store, mode="w-", compute=False, consolidated=True, encoding=encoding
+        )
+
+    regions = _regions(sources, {name: var_chunks[name][0] for name in variables})
+    logger.info(
+        f"Ingesting {len(sources)} files into {store} as {len(regions)} regions "
+        f"({len(new_times)} new time steps)"
+    )
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(_write_region, group, time_dim, store) for group in regions
+        ]
+        for future in futures:
+            future.result()
+    return xr.open_zarr(store)
+
+
+def _template(ds: xr.Dataset, time_dim: str) -> xr.Dataset:
+    """Variables along time_dim, with time first and without non-index coordinates."""
+    names = [name for name in ds.data_vars if time_dim in ds[name].dims]
+    if not names:
+        raise ValueError(f"no variable along {time_dim}.")
+    template = ds[names].reset_coords(drop=True)
+    for name in names:
+        dims = template[name].dims
+        template[name] = template[name].transpose(
+            time_dim, *[d for d in dims if d != time_dim]
+        )
+    return template
+
+
+def _scan(
+    path: str, time_dim: str, reference: xr.Dataset
+) -> Tuple[_SourceFile, xr.Dataset]:
+    """Read the time steps and variables of a file, checking its grid against the reference."""
+    with xr.open_dataset(path) as ds:
+        if time_dim not in ds.dims:
+            raise ValueError(f"{path} has no dimension {time_dim}.")
+        template = _template(ds, time_dim)
+        for dim in template.dims:
+            if dim == time_dim or dim not in reference.coords or dim not in template.coords:
+                continue
+            if template.sizes[dim] != reference.sizes[dim] or not np.allclose(
+                template[dim].values, reference[dim].values
+            ):
+                raise ValueError(f"{path} is not on the grid of the other files along {dim}.")
+        times = ds[time_dim].values
+    if np.any(times[1:] <= times[:-1]):
+        raise ValueError(f"time steps of {path} are not increasing.")
+    return _SourceFile(path, times, frozenset(template.data_vars)), template
+
+
+def _new_sources(sources: List[_SourceFile], existing_times: np.ndarray) -> List[_SourceFile]:
+    """Drop files already in the store; the others must come after its last time step."""
+    new_sources = []
+    for source in sources:
+        stored = np.isin(source.times, existing_times)
+        if stored.all():
+            logger.info(f"Skipping {source.path}, already in the store")
+            continue
+        if stored.any() or source.times[0] <= existing_times[-1]:
+            raise ValueError(
+                f"{source.path} overlaps the time steps of the store; only later steps can be appended."
+            )
+        new_sources.append(source)
+    return new_sources
+
+
+def _layout_chunks(
+    da: xr.DataArray,
+    time_dim: str,
+    n_times: int,
+    layout: str,
+    chunks: Optional[Dict[str, int]],
+    itemsize: int,
+    target_bytes: int,
+) -> Tuple[int, ...]:
+    """Chunk shape of a variable with time first: one step over large square tiles for "map",
+    all steps of the first ingestion over small square tiles for "timeseries"."""
+    spatial = da.shape[1:]
+    time_chunk = 1 if layout == "map" else n_times
+    side = int((target_bytes // (itemsize * time_chunk)) ** (1 / max(len(spatial), 1)))
+    shape = [time_chunk] + [max(1, min(side, size)) for size in spatial]
+    for i, dim in enumerate(da.dims):
+        if chunks and dim in chunks:
+            shape[i] = chunks[dim]
+    return tuple(shape)
+
+
+def _regions(
+    sources: List[_SourceFile], time_chunks: Dict[str, int]
+) -> List[List[_SourceFile]]:
+    """Group consecutive files holding the same variables so that no two groups share a Zarr
+    chunk: a group only ends where a file ends on a chunk boundary along time."""
+    regions = []
+    by_variables: Dict[FrozenSet[str], List[_SourceFile]] = {}
+    for source in sources:
+        by_variables.setdefault(source.variables, []).append(source)
+    for names, group in by_variables.items():
+        group = sorted(group, key=lambda s: s.start)
+        for previous, source in zip(group, group[1:]):
+            if previous.stop != source.start:
+                raise ValueError(
+                    f"time steps of {source.path} overlap or leave a gap after {previous.path}."
+                )
+        current: List[_SourceFile] = []
+        for source in group:
+            current.append(source)
+            if all(source.stop % time_chunks[name] == 0 for name in names):
+                regions.append(current)
+                current = []
+        if current:
+            regions.append(current)
+    return regions
+
+
+def _write_region(sources: List[_SourceFile], time_dim: str, store: str):
+    """Read a group of consecutive files and write them into their region of the store."""
+    names = sorted(sources[0].variables)
+    datasets = [xr.open_dataset(source.path) for source in sources]
+    try:
+        ds = xr.concat([_template(d, time_dim)[names] for d in datasets], dim=time_dim)
+        ds = ds.drop_vars([d for d in ds.dims if d in ds.coords])
+        for name in names:
+            ds[name].encoding = {}
+        ds.to_zarr(
+            store,
+            region={time_dim: slice(sources[0].start, sources[-1].stop)},
+            consolidated=False,
+        )
+    finally:
+        for d in datasets:
+            d.close()
@@ -0,0 +1,220 @@
+import logging
+import math
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Any, List, Optional, Sequence, Tuple
+
+import numpy as np
+import rasterio
+from rasterio.enums import Resampling
+from rasterio.transform import Affine
+from rasterio.windows import Window, from_bounds
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BLOCK_SIZE = 512
+MAX_OPEN_FILES_PER_WORKER = 16
+
+
+@dataclass
+class _Source:
+    """Footprint and format of one input raster."""
+
+    path: str
+    bounds: Tuple[float, float, float, float]
+    res: Tuple[float, float]
+    crs: Any
+    count: int
+    dtype: str
+    nodata: Optional[float]
+
+
+def mosaic_rasters(
+    paths: Sequence[str],
+    output_path: str,
+    nodata: Optional[float] = None,
+    res: Optional[Tuple[float, float]] = None,
+    block_size: int = DEFAULT_BLOCK_SIZE,
+    compress: str = "deflate",
+    max_workers: int = 4,
+    max_open_files: int = MAX_OPEN_FILES_PER_WORKER,
+) -> str:
+    """Mosaic rasters into one tiled, compressed GeoTIFF, written one block at a time.
+
+    The output grid covers the union of the input footprints, anchored at their top-left corner.
+    Each output block reads only the windows of the inputs that intersect it, so memory stays
+    bounded by the block size (times max_workers) whatever the size of the mosaic. Where inputs
+    overlap, the first one in paths wins, as with `rasterio.merge.merge`.
+
+    Args:
+        paths (Sequence[str]): Input rasters, with the same CRS, number of bands and data type.
+        output_path (str): Path of the mosaic.
+        nodata (Optional[float], optional): Nodata value of the mosaic. Defaults to the nodata
+                                            of the first input.
+        res (Optional[Tuple[float, float]], optional): Output resolution. Defaults to the
+                                                       resolution of the first input.
+        block_size (int, optional): Side of the output blocks in pixels, a multiple of 16.
+                                    Defaults to DEFAULT_BLOCK_SIZE.
+        compress (str, optional): GeoTIFF compression. Defaults to "deflate".
+        max_workers (int, optional): Threads reading and compositing blocks. Defaults to 4.
+        max_open_files (int, optional): Inputs kept open by each thread; the least recently used
+                                        is closed beyond it. Defaults to MAX_OPEN_FILES_PER_WORKER.
+
+    Returns:
+        str: output_path.
+    """
+    if not paths:
+        raise ValueError("no rasters to mosaic.")
+    sources = [_describe(path) for path in paths]
+    first = sources[0]
+    for source in sources[1:]:
+        if source.crs != first.crs or source.count != first.count or source.dtype != first.dtype:
+            raise ValueError(
+                f"{source.path} does not match the CRS, band count and data type of {first.path}."
+            )
+    if nodata is None:
+        nodata = first.nodata
+    res_x, res_y = res or first.res
+    footprints = np.array([source.bounds for source in sources])
+    left, top = footprints[:, 0].min(), footprints[:, 3].max()
+    width = max(1, int(round((footprints[:, 2].max() - left) / res_x)))
+    height = max(1, int(round((top - footprints[:, 1].min()) / res_y)))
+    transform = Affine(res_x, 0, left, 0, -res_y, top)
+
+    profile = {
+        "driver": "GTiff",
+        "width": width,
+        "height": height,
+        "count": first.count,
+        "dtype": first.dtype,
+        "crs": first.crs,
+        "transform": transform,
+        "nodata": nodata,
+        "tiled": True,
+        "blockxsize": block_size,
+        "blockysize": block_size,
+        "compress": compress,
+        "BIGTIFF": "IF_SAFER",
+    }
+    windows = [
+        Window(col, row, min(block_size, width - col), min(block_size, height - row))
+        for row in range(0, height, block_size)
+        for col in range(0, width, block_size)
+    ]
+    # datasets are not thread-safe: every worker opens its own handles, and keeps at most
+    # max_open_files of them so a mosaic of many inputs does not run out of file descriptors
+    local = threading.local()
+    caches: List["OrderedDict[str, Any]"] = []
+    write_lock = threading.Lock()
+
+    def open_source(path: str):
+        datasets = getattr(local, "datasets", None)
+        if datasets is None:
+            datasets = local.datasets = OrderedDict()
+            with write_lock:
+                caches.append(datasets)
+        if path in datasets:
+            datasets.move_to_end(path)
+        else:
+            if len(datasets) >= max_open_files:
+                datasets.popitem(last=False)[1].close()
+            datasets[path] = rasterio.open(path)
+        return datasets[path]
+
+    def compose(dst, window: Window):
+        block_left, block_top = transform * (window.col_off, window.row_off)
+        block_right, block_bottom = transform * (
+            window.col_off + window.width,
+            window.row_off + window.height,
+        )
+        hits = np.flatnonzero(
+            (footprints[:, 0] < block_right)
+            & (footprints[:, 2] > block_left)
+            & (footprints[:, 1] < block_top)
+            & (footprints[:, 3] > block_bottom)
+        )
+        fill = nodata if nodata is not None else 0
+        block = np.full((first.count, window.height, window.width), fill, dtype=first.dtype)
+        filled = np.zeros(block.shape, dtype=bool)
+        for index in hits:
+            source = sources[index]
+            src = open_source(source.path)
+            bounds = (
+                max(block_left, source.bounds[0]),
+                max(block_bottom, source.bounds[1]),
+                min(block_right, source.bounds[2]),
+                min(block_top, source.bounds[3]),
+            )
+            dst_window = _pixel_window(bounds, transform, window)
+            if dst_window is None:
+                continue
+            src_window = from_bounds(*bounds, transform=src.transform)
+            data = src.read(
+                window=src_window,
+                out_shape=(first.count, dst_window.height, dst_window.width),
+                masked=True,
+                resampling=Resampling.nearest,
+            )
+            rows = slice(dst_window.row_off, dst_window.row_off + dst_window.height)
+            cols = slice(dst_window.col_off, dst_window.col_off + dst_window.width)
+            new = ~filled[:, rows, cols] & ~np.ma.getmaskarray(data)
+            block[:, rows, cols][new] = data.data[new]
+            filled[:, rows, cols] |= new
+            if filled.all():
+                break
+        with write_lock:
+            dst.write(block, window=window)
+
+    tmp_path = f"{output_path}.part"
+    try:
+        with rasterio.open(tmp_path, "w", **profile) as dst:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                pending = set()
+                for window in windows:
+                    # a bounded number of blocks in flight keeps memory bounded
+                    if len(pending) >= 2 * max_workers:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            future.result()
+                    pending.add(executor.submit(compose, dst, window))
+                for future in pending:
+                    future.result()
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    finally:
+        for datasets in caches:
+            for dataset in datasets.values():
+                dataset.close()
+    os.replace(tmp_path, output_path)
+    logger.info(f"Mosaic of {len(sources)} rasters saved at: {output_path}")
+    return output_path
+
+
+def _describe(path: str) -> _Source:
+    with rasterio.open(path) as src:
+        return _Source(
+            path, tuple(src.bounds), src.res, src.crs, src.count, src.dtypes[0], src.nodata
+        )
+
+
+def _pixel_window(
+    bounds: Tuple[float, float, float, float], transform: Affine, block: Window
+) -> Optional[Window]:
+    """Window of bounds in the output grid, relative to block, rounded to whole pixels."""
+    left, bottom, right, top = bounds
+    inverse = ~transform
+    col_start, row_start = inverse * (left, top)
+    col_stop, row_stop = inverse * (right, bottom)
+    col_start = max(int(math.floor(col_start + 0.5)), block.col_off) - block.col_off
+    row_start = max(int(math.floor(row_start + 0.5)), block.row_off) - block.row_off
+    col_stop = min(int(math.floor(col_stop + 0.5)), block.col_off + block.width) - block.col_off
+    row_stop = min(int(math.floor(row_stop + 0.5)), block.row_off + block.height) - block.row_off
+    if col_stop <= col_start or row_stop <= row_start:
+        return None
+    return Window(col_start, row_start, col_stop - col_start, row_stop - row_start)
+
@@ -0,0 +1,386 @@
+import hashlib
+import os
+import threading
+from dataclasses import dataclass
+from typing import Dict, Hashable, List, Optional, Tuple
+
+import dask.array
+import numpy as np
+import xarray as xr
+from affine import Affine  # type: ignore
+from scipy import sparse  # type: ignore
+
+from src.utilities.xarray_utilities import affine_has_rotation, affine_to_coords
+
+REGRID_METHODS = ("nearest", "bilinear", "conservative")
+
+_weights_cache: Dict[str, "RegridWeights"] = {}
+_weights_cache_lock = threading.Lock()
+
+
+@dataclass
+class RegridWeights:
+    """Sparse remapping weights from a source grid to a target grid.
+
+    Both grids are rectilinear, so the full (target pixels x source pixels) operator is the
+    Kronecker product of a y operator and an x operator; only the two factors are stored.
+    """
+
+    method: str
+    weights_y: sparse.csr_matrix  # shape (target height, source height)
+    weights_x: sparse.csr_matrix  # shape (target width, source width)
+    src_transform: Affine
+    src_shape: Tuple[int, int]
+    dst_transform: Affine
+    dst_shape: Tuple[int, int]
+
+
+def compute_regrid_weights(
+    src_transform: Affine,
+    src_shape: Tuple[int, int],
+    dst_transform: Affine,
+    dst_shape: Tuple[int, int],
+    method: str = "bilinear",
+    geographic: bool = True,
+) -> RegridWeights:
+    """Compute sparse weights remapping a source grid onto a target grid.
+
+    Args:
+        src_transform (Affine): Affine transform of the source grid.
+        src_shape (Tuple[int, int]): Source (height, width).
+        dst_transform (Affine): Affine transform of the target grid.
+        dst_shape (Tuple[int, int]): Target (height, width).
+        method (str, optional): "nearest", "bilinear" or "conservative". Defaults to "bilinear".
+        geographic (bool, optional): If True, conservative weights are area-weighted on the sphere
+                                     (latitude bands weighted by difference in sine of latitude).
+                                     Defaults to True.
+
+    Returns:
+        RegridWeights: Weights; each row is normalized to sum to 1 where the target cell is covered.
+    """
+    if method not in REGRID_METHODS:
+        raise ValueError(f"method should be one of {REGRID_METHODS}.")
+    if affine_has_rotation(src_transform) or affine_has_rotation(dst_transform):
+        raise ValueError("regridding requires transforms without rotation.")
+    weights_y = _axis_weights(
+        src_transform.f,
+        src_transform.e,
+        src_shape[0],
+        dst_transform.f,
+        dst_transform.e,
+        dst_shape[0],
+        method,
+        geographic,
+    )
+    weights_x = _axis_weights(
+        src_transform.c,
+        src_transform.a,
+        src_shape[1],
+        dst_transform.c,
+        dst_transform.a,
+        dst_shape[1],
+        method,
+        False,
+    )
+    return RegridWeights(
+        method=method,
+        weights_y=weights_y,
+        weights_x=weights_x,
+        src_transform=src_transform,
+        src_shape=tuple(src_shape),  # type: ignore
+        dst_transform=dst_transform,
+        dst_shape=tuple(dst_shape),  # type: ignore
+    )
+
+
+def get_regrid_weights(
+    src_transform: Affine,
+    src_shape: Tuple[int, int],
+    dst_transform: Affine,
+    dst_shape: Tuple[int, int],
+    method: str = "bilinear",
+    geographic: bool = True,
+    cache_dir: Optional[str] = None,
+) -> RegridWeights:
+    """As `compute_regrid_weights`, but weights are computed once per source/target pair:
+    they are kept in memory for the process and, if cache_dir is provided, saved to disk.
+    """
+    key = _weights_key(
+        src_transform, src_shape, dst_transform, dst_shape, method, geographic
+    )
+    with _weights_cache_lock:
+        if key in _weights_cache:
+            return _weights_cache[key]
+    weights = None
+    path = os.path.join(cache_dir, f"regrid_{method}_{key}.npz") if cache_dir else None
+    if path is not None and os.path.exists(path):
+        weights = load_regrid_weights(path)
+    if weights is None:
+        weights = compute_regrid_weights(
+            src_transform, src_shape, dst_transform, dst_shape, method, geographic
+        )
+        if path is not None:
+            os.makedirs(cache_dir, exist_ok=True)  # type: ignore
+            save_regrid_weights(weights, path)
+    with _weights_cache_lock:
+        _weights_cache[key] = weights
+    return weights
+
+
+def save_regrid_weights(weights: RegridWeights, path: str):
+    """Save weights to a compressed .npz file. The file is written atomically."""
+    arrays = {
+        "method": np.array(weights.method),
+        "src_transform": np.array(list(weights.src_transform)[:6]),
+        "src_shape": np.array(weights.src_shape),
+        "dst_transform": np.array(list(weights.dst_transform)[:6]),
+        "dst_shape": np.array(weights.dst_shape),
+    }
+    for name, matrix in (("y", weights.weights_y), ("x", weights.weights_x)):
+        arrays[f"{name}_data"] = matrix.data
+        arrays[f"{name}_indices"] = matrix.indices
+        arrays[f"{name}_indptr"] = matrix.indptr
+        arrays[f"{name}_shape"] = np.array(matrix.shape)
+    tmp_path = path + ".tmp.npz"
+    np.savez_compressed(tmp_path, **arrays)
+    os.replace(tmp_path, path)
+
+
+def load_regrid_weights(path: str) -> RegridWeights:
+    with np.load(path) as f:
+        matrices = {
+            name: sparse.csr_matrix(
+                (f[f"{name}_data"], f[f"{name}_indices"], f[f"{name}_indptr"]),
+                shape=tuple(f[f"{name}_shape"]),
+            )
+            for name in ("y", "x")
+        }
+        return RegridWeights(
+            method=str(f["method"]),
+            weights_y=matrices["y"],
+            weights_x=matrices["x"],
+            src_transform=Affine(*f["src_transform"]),
+            src_shape=tuple(int(v) for v in f["src_shape"]),  # type: ignore
+            dst_transform=Affine(*f["dst_transform"]),
+            dst_shape=tuple(int(v) for v in f["dst_shape"]),  # type: ignore
+        )
+
+
+def regrid(
+    da: xr.DataArray,
+    like: Optional[xr.DataArray] = None,
+    transform: Optional[Affine] = None,
+    shape: Optional[Tuple[int, int]] = None,
+    method: str = "bilinear",
+    cache_dir: Optional[str] = None,
+) -> xr.DataArray:
+    """Regrid a data array onto the grid of `like`, or onto the grid given by transform and shape.
+
+    The spatial dimensions, (y, x), (latitude, longitude) or (lat, lon), are moved last and any
+    other dimensions (e.g. index or time) are kept. Weights are obtained from
+    `get_regrid_weights`, so regridding many arrays on the same grids computes them once. The
+    result is lazy: each chunk of leading dimensions and source rows is remapped by a sparse
+    matrix product, so only the x dimension is loaded whole.
+    NaN values in the source are ignored, i.e. a target value is the weighted mean of the valid
+    source values only.
+
+    Args:
+        da (xr.DataArray): Source data array.
+        like (Optional[xr.DataArray], optional): Array defining the target grid. Defaults to None.
+        transform (Optional[Affine], optional): Target transform, if like is not provided. Defaults to None.
+        shape (Optional[Tuple[int, int]], optional): Target (height, width), if like is not provided.
+                                                     Defaults to None.
+        method (str, optional): "nearest", "bilinear" or "conservative". Defaults to "bilinear".
+        cache_dir (Optional[str], optional): Directory in which weights are saved. Defaults to None.
+
+    Returns:
+        xr.DataArray: Regridded data array.
+    """
+    y_dim, x_dim = spatial_dims(da)
+    if like is not None:
+        like_y_dim, like_x_dim = spatial_dims(like)
+        transform = transform_from_coords(like[like_x_dim].values, like[like_y_dim].values)
+        shape = (like.sizes[like_y_dim], like.sizes[like_x_dim])
+    elif transform is None or shape is None:
+        raise ValueError("either like or both transform and shape must be provided.")
+    src_transform = transform_from_coords(da[x_dim].values, da[y_dim].values)
+    src_shape = (da.sizes[y_dim], da.sizes[x_dim])
+    crs = da.rio.crs
+    geographic = crs is None or crs.is_geographic
+    weights = get_regrid_weights(
+        src_transform, src_shape, transform, shape, method, geographic, cache_dir
+    )
+
+    other_dims = [d for d in da.dims if d not in (y_dim, x_dim)]
+    da = da.transpose(*other_dims, y_dim, x_dim)
+    data = dask.array.asarray(da.data)
+    # only x forms a single chunk; y and the leading dimensions keep their chunking and each
+    # block of target rows reads just the source rows its weights use
+    data = data.rechunk({data.ndim - 1: -1})
+    blocks = []
+    for start, stop in _target_row_blocks(weights.weights_y, data.chunks[-2]):
+        weights_y = weights.weights_y[start:stop]
+        src_start, src_stop = _source_rows(weights_y)
+        source = data[..., src_start:src_stop, :].rechunk({data.ndim - 2: -1})
+        blocks.append(
+            source.map_blocks(
+                _apply_weights,
+                weights_y[:, src_start:src_stop],
+                weights.weights_x,
+                chunks=source.chunks[:-2] + ((stop - start,), (shape[1],)),
+                dtype=np.result_type(data.dtype, np.float32),
+            )
+        )
+    regridded = dask.array.concatenate(blocks, axis=data.ndim - 2)
+    coords = affine_to_coords(transform, shape[1], shape[0], x_dim=x_dim, y_dim=y_dim)  # type: ignore
+    for dim in other_dims:
+        if dim in da.coords:
+            coords[dim] = da[dim].values
+    result = xr.DataArray(
+        regridded, dims=other_dims + [y_dim, x_dim], coords=coords, attrs=da.attrs
+    )
+    if crs is not None:
+        result.rio.write_crs(crs, inplace=True)
+    return result
+
+
+def spatial_dims(da: xr.DataArray) -> Tuple[Hashable, Hashable]:
+    """Names of the (y, x) dimensions of a data array."""
+    for y_dim, x_dim in (("y", "x"), ("latitude", "longitude"), ("lat", "lon")):
+        if y_dim in da.dims and x_dim in da.dims:
+            return y_dim, x_dim
+    raise ValueError(f"unexpected dims {da.dims}")
+
+
+def transform_from_coords(x: np.ndarray, y: np.ndarray) -> Affine:
+    """Affine transform of a regular grid from 1d pixel-centred coordinates."""
+    for coords in (x, y):
+        if len(coords) < 2:
+            raise ValueError("at least two coordinates are needed to infer a transform.")
+        steps = np.diff(coords)
+        if not np.allclose(steps, steps[0]):
+            raise ValueError("coordinates are not regularly spaced.")
+    dx, dy = float(x[1] - x[0]), float(y[1] - y[0])
+    return Affine(dx, 0, float(x[0]) - dx / 2, 0, dy, float(y[0]) - dy / 2)
+
+
+def _apply_weights(
+    block: np.ndarray, weights_y: sparse.csr_matrix, weights_x: sparse.csr_matrix
+) -> np.ndarray:
+    """Apply separable weights to the last two dimensions of a block, ignoring NaNs."""
+    lead_shape = block.shape[:-2]
+    slices = block.reshape((-1,) + block.shape[-2:])
+    out = np.empty(
+        (slices.shape[0], weights_y.shape[0], weights_x.shape[0]),
+        dtype=np.result_type(block.dtype, np.float32),
+    )
+    for i, values in enumerate(slices):
+        valid = np.isfinite(values)
+        filled = np.where(valid, values, 0)
+        total = (weights_x @ (weights_y @ filled).T).T
+        norm = (weights_x @ (weights_y @ valid.astype(np.float64)).T).T
+        with np.errstate(invalid="ignore", divide="ignore"):
+            out[i] = np.where(norm > 0, total / norm, np.nan)
+    return out.reshape(lead_shape + out.shape[-2:])
+
+
+def _target_row_blocks(
+    weights_y: sparse.csr_matrix, src_chunks: Tuple[int, ...]
+) -> List[Tuple[int, int]]:
+    """Ranges of target rows following the source y chunks: a target row goes with the chunk
+    holding the first source row it reads (rows reading none go with the previous row)."""
+    bounds = np.cumsum(src_chunks)
+    chunk_of = np.zeros(weights_y.shape[0], dtype=int)
+    current = 0
+    for row in range(weights_y.shape[0]):
+        start, stop = weights_y.indptr[row], weights_y.indptr[row + 1]
+        if stop > start:
+            first = weights_y.indices[start:stop].min()
+            current = int(np.searchsorted(bounds, first, side="right"))
+        chunk_of[row] = current
+    edges = [0, *(np.flatnonzero(np.diff(chunk_of)) + 1), weights_y.shape[0]]
+    return [(int(a), int(b)) for a, b in zip(edges[:-1], edges[1:])]
+
+
+def _source_rows(weights_y: sparse.csr_matrix) -> Tuple[int, int]:
+    """Range of source rows read by some weights (a single row if they read none)."""
+    if weights_y.nnz == 0:
+        return 0, 1
+    return int(weights_y.indices.min()), int(weights_y.indices.max()) + 1
+
+
+def _axis_weights(
+    src_origin: float,
+    src_step: float,
+    src_size: int,
+    dst_origin: float,
+    dst_step: float,
+    dst_size: int,
+    method: str,
+    spherical: bool,
+) -> sparse.csr_matrix:
+    """1d weights along one axis, shape (dst_size, src_size)."""
+    rows, cols, vals = [], [], []
+    dst_index = np.arange(dst_size)
+    if method in ("nearest", "bilinear"):
+        # fractional source index of target pixel centres; source pixel i spans [i, i + 1)
+        centres = dst_origin + (dst_index + 0.5) * dst_step
+        u = (centres - src_origin) / src_step
+        if method == "nearest":
+            i = np.floor(u).astype(int)
+            ok = (i >= 0) & (i < src_size)
+            rows, cols, vals = dst_index[ok], i[ok], np.ones(ok.sum())
+        else:
+            p = u - 0.5
+            i0 = np.floor(p).astype(int)
+            w1 = p - i0
+            ok = (p >= -0.5) & (p <= src_size - 0.5)
+            i_lo = np.clip(i0, 0, src_size - 1)
+            i_hi = np.clip(i0 + 1, 0, src_size - 1)
+            rows = np.concatenate([dst_index[ok], dst_index[ok]])
+            cols = np.concatenate([i_lo[ok], i_hi[ok]])
+            vals = np.concatenate([1 - w1[ok], w1[ok]])
+    else:
+        measure = (lambda v: np.sin(np.radians(v))) if spherical else (lambda v: v)
+        src_edges = src_origin + np.arange(src_size + 1) * src_step
+        src_lo = np.minimum(src_edges[:-1], src_edges[1:])
+        src_hi = np.maximum(src_edges[:-1], src_edges[1:])
+        for j in dst_index:
+            a, b = sorted((dst_origin + j * dst_step, dst_origin + (j + 1) * dst_step))
+            u_a, u_b = sorted(((a - src_origin) / src_step, (b - src_origin) / src_step))
+            start = max(int(np.floor(u_a)), 0)
+            stop = min(int(np.ceil(u_b)), src_size)
+            if stop <= start:
+                continue
+            i = np.arange(start, stop)
+            overlap = measure(np.minimum(b, src_hi[i])) - measure(np.maximum(a, src_lo[i]))
+            ok = overlap > 0
+            rows.extend([j] * int(ok.sum()))
+            cols.extend(i[ok])
+            vals.extend(overlap[ok])
+    matrix = sparse.csr_matrix(
+        (np.asarray(vals, dtype=np.float64), (np.asarray(rows), np.asarray(cols))),
+        shape=(dst_size, src_size),
+    )
+    row_sums = np.asarray(matrix.sum(axis=1)).ravel()
+    scale = np.divide(1.0, row_sums, out=np.zeros_like(row_sums), where=row_sums > 0)
+    return (sparse.diags(scale) @ matrix).tocsr()
+
+
+def _weights_key(
+    src_transform: Affine,
+    src_shape: Tuple[int, int],
+    dst_transform: Affine,
+    dst_shape: Tuple[int, int],
+    method: str,
+    geographic: bool,
+) -> str:
+    components = (
+        method,
+        geographic,
+        tuple(round(v, 12) for v in list(src_transform)[:6]),
+        tuple(src_shape),
+        tuple(round(v, 12) for v in list(dst_transform)[:6]),
+        tuple(dst_shape),
+    )
+    return hashlib.sha256(repr(components).encode()).hexdigest()[:24]
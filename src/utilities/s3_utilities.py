@@ -9,6 +9,8 @@ from typing import Callable, Optional, Sequence
 import boto3
 import botocore.client
 
+from src.utilities.telemetry_utilities import get_telemetry
+
 logger = logging.getLogger(__name__)
 
 
@@ -58,7 +60,7 @@ def copy_local_to_dev(zarr_dir: str, array_path: str, dry_run=False):
             )
 
     async def copy_all():
-        executor = concurrent.futures.ThreadPoolExecutor(max_workers=32)
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
         loop = asyncio.get_running_loop()
         futures = [loop.run_in_executor(executor, copy_file, file) for file in files]
 
@@ -231,24 +233,31 @@ def copy_objects(
     s3_target_client,
     target_bucket_name: str,
     rename: Optional[Callable[[str], str]] = None,
+    metrics_path: Optional[str] = None,
+    max_workers: int = 32,
 ):
-    """Form of copy that allows separate credentials for source and target buckets."""
+    """Form of copy that allows separate credentials for source and target buckets.
+    Every copy is recorded in the transfer telemetry (`get_telemetry`); the records of this call
+    are exported to `metrics_path` at the end if given. At most `max_workers` objects are copied at once."""
 
     logger.info(
         f"Source bucket {source_bucket_name}; target bucket {target_bucket_name}"
     )
 
     def copy_object(key):
-        obj = s3_source_client.get_object(Bucket=source_bucket_name, Key=key)
-        data = obj["Body"].read()
-        target_key = rename(key) if rename is not None else key
-        # target_key = key.replace('hazard_test/hazard.zarr', 'hazard/hazard.zarr')
-        return s3_target_client.put_object(
-            Body=data, Bucket=target_bucket_name, Key=target_key
-        )
+        with get_telemetry().transfer("s3", key) as transfer:
+            obj = s3_source_client.get_object(Bucket=source_bucket_name, Key=key)
+            transfer.first_byte()
+            data = obj["Body"].read()
+            transfer.add_bytes(len(data))
+            target_key = rename(key) if rename is not None else key
+            # target_key = key.replace('hazard_test/hazard.zarr', 'hazard/hazard.zarr')
+            return s3_target_client.put_object(
+                Body=data, Bucket=target_bucket_name, Key=target_key
+            )
 
     async def copy_all(keys: Sequence[str]):
-        executor = concurrent.futures.ThreadPoolExecutor(max_workers=32)
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
         loop = asyncio.get_running_loop()
         futures = [loop.run_in_executor(executor, copy_object, key) for key in keys]
 
@@ -258,8 +267,10 @@ def copy_objects(
             if len(completed) % 100 == 0:
                 logger.info(f"Completed {len(completed)}/{len(keys)}")
 
-    loop = asyncio.get_event_loop()
-    loop.run_until_complete(copy_all(keys))
+    with get_telemetry().scope() as telemetry:
+        asyncio.run(copy_all(keys))
+    if metrics_path is not None:
+        telemetry.export(metrics_path)
     logger.info("Completed.")
 
 
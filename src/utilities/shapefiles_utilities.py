@@ -1,28 +1,399 @@
 import geopandas as gpd
+import shapely
+import sparse  # type: ignore
+from shapely import STRtree
 from shapely.geometry import box  # Corrected import
-from typing import List, Union, Optional, Dict
+from typing import List, Union, Optional, Dict, Sequence, Tuple
+import hashlib
+import json
 import os
+import shutil
+import threading
 import numpy as np
+import pandas as pd
+from numcodecs import Blosc  # type: ignore
 import xarray as xr
 from dask import delayed
-from dataset_generation.utilities.download_utilities import download_file
+from src.utilities.download_utilities import download_file
 import dask.array as da
 from rasterio import features
 from affine import Affine
 from pyproj import Transformer
-from dataset_generation.utilities.xarray_utilities import (
+from src.utilities.xarray_utilities import (
     affine_to_coords,
     normalize_array,
 )
 import zipfile
 import urllib.parse
 
+class BoundaryIndex:
+    """
+    Spatial (STRtree) and attribute indexes over a boundary dataset, built once and reused by
+    every query. The GeoDataFrame must not be modified after the index is built.
+
+    Example:
+        index = BoundaryIndex(world)
+        for iso3 in batch:
+            gdf = filter_countries_by_attribute(world, "iso3", [iso3], index=index)
+    """
+
+    def __init__(self, gdf: gpd.GeoDataFrame):
+        self.gdf = gdf
+        self.tree = STRtree(np.asarray(gdf.geometry.values, dtype=object))
+        self._attribute_indexes: Dict[str, Dict] = {}
+        self._attribute_strings: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+
+    def attribute_index(self, attribute: str) -> Dict:
+        """Mapping from each value of the attribute to the positions of its rows."""
+        if attribute not in self._attribute_indexes:
+            if attribute not in self.gdf.columns:
+                raise KeyError(
+                    f"Attribute '{attribute}' not found in the shapefile. "
+                    f"Available columns: {self.gdf.columns.tolist()}"
+                )
+            codes, uniques = pd.factorize(self.gdf[attribute])
+            # rows with missing values have code -1 and are not indexed
+            positions = np.nonzero(codes >= 0)[0]
+            positions = positions[np.argsort(codes[positions], kind="stable")]
+            counts = np.bincount(codes[positions], minlength=len(uniques))
+            splits = np.split(positions, np.cumsum(counts)[:-1])
+            self._attribute_indexes[attribute] = dict(zip(uniques, splits))
+        return self._attribute_indexes[attribute]
+
+    def select(
+        self,
+        attribute: str,
+        values: List[Union[str, int, float]],
+        exact_match: bool = True,
+    ) -> np.ndarray:
+        """
+        Positions of the rows whose attribute matches any of the values. For partial matching
+        (exact_match False) the values are searched, case insensitively, in the distinct
+        attribute values only, not in every row.
+        """
+        index = self.attribute_index(attribute)
+        if exact_match:
+            matched = [v for v in values if v in index]
+        else:
+            if attribute not in self._attribute_strings:
+                uniques = np.array(list(index.keys()), dtype=object)
+                lowered = np.array([str(v).lower() for v in uniques])
+                self._attribute_strings[attribute] = (uniques, lowered)
+            uniques, lowered = self._attribute_strings[attribute]
+            if len(uniques) == 0:
+                return np.zeros(0, dtype=np.int64)
+            found = np.zeros(len(uniques), dtype=bool)
+            for v in values:
+                found |= np.char.find(lowered, str(v).lower()) >= 0
+            matched = list(uniques[found])
+        if not matched:
+            return np.zeros(0, dtype=np.int64)
+        return np.sort(np.concatenate([index[v] for v in matched]))
+
+    def query_bbox(
+        self, bounds: Tuple[float, float, float, float], predicate: str = "intersects"
+    ) -> np.ndarray:
+        """Positions of the rows whose geometry satisfies the predicate (by default, intersects)
+        with the bounding box (minx, miny, maxx, maxy)."""
+        return np.sort(self.tree.query(box(*bounds), predicate=predicate))
+
+    def query(
+        self,
+        attribute: Optional[str] = None,
+        values: Optional[List[Union[str, int, float]]] = None,
+        exact_match: bool = True,
+        bounds: Optional[Tuple[float, float, float, float]] = None,
+        clip: bool = True,
+    ) -> gpd.GeoDataFrame:
+        """
+        Rows matching the attribute values and intersecting the bounding box. If clip is True,
+        only the geometries crossing the bounding box edge are clipped; geometries inside the
+        bounding box are returned untouched.
+        """
+        positions = None
+        if attribute is not None and values is not None:
+            positions = self.select(attribute, values, exact_match)
+        if bounds is not None:
+            in_bbox = self.query_bbox(bounds)
+            positions = (
+                in_bbox if positions is None else np.intersect1d(positions, in_bbox)
+            )
+        selected = self.gdf if positions is None else self.gdf.iloc[positions]
+        if bounds is not None and clip:
+            selected = clip_to_bounds(selected, bounds)
+        return selected
+
+
+def clip_to_bounds(
+    gdf: gpd.GeoDataFrame, bounds: Tuple[float, float, float, float]
+) -> gpd.GeoDataFrame:
+    """
+    Clips geometries to a rectangle. Geometries lying inside the rectangle are passed through
+    untouched and only the ones crossing its edge are clipped (with shapely.clip_by_rect);
+    geometries outside it are dropped.
+
+    Args:
+        gdf (gpd.GeoDataFrame): GeoDataFrame to clip.
+        bounds (Tuple[float, float, float, float]): (minx, miny, maxx, maxy) of the rectangle.
+
+    Returns:
+        gpd.GeoDataFrame: Clipped GeoDataFrame.
+    """
+    geometries = gdf.geometry.values
+    geometry_bounds = shapely.bounds(np.asarray(geometries, dtype=object))
+    minx, miny, maxx, maxy = bounds
+    inside = (
+        (geometry_bounds[:, 0] >= minx)
+        & (geometry_bounds[:, 1] >= miny)
+        & (geometry_bounds[:, 2] <= maxx)
+        & (geometry_bounds[:, 3] <= maxy)
+    )
+    outside = (
+        (geometry_bounds[:, 0] > maxx)
+        | (geometry_bounds[:, 2] < minx)
+        | (geometry_bounds[:, 1] > maxy)
+        | (geometry_bounds[:, 3] < miny)
+    )
+    crossing = ~inside & ~outside
+    clipped = np.asarray(geometries, dtype=object).copy()
+    clipped[crossing] = shapely.clip_by_rect(clipped[crossing], minx, miny, maxx, maxy)
+    result = gdf.copy()
+    result[result.geometry.name] = gpd.GeoSeries(clipped, index=gdf.index, crs=gdf.crs)
+    keep = ~outside & ~shapely.is_empty(clipped)
+    return result[keep]
+
+
+def load_boundaries(
+    path: str,
+    columns: Optional[List[str]] = None,
+    bounds: Optional[Tuple[float, float, float, float]] = None,
+    simplify_tolerance: Optional[float] = None,
+    cache_dir: Optional[str] = None,
+    keep_columns: Optional[List[str]] = None,
+    simplify_tolerances: Sequence[float] = (),
+) -> gpd.GeoDataFrame:
+    """
+    Loads an administrative boundary dataset (any format readable by `gpd.read_file`) through a
+    GeoParquet cache. The source is converted once (see `convert_boundaries_to_parquet`); later
+    loads read only the requested columns and the row groups intersecting `bounds`.
+
+    Args:
+        path (str): Source file, e.g. "world-administrative-boundaries.geojson".
+        columns (Optional[List[str]]): Attribute columns to read. Defaults to all cached columns.
+        bounds (Optional[Tuple[float, float, float, float]]): (minx, miny, maxx, maxy); only rows whose
+            bounding box intersects it are returned.
+        simplify_tolerance (Optional[float]): Return the geometry pre-simplified at this tolerance,
+            which must be one of `simplify_tolerances`. Defaults to the original geometry.
+        cache_dir (Optional[str]): Cache directory. Defaults to a "parquet_cache" directory next to the source.
+        keep_columns (Optional[List[str]]): Attribute columns kept in the cache. Defaults to all.
+        simplify_tolerances (Sequence[float]): Tolerances of the pre-simplified geometry columns.
+
+    Returns:
+        gpd.GeoDataFrame: Boundaries with an active "geometry" column.
+    """
+    if simplify_tolerance is not None and simplify_tolerance not in simplify_tolerances:
+        raise ValueError(
+            f"simplify_tolerance {simplify_tolerance} not in simplify_tolerances {list(simplify_tolerances)}."
+        )
+    cache_path = convert_boundaries_to_parquet(
+        path, cache_dir, keep_columns, simplify_tolerances
+    )
+    geometry_column = (
+        "geometry"
+        if simplify_tolerance is None
+        else _simplified_column(simplify_tolerance)
+    )
+    read_columns = None if columns is None else list(columns) + [geometry_column]
+    filters = None
+    if bounds is not None:
+        minx, miny, maxx, maxy = bounds
+        filters = [
+            ("bbox_maxx", ">=", minx),
+            ("bbox_minx", "<=", maxx),
+            ("bbox_maxy", ">=", miny),
+            ("bbox_miny", "<=", maxy),
+        ]
+    gdf = gpd.read_parquet(cache_path, columns=read_columns, filters=filters)
+    gdf = gdf.set_geometry(geometry_column)
+    drop = [c for c in gdf.columns if c.startswith("geometry") and c != geometry_column]
+    drop += [c for c in ("bbox_minx", "bbox_miny", "bbox_maxx", "bbox_maxy") if c in gdf.columns]
+    gdf = gdf.drop(columns=drop)
+    if geometry_column != "geometry":
+        gdf = gdf.rename_geometry("geometry")
+    return gdf
+
+
+def convert_boundaries_to_parquet(
+    path: str,
+    cache_dir: Optional[str] = None,
+    keep_columns: Optional[List[str]] = None,
+    simplify_tolerances: Sequence[float] = (),
+    row_group_size: int = 32,
+) -> str:
+    """
+    Converts a boundary dataset to GeoParquet (WKB geometry) unless already converted. The
+    output is keyed by a hash of the source content and of the conversion options, so a
+    changed source is converted again. Rows are sorted along a Hilbert curve and written in
+    small row groups with per-row bounding box columns, so that bounding box queries only read
+    the row groups they need.
+
+    Args:
+        path (str): Source file.
+        cache_dir (Optional[str]): Cache directory. Defaults to a "parquet_cache" directory next to the source.
+        keep_columns (Optional[List[str]]): Attribute columns to keep. Defaults to all.
+        simplify_tolerances (Sequence[float]): Tolerances of additional pre-simplified geometry columns.
+        row_group_size (int): Number of rows per row group. Defaults to 32.
+
+    Returns:
+        str: Path of the GeoParquet file.
+    """
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(path)), "parquet_cache")
+    os.makedirs(cache_dir, exist_ok=True)
+    options = json.dumps(
+        {
+            "keep_columns": keep_columns,
+            "simplify_tolerances": sorted(float(t) for t in simplify_tolerances),
+        },
+        sort_keys=True,
+    )
+    key = hashlib.sha256(
+        (_file_hash(path, cache_dir) + options).encode()
+    ).hexdigest()[:16]
+    stem = os.path.splitext(os.path.basename(path))[0]
+    cache_path = os.path.join(cache_dir, f"{stem}-{key}.parquet")
+    if os.path.exists(cache_path):
+        return cache_path
+
+    gdf = gpd.read_file(path)
+    if keep_columns is not None:
+        gdf = gdf[list(keep_columns) + [gdf.geometry.name]]
+    if gdf.geometry.name != "geometry":
+        gdf = gdf.rename_geometry("geometry")
+    gdf = gdf.iloc[np.argsort(gdf.hilbert_distance(), kind="stable")].reset_index(
+        drop=True
+    )
+    geometry_bounds = gdf.geometry.bounds
+    gdf["bbox_minx"] = geometry_bounds["minx"].values
+    gdf["bbox_miny"] = geometry_bounds["miny"].values
+    gdf["bbox_maxx"] = geometry_bounds["maxx"].values
+    gdf["bbox_maxy"] = geometry_bounds["maxy"].values
+    for tolerance in simplify_tolerances:
+        gdf[_simplified_column(tolerance)] = gdf.geometry.simplify(
+            tolerance, preserve_topology=True
+        )
+    tmp_path = cache_path + ".tmp"
+    gdf.to_parquet(tmp_path, index=False, row_group_size=row_group_size)
+    os.replace(tmp_path, cache_path)
+    return cache_path
+
+
+class RasterizationCache:
+    """
+    Content-addressed cache of rasterized label and mask datasets, stored as compressed Zarr.
+
+    Entries are keyed by a hash of the geometries, their attribute values, the affine transform
+    and the shape of the grid (see `RasterizationCache.key`), so they stay valid for as long as
+    boundaries and grid are unchanged. Hits are opened lazily. When the total size exceeds
+    max_bytes, the least recently used entries are removed.
+
+    Example:
+        cache = RasterizationCache("data_inputs/raster_cache")
+        ds = rasterize_countries(world, ["GHA", "CIV"], "iso3", 0.25, mode="labels", cache=cache)
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = 5 * 1024**3):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def key(
+        gdf: gpd.GeoDataFrame,
+        attribute: str,
+        values: List,
+        transform: Affine,
+        shape: Tuple[int, int],
+        kind: str,
+    ) -> str:
+        """Hash of the geometries, attribute values, requested values, grid and kind of raster."""
+        digest = hashlib.sha256()
+        digest.update(
+            json.dumps(
+                {
+                    "attribute": attribute,
+                    "values": [str(v) for v in values],
+                    "transform": [float(v) for v in list(transform)[:6]],
+                    "shape": [int(v) for v in shape],
+                    "kind": kind,
+                },
+                sort_keys=True,
+            ).encode()
+        )
+        for wkb in shapely.to_wkb(np.asarray(gdf.geometry.values, dtype=object)):
+            digest.update(wkb if wkb is not None else b"")
+        for value in gdf[attribute].astype(str):
+            digest.update(value.encode())
+        return digest.hexdigest()[:32]
+
+    def get(self, key: str) -> Optional[xr.Dataset]:
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        os.utime(path)  # mark as recently used
+        return xr.open_zarr(path)
+
+    def put(self, key: str, ds: xr.Dataset) -> xr.Dataset:
+        """Write the dataset (computing it chunk by chunk) and return the lazily opened entry."""
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        compressor = Blosc(cname="zstd", clevel=5, shuffle=Blosc.BITSHUFFLE)
+        ds.to_zarr(
+            tmp_path,
+            mode="w",
+            encoding={name: {"compressor": compressor} for name in ds.data_vars},
+        )
+        try:
+            os.rename(tmp_path, path)
+        except OSError:
+            # written concurrently by another process
+            shutil.rmtree(tmp_path, ignore_errors=True)
+        self._evict(keep=path)
+        return self.get(key)  # type: ignore
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.zarr")
+
+    def _evict(self, keep: str):
+        """Remove least recently used entries, other than keep, until under max_bytes."""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".zarr"):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            size = sum(
+                os.path.getsize(os.path.join(root, f))
+                for root, _, files in os.walk(path)
+                for f in files
+            )
+            entries.append((os.path.getmtime(path), size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+
+
 def filter_countries_by_attribute(
     world: gpd.GeoDataFrame,
     attribute: str,
     values: List[Union[str, int, float]],
     exact_match: bool = True,
     bounding_box: Optional[gpd.GeoDataFrame] = None,
+    index: Optional[BoundaryIndex] = None,
 ) -> gpd.GeoDataFrame:
     """
     Filters the GeoDataFrame based on arbitrary attribute values and optionally limits to a bounding box.
@@ -34,6 +405,8 @@ def filter_countries_by_attribute(
         exact_match (bool, optional): If True, performs exact matching.
                                       If False, performs partial matching for strings. Defaults to True.
         bounding_box (Optional[gpd.GeoDataFrame]): Optional GeoDataFrame containing a bounding box.
+        index (Optional[BoundaryIndex]): Index built once over `world`; when provided, attribute
+                                         matching and bounding box selection go through it.
 
     Returns:
         gpd.GeoDataFrame: Filtered GeoDataFrame containing only specified countries within the bounding box.
@@ -50,7 +423,11 @@ def filter_countries_by_attribute(
         )
 
     # Perform filtering by attribute
-    if exact_match:
+    if index is not None:
+        positions = index.select(attribute, values, exact_match)
+        positions = positions[~world[attribute].iloc[positions].duplicated().to_numpy()]
+        filtered = world.iloc[positions]
+    elif exact_match:
         filtered = world[world[attribute].isin(values)].drop_duplicates(
             subset=[attribute]
         )
@@ -74,10 +451,9 @@ def filter_countries_by_attribute(
             raise ValueError(
                 f"CRS mismatch: GeoDataFrame CRS is '{world.crs}', but bounding box CRS is '{bounding_box.crs}'."
             )
-        filtered = gpd.clip(filtered, bounding_box)
-    else:
-        # Automatically compute bounding box from filtered geometries
-        minx, miny, maxx, maxy = filtered.total_bounds
+        if index is not None:
+            filtered = world.iloc[_intersecting(index, positions, bounding_box)]
+        filtered = _clip_to_bounding_box(filtered, bounding_box)
 
     return filtered
 
@@ -104,6 +480,336 @@ def create_bounding_box(
     return bbox_gdf
 
 
+def raster_grid(
+    gdf: gpd.GeoDataFrame,
+    resolution: float,
+    bounding_box: Optional[gpd.GeoDataFrame] = None,
+    adjust_boundaries: bool = True,
+) -> Tuple[Affine, int, int]:
+    """
+    Computes the raster grid covering the geometries (or the bounding box, if provided).
+
+    Args:
+        gdf (gpd.GeoDataFrame): GeoDataFrame in the target CRS.
+        resolution (float): Pixel resolution (e.g., in degrees or meters).
+        bounding_box (Optional[gpd.GeoDataFrame]): Bounding box GeoDataFrame to limit the extent.
+        adjust_boundaries (bool): If True, adjusts boundaries to align with the resolution.
+
+    Returns:
+        Tuple[Affine, int, int]: Transform, number of rows and number of columns.
+    """
+    if bounding_box is None:
+        minx, miny, maxx, maxy = gdf.total_bounds
+    else:
+        minx, miny, maxx, maxy = bounding_box.total_bounds
+
+    # Adjust boundaries to align with resolution
+    if adjust_boundaries:
+        minx = resolution * (minx // resolution)
+        miny = resolution * (miny // resolution)
+        maxx = resolution * (maxx // resolution + 1)
+        maxy = resolution * (maxy // resolution + 1)
+
+    # Compute raster dimensions
+    ncols = int((maxx - minx) / resolution)
+    nrows = int((maxy - miny) / resolution)
+
+    transform = Affine.translation(minx, maxy) * Affine.scale(resolution, -resolution)
+    return transform, nrows, ncols
+
+
+def rasterize_labels(
+    gdf: gpd.GeoDataFrame,
+    values: List[str],
+    attribute: str,
+    resolution: Optional[float] = None,
+    bounding_box: Optional[gpd.GeoDataFrame] = None,
+    adjust_boundaries: bool = True,
+    transform: Optional[Affine] = None,
+    shape: Optional[Tuple[int, int]] = None,
+    chunk_size: Optional[Tuple[int, int]] = None,
+    cache: Optional[RasterizationCache] = None,
+) -> xr.DataArray:
+    """
+    Rasterizes the categories into a single label raster: pixels of category values[i] are
+    labelled i + 1 and pixels outside every category are labelled 0. The smallest unsigned
+    integer type holding all labels is used (uint8 for up to 255 categories).
+
+    The raster is lazy and each chunk is rasterized independently, using only the geometries
+    whose bounding boxes intersect the chunk window (found with an STRtree); memory is bounded
+    by the chunk size and chunks are rasterized in parallel.
+
+    The grid is either computed as in `rasterize_countries` (from resolution and, optionally,
+    the bounding box) or given explicitly by transform and shape, e.g. to match a climate grid.
+
+    Args:
+        gdf (gpd.GeoDataFrame): GeoDataFrame in the target CRS.
+        values (List[str]): List of category codes to rasterize.
+        attribute (str): Column name for category codes in the GeoDataFrame.
+        resolution (Optional[float]): Pixel resolution; required if transform is not provided.
+        bounding_box (Optional[gpd.GeoDataFrame]): Bounding box GeoDataFrame to limit the extent.
+        adjust_boundaries (bool): If True, adjusts boundaries to align with the resolution.
+        transform (Optional[Affine]): Transform of the target grid.
+        shape (Optional[Tuple[int, int]]): (rows, columns) of the target grid.
+        chunk_size (Optional[Tuple[int, int]]): (rows, columns) of each chunk. Defaults to
+            chunks of at most 100 MB.
+        cache (Optional[RasterizationCache]): If provided, the label raster is read from (or
+            written to) the cache.
+
+    Returns:
+        xr.DataArray: Label raster with dims ["y", "x"]; the "categories" attribute lists the
+        category codes in label order.
+    """
+    filtered_gdf = gdf[gdf[attribute].isin(values)]
+    if filtered_gdf.empty:
+        raise ValueError("No geometries found for the specified category codes.")
+
+    if transform is not None:
+        if shape is None:
+            raise ValueError("shape must be provided together with transform.")
+        nrows, ncols = shape
+    else:
+        if resolution is None:
+            raise ValueError("either resolution or transform and shape must be provided.")
+        if bounding_box is not None:
+            # no clipping needed: only the geometries intersecting each chunk are burned
+            _assert_same_crs(gdf, bounding_box)
+        transform, nrows, ncols = raster_grid(
+            filtered_gdf, resolution, bounding_box, adjust_boundaries
+        )
+
+    if cache is not None:
+        key = RasterizationCache.key(
+            filtered_gdf, attribute, values, transform, (nrows, ncols), "labels"
+        )
+        cached = cache.get(key)
+        if cached is None:
+            labels = rasterize_labels(
+                filtered_gdf,
+                values,
+                attribute,
+                transform=transform,
+                shape=(nrows, ncols),
+                chunk_size=chunk_size,
+            )
+            cached = cache.put(key, xr.Dataset(data_vars={"labels": labels}))
+        return cached["labels"]
+
+    dtype = _label_dtype(len(values))
+    if chunk_size is None:
+        chunk_size = _label_chunk_size(nrows, ncols, dtype)
+
+    label_of = {code: i + 1 for i, code in enumerate(values)}
+    geometries = np.asarray(filtered_gdf.geometry.values, dtype=object)
+    labels_of_geometries = np.array(
+        [label_of[code] for code in filtered_gdf[attribute]], dtype=dtype
+    )
+    tree = STRtree(geometries)
+
+    def rasterize_block(block: np.ndarray, block_info=None) -> np.ndarray:
+        (row_start, row_stop), (col_start, col_stop) = block_info[0]["array-location"]
+        window_transform = transform * Affine.translation(col_start, row_start)
+        out_shape = (row_stop - row_start, col_stop - col_start)
+        minx, maxy = window_transform * (0, 0)
+        maxx, miny = window_transform * (out_shape[1], out_shape[0])
+        indices = tree.query(box(minx, miny, maxx, maxy))
+        if len(indices) == 0:
+            return np.zeros(out_shape, dtype=dtype)
+        return features.rasterize(
+            shapes=zip(geometries[indices], labels_of_geometries[indices].tolist()),
+            out_shape=out_shape,
+            fill=0,
+            transform=window_transform,
+            dtype=np.dtype(dtype).name,
+        )
+
+    labels = da.empty((nrows, ncols), chunks=chunk_size, dtype=dtype).map_blocks(
+        rasterize_block, dtype=dtype
+    )
+
+    coords = affine_to_coords(transform, ncols, nrows)
+    return xr.DataArray(
+        data=labels,
+        dims=["y", "x"],
+        coords={"y": coords["y"], "x": coords["x"]},
+        attrs={
+            "categories": list(values),
+            "attribute": attribute,
+            "crs": f"EPSG:{gdf.crs.to_epsg()}" if gdf.crs else "unknown",
+        },
+    )
+
+
+def label_layers(
+    labels: xr.DataArray, naming_pattern: Optional[str] = None
+) -> xr.Dataset:
+    """
+    Lazy per-category boolean view of a label raster produced by `rasterize_labels`. Each
+    layer is computed chunk by chunk from the label raster only when accessed.
+
+    Args:
+        labels (xr.DataArray): Label raster with "categories" and "attribute" attributes.
+        naming_pattern (Optional[str]): As for `rasterize_countries`. Defaults to "{attribute}_{code}".
+
+    Returns:
+        xr.Dataset: Dataset containing one boolean layer per category.
+    """
+    attribute = labels.attrs.get("attribute", "label")
+    layers = {}
+    for i, code in enumerate(labels.attrs["categories"]):
+        layer_name = _layer_name(naming_pattern, code, attribute)
+        layers[layer_name] = labels == i + 1
+    ds = xr.Dataset(data_vars=layers)
+    ds.attrs["crs"] = labels.attrs.get("crs", "unknown")
+    return ds
+
+
+def rasterize_coverage(
+    gdf: gpd.GeoDataFrame,
+    values: List[str],
+    attribute: str,
+    resolution: Optional[float] = None,
+    bounding_box: Optional[gpd.GeoDataFrame] = None,
+    adjust_boundaries: bool = True,
+    transform: Optional[Affine] = None,
+    shape: Optional[Tuple[int, int]] = None,
+    method: str = "exact",
+    supersample: int = 10,
+) -> xr.Dataset:
+    """
+    Rasterizes the fraction of each pixel covered by each category.
+
+    Pixels crossed by a category boundary get their covered fraction computed either exactly,
+    by vectorized intersection of the pixel boxes with the geometry, or by rasterizing the
+    geometry at `supersample` times the resolution. Only these boundary pixels are stored, as a
+    sparse array, so memory grows with the length of the boundaries rather than with the grid;
+    every other pixel is either fully covered or not covered at all, which is given by the
+    (chunked, lazy) label raster of `rasterize_labels`. Use `coverage_layer` to obtain the
+    fraction raster of a category.
+
+    Args:
+        gdf (gpd.GeoDataFrame): GeoDataFrame in the target CRS.
+        values (List[str]): List of category codes to rasterize.
+        attribute (str): Column name for category codes in the GeoDataFrame.
+        resolution (Optional[float]): Pixel resolution; required if transform is not provided.
+        bounding_box (Optional[gpd.GeoDataFrame]): Bounding box GeoDataFrame to limit the extent.
+        adjust_boundaries (bool): If True, adjusts boundaries to align with the resolution.
+        transform (Optional[Affine]): Transform of the target grid.
+        shape (Optional[Tuple[int, int]]): (rows, columns) of the target grid.
+        method (str): "exact" or "supersample". Defaults to "exact".
+        supersample (int): Supersampling factor per axis for method "supersample". Defaults to 10.
+
+    Returns:
+        xr.Dataset: Dataset with the "labels" raster (dims ["y", "x"]) and the sparse
+        "boundary_coverage" fractions (dims ["category", "y", "x"]).
+    """
+    if method not in ("exact", "supersample"):
+        raise ValueError(f"Unsupported method: {method}")
+    filtered_gdf = gdf[gdf[attribute].isin(values)]
+    if filtered_gdf.empty:
+        raise ValueError("No geometries found for the specified category codes.")
+    if transform is not None:
+        if shape is None:
+            raise ValueError("shape must be provided together with transform.")
+        nrows, ncols = shape
+    else:
+        if resolution is None:
+            raise ValueError("either resolution or transform and shape must be provided.")
+        if bounding_box is not None:
+            _assert_same_crs(gdf, bounding_box)
+        transform, nrows, ncols = raster_grid(
+            filtered_gdf, resolution, bounding_box, adjust_boundaries
+        )
+    labels = rasterize_labels(
+        gdf, values, attribute, transform=transform, shape=(nrows, ncols)
+    )
+
+    category_of = {code: i for i, code in enumerate(values)}
+    entries = []
+    for geometry, code in zip(filtered_gdf.geometry, filtered_gdf[attribute]):
+        if geometry is None or geometry.is_empty:
+            continue
+        rows, cols, fractions = _boundary_fractions(
+            geometry, transform, (nrows, ncols), method, supersample
+        )
+        entries.append(
+            (np.full(len(rows), category_of[code], dtype=np.int64), rows, cols, fractions)
+        )
+
+    if entries:
+        categories, rows, cols, fractions = (np.concatenate(e) for e in zip(*entries))
+    else:
+        categories, rows, cols, fractions = (
+            np.zeros(0, dtype=np.int64),
+            np.zeros(0, dtype=np.int64),
+            np.zeros(0, dtype=np.int64),
+            np.zeros(0, dtype=np.float32),
+        )
+    # several geometries of the same category may share a pixel: add their fractions
+    flat = np.ravel_multi_index((categories, rows, cols), (len(values), nrows, ncols))
+    order = np.argsort(flat, kind="stable")
+    flat, fractions = flat[order], fractions[order]
+    unique_flat, starts = np.unique(flat, return_index=True)
+    summed = np.add.reduceat(fractions, starts) if len(flat) else fractions
+    coverage = sparse.COO(
+        np.array(np.unravel_index(unique_flat, (len(values), nrows, ncols))),
+        np.minimum(summed, 1.0).astype(np.float32),
+        shape=(len(values), nrows, ncols),
+        fill_value=0.0,
+    )
+
+    coverage_ds = xr.Dataset(
+        data_vars={
+            "labels": labels,
+            "boundary_coverage": (["category", "y", "x"], coverage),
+        },
+        coords={"category": list(values)},
+    )
+    coverage_ds.attrs["crs"] = labels.attrs["crs"]
+    return coverage_ds
+
+
+def coverage_layer(coverage_ds: xr.Dataset, code) -> xr.DataArray:
+    """
+    Lazy fraction raster of one category from the output of `rasterize_coverage`.
+
+    Args:
+        coverage_ds (xr.Dataset): Output of `rasterize_coverage`.
+        code: Category code.
+
+    Returns:
+        xr.DataArray: Covered fraction of each pixel (float32), with dims ["y", "x"].
+    """
+    labels = coverage_ds["labels"]
+    categories = list(coverage_ds["category"].values)
+    index = categories.index(code)
+    boundary = coverage_ds["boundary_coverage"].data
+    in_category = boundary.coords[0] == index
+    rows = boundary.coords[1][in_category]
+    cols = boundary.coords[2][in_category]
+    fractions = boundary.data[in_category]
+
+    def block_fractions(block: np.ndarray, block_info=None) -> np.ndarray:
+        (row_start, row_stop), (col_start, col_stop) = block_info[0]["array-location"]
+        out = (block == index + 1).astype(np.float32)
+        in_block = (
+            (rows >= row_start)
+            & (rows < row_stop)
+            & (cols >= col_start)
+            & (cols < col_stop)
+        )
+        out[rows[in_block] - row_start, cols[in_block] - col_start] = fractions[in_block]
+        return out
+
+    return xr.DataArray(
+        data=labels.data.map_blocks(block_fractions, dtype=np.float32),
+        dims=["y", "x"],
+        coords={"y": labels.y, "x": labels.x},
+        name=str(code),
+        attrs={"crs": coverage_ds.attrs.get("crs", "unknown")},
+    )
+
+
 def rasterize_countries(
     gdf: gpd.GeoDataFrame,
     values: List[str],
@@ -112,6 +818,9 @@ def rasterize_countries(
     bounding_box: Optional[gpd.GeoDataFrame] = None,  # Optional bounding box
     naming_pattern: Optional[str] = None,
     adjust_boundaries: bool = True,  # Whether to adjust boundaries to resolution
+    mode: str = "layers",
+    cache: Optional[RasterizationCache] = None,
+    index: Optional[BoundaryIndex] = None,
 ) -> xr.Dataset:
     """
     Rasterizes each category based on category codes and aggregates them into an xarray.Dataset.
@@ -128,50 +837,81 @@ def rasterize_countries(
             Example: "country_{code}"
             If None, defaults to "{attribute}_{code}".
         adjust_boundaries (bool): If True, adjusts boundaries to align with the resolution.
+        mode (str): "layers" for one int32 layer per category, or "labels" for a single compact
+            label raster (see `rasterize_labels`), rasterized chunk by chunk. Per-category
+            boolean layers can then be obtained lazily with `label_layers`.
+        cache (Optional[RasterizationCache]): If provided, the rasterized dataset is read from
+            (or written to) the cache.
+        index (Optional[BoundaryIndex]): Index built once over `gdf`; when provided, the
+            categories and the geometries intersecting the bounding box are selected through it.
 
     Returns:
-        xr.Dataset: Dataset containing rasterized categories.
+        xr.Dataset: Dataset containing rasterized categories, or containing the "labels" raster.
     """
+    if index is not None:
+        positions = index.select(attribute, values)
+        if len(positions) == 0:
+            raise ValueError("No geometries found for the specified category codes.")
+        if bounding_box is not None:
+            _assert_same_crs(gdf, bounding_box)
+            positions = _intersecting(index, positions, bounding_box)
+        gdf = gdf.iloc[positions]
+
+    if mode == "labels":
+        labels = rasterize_labels(
+            gdf,
+            values,
+            attribute,
+            resolution,
+            bounding_box=bounding_box,
+            adjust_boundaries=adjust_boundaries,
+            cache=cache,
+        )
+        labels_ds = xr.Dataset(data_vars={"labels": labels})
+        labels_ds.attrs["crs"] = labels.attrs["crs"]
+        return labels_ds
+    elif mode != "layers":
+        raise ValueError(f"Unsupported mode: {mode}")
+
     # Filter the GeoDataFrame for the selected categories
     filtered_gdf = gdf[gdf[attribute].isin(values)]
     if filtered_gdf.empty:
         raise ValueError("No geometries found for the specified category codes.")
 
-    # If no bounding box is provided, compute from the filtered geometries
-    if bounding_box is None:
-        minx, miny, maxx, maxy = filtered_gdf.total_bounds
-    else:
-        # Ensure CRS consistency if a bounding box is provided
-        if not gdf.crs.equals(bounding_box.crs):
-            raise ValueError(
-                f"CRS mismatch: GeoDataFrame CRS is '{gdf.crs}', "
-                f"but bounding box CRS is '{bounding_box.crs}'."
-            )
-        # Clip the GeoDataFrame to the bounding box
-        filtered_gdf = gpd.clip(filtered_gdf, bounding_box)
-        minx, miny, maxx, maxy = bounding_box.total_bounds
-
-    # Adjust boundaries to align with resolution
-    if adjust_boundaries:
-        minx = resolution * (minx // resolution)
-        miny = resolution * (miny // resolution)
-        maxx = resolution * (maxx // resolution + 1)
-        maxy = resolution * (maxy // resolution + 1)
-
-    # Compute raster dimensions
-    ncols = int((maxx - minx) / resolution)
-    nrows = int((maxy - miny) / resolution)
+    # Clip to the bounding box, if provided, and compute the aligned grid
+    if bounding_box is not None:
+        _assert_same_crs(gdf, bounding_box)
+        filtered_gdf = _clip_to_bounding_box(filtered_gdf, bounding_box)
+    transform, nrows, ncols = raster_grid(
+        filtered_gdf, resolution, bounding_box, adjust_boundaries
+    )
 
-    # Generate transform
-    transform = Affine.translation(minx, maxy) * Affine.scale(resolution, -resolution)
+    if cache is not None:
+        key = RasterizationCache.key(
+            filtered_gdf,
+            attribute,
+            values,
+            transform,
+            (nrows, ncols),
+            f"layers:{naming_pattern}",
+        )
+        cached = cache.get(key)
+        if cached is None:
+            cached = cache.put(
+                key,
+                rasterize_countries(
+                    filtered_gdf,
+                    values,
+                    attribute,
+                    resolution,
+                    bounding_box=bounding_box,
+                    naming_pattern=naming_pattern,
+                    adjust_boundaries=adjust_boundaries,
+                ),
+            )
+        return cached
 
-    # Compute chunk size to ensure maximum of 100 MB
-    dtype = np.int32  # Assumes int32 data type; adjust if necessary
-    bytes_per_pixel = np.dtype(dtype).itemsize
-    max_chunk_bytes = 100 * 1024 * 1024  # 100 MB
-    max_pixels_per_chunk = max_chunk_bytes // bytes_per_pixel
-    chunk_side_length = int(max_pixels_per_chunk**0.5)
-    chunk_size = (min(chunk_side_length, nrows), min(chunk_side_length, ncols))
+    chunk_size = _label_chunk_size(nrows, ncols, np.int32)
 
     country_arrays: Dict[str, xr.DataArray] = {}
 
@@ -219,13 +959,7 @@ def rasterize_countries(
         da_child_normalized = normalize_array(da_child)
 
         # Generate the layer name
-        if naming_pattern:
-            try:
-                layer_name = naming_pattern.format(code=code, attribute=attribute)
-            except KeyError:
-                layer_name = f"{attribute}_{code}"
-        else:
-            layer_name = f"{attribute}_{code}"
+        layer_name = _layer_name(naming_pattern, code, attribute)
 
         country_arrays[layer_name] = da_child_normalized
 
@@ -239,3 +973,140 @@ def rasterize_countries(
     )
 
     return country_codes_ds
+
+
+def _assert_same_crs(gdf: gpd.GeoDataFrame, bounding_box: gpd.GeoDataFrame):
+    if not gdf.crs.equals(bounding_box.crs):
+        raise ValueError(
+            f"CRS mismatch: GeoDataFrame CRS is '{gdf.crs}', "
+            f"but bounding box CRS is '{bounding_box.crs}'."
+        )
+
+
+def _file_hash(path: str, cache_dir: str) -> str:
+    """SHA-256 of the file content, memoized in the cache directory by path, size and mtime."""
+    stat = os.stat(path)
+    memo_path = os.path.join(cache_dir, "hashes.json")
+    memo_key = f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+    memo: Dict[str, str] = {}
+    if os.path.exists(memo_path):
+        try:
+            with open(memo_path) as f:
+                memo = json.load(f)
+        except (OSError, ValueError):
+            memo = {}
+    if memo_key in memo:
+        return memo[memo_key]
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    memo[memo_key] = digest.hexdigest()
+    tmp_path = f"{memo_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(memo, f)
+    os.replace(tmp_path, memo_path)
+    return memo[memo_key]
+
+
+def _simplified_column(tolerance: float) -> str:
+    return f"geometry_simplified_{tolerance:g}"
+
+
+def _clip_to_bounding_box(
+    gdf: gpd.GeoDataFrame, bounding_box: gpd.GeoDataFrame
+) -> gpd.GeoDataFrame:
+    """Clip to a bounding box GeoDataFrame, using the fast rectangle path when it is a box."""
+    mask = bounding_box.unary_union
+    if mask.equals(box(*mask.bounds)):
+        return clip_to_bounds(gdf, mask.bounds)
+    return gpd.clip(gdf, bounding_box)
+
+
+def _intersecting(
+    index: BoundaryIndex, positions: np.ndarray, bounding_box: gpd.GeoDataFrame
+) -> np.ndarray:
+    """Positions, among the given ones, of the geometries intersecting the bounding box."""
+    in_mask = index.tree.query(bounding_box.unary_union, predicate="intersects")
+    return np.intersect1d(positions, in_mask)
+
+
+def _boundary_fractions(
+    geometry, transform: Affine, shape: Tuple[int, int], method: str, supersample: int
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Rows, columns and covered fractions of the pixels crossed by the geometry boundary."""
+    nrows, ncols = shape
+    minx, miny, maxx, maxy = geometry.bounds
+    col_start, row_start = ~transform * (minx, maxy)
+    col_stop, row_stop = ~transform * (maxx, miny)
+    col_start, row_start = max(int(np.floor(col_start)), 0), max(int(np.floor(row_start)), 0)
+    col_stop, row_stop = min(int(np.ceil(col_stop)), ncols), min(int(np.ceil(row_stop)), nrows)
+    empty = (np.zeros(0, dtype=np.int64),) * 2 + (np.zeros(0, dtype=np.float32),)
+    if col_stop <= col_start or row_stop <= row_start:
+        return empty
+    window_shape = (row_stop - row_start, col_stop - col_start)
+    window_transform = transform * Affine.translation(col_start, row_start)
+    on_boundary = features.rasterize(
+        [(geometry.boundary, 1)],
+        out_shape=window_shape,
+        transform=window_transform,
+        fill=0,
+        all_touched=True,
+        dtype="uint8",
+    ).astype(bool)
+    rows, cols = np.nonzero(on_boundary)
+    if len(rows) == 0:
+        return empty
+    if method == "exact":
+        x0, y0 = window_transform * (cols, rows)
+        x1, y1 = window_transform * (cols + 1, rows + 1)
+        cells = shapely.box(
+            np.minimum(x0, x1), np.minimum(y0, y1), np.maximum(x0, x1), np.maximum(y0, y1)
+        )
+        fractions = shapely.area(shapely.intersection(cells, geometry)) / abs(
+            transform.a * transform.e
+        )
+    else:
+        fine = features.rasterize(
+            [(geometry, 1)],
+            out_shape=(window_shape[0] * supersample, window_shape[1] * supersample),
+            transform=window_transform * Affine.scale(1 / supersample),
+            fill=0,
+            dtype="uint8",
+        )
+        window_fractions = fine.reshape(
+            window_shape[0], supersample, window_shape[1], supersample
+        ).mean(axis=(1, 3))
+        fractions = window_fractions[rows, cols]
+    keep = fractions > 0
+    return (
+        rows[keep] + row_start,
+        cols[keep] + col_start,
+        np.clip(fractions[keep], 0, 1).astype(np.float32),
+    )
+
+
+def _label_dtype(n_categories: int):
+    """Smallest unsigned integer type holding labels 0 to n_categories."""
+    for dtype in (np.uint8, np.uint16, np.uint32):
+        if n_categories <= np.iinfo(dtype).max:
+            return dtype
+    raise ValueError("too many categories.")
+
+
+def _layer_name(naming_pattern: Optional[str], code, attribute: str) -> str:
+    if naming_pattern:
+        try:
+            return naming_pattern.format(code=code, attribute=attribute)
+        except KeyError:
+            return f"{attribute}_{code}"
+    return f"{attribute}_{code}"
+
+
+def _label_chunk_size(nrows: int, ncols: int, dtype) -> Tuple[int, int]:
+    """Chunk size ensuring a maximum of 100 MB per chunk."""
+    bytes_per_pixel = np.dtype(dtype).itemsize
+    max_chunk_bytes = 100 * 1024 * 1024  # 100 MB
+    max_pixels_per_chunk = max_chunk_bytes // bytes_per_pixel
+    chunk_side_length = int(max_pixels_per_chunk**0.5)
+    return (min(chunk_side_length, nrows), min(chunk_side_length, ncols))
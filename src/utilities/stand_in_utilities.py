@@ -0,0 +1,707 @@
+import hashlib
+import http.server
+import io
+import json
+import logging
+import random
+import re
+import threading
+import time
+import urllib.parse
+import uuid
+import zipfile
+from typing import Any, Dict, Iterable, Optional, Tuple
+from xml.sax.saxutils import escape
+
+import requests
+
+from src.utilities.copernicus_data_store_utilities import CDSClientPool
+
+logger = logging.getLogger(__name__)
+
+_S3_NAMESPACE = "http://s3.amazonaws.com/doc/2006-03-01/"
+
+
+class _Throttle:
+    """Bandwidth limit in bytes per second, shared by every caller of `wait`."""
+
+    def __init__(self, rate: Optional[float]):
+        self.rate = rate
+        self._lock = threading.Lock()
+        self._next = time.monotonic()
+
+    def wait(self, n: int):
+        if not self.rate:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._next = max(now, self._next) + n / self.rate
+            delay = self._next - now
+        time.sleep(delay)
+
+
+class StandInServer:
+    """Local HTTP server standing in for a remote service, for offline tests and benchmarks.
+
+    The server runs in a background thread (one thread per connection, with keep-alive) and can
+    emulate a slow or unreliable service: a fixed latency before every response, a fraction of
+    requests answered with 503, a fraction of bodies cut in the middle, and bandwidth limits per
+    connection and for the whole server.
+
+    Example:
+        >>> with RangeFileServer({"/a.bin": b"..."}, bandwidth=10e6) as server:
+        ...     download_file(f"{server.url}/a.bin", "downloads", "a.bin")
+
+    Args:
+        latency (float, optional): Seconds before every response. Defaults to 0.
+        failure_rate (float, optional): Fraction of requests answered with 503. Defaults to 0.
+        interrupt_rate (float, optional): Fraction of bodies closed half-way. Defaults to 0.
+        bandwidth (Optional[float], optional): Bytes per second of the whole server. Defaults to None.
+        connection_bandwidth (Optional[float], optional): Bytes per second of each response.
+                                                          Defaults to None.
+        seed (int, optional): Seed of the random failures. Defaults to 0.
+    """
+
+    handler_class: type = http.server.BaseHTTPRequestHandler
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        failure_rate: float = 0.0,
+        interrupt_rate: float = 0.0,
+        bandwidth: Optional[float] = None,
+        connection_bandwidth: Optional[float] = None,
+        seed: int = 0,
+    ):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.interrupt_rate = interrupt_rate
+        self.throttle = _Throttle(bandwidth)
+        self.connection_bandwidth = connection_bandwidth
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._active = 0
+        self.stats: Dict[str, int] = {}
+        self.reset_stats()
+        self._httpd: Optional[http.server.ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        if self._httpd is None:
+            raise ValueError("server not started.")
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "StandInServer":
+        self._httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), self.handler_class)
+        self._httpd.daemon_threads = True
+        self._httpd.stand_in = self  # type: ignore
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        logger.debug(f"{type(self).__name__} listening on {self.url}")
+        return self
+
+    def stop(self):
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def reset_stats(self):
+        """Zero the counters of requests, failures, interruptions, bytes sent and peak connections."""
+        with self._lock:
+            self.stats = {
+                "requests": 0,
+                "failures": 0,
+                "interruptions": 0,
+                "bytes_sent": 0,
+                "max_active": 0,
+            }
+
+    def chance(self, rate: float) -> bool:
+        with self._lock:
+            return rate > 0 and self._random.random() < rate
+
+    def count(self, name: str, n: int = 1):
+        with self._lock:
+            self.stats[name] = self.stats.get(name, 0) + n
+
+    def enter(self):
+        with self._lock:
+            self._active += 1
+            self.stats["requests"] += 1
+            self.stats["max_active"] = max(self.stats["max_active"], self._active)
+
+    def leave(self):
+        with self._lock:
+            self._active -= 1
+
+
+class _StandInHandler(http.server.BaseHTTPRequestHandler):
+    """Request handler shared by the stand-ins: dispatch, failures, Range requests and throttling."""
+
+    protocol_version = "HTTP/1.1"  # keep-alive
+
+    @property
+    def stand_in(self) -> StandInServer:
+        return self.server.stand_in  # type: ignore
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_HEAD(self):
+        self._dispatch("HEAD")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_PUT(self):
+        self._dispatch("PUT")
+
+    def do_DELETE(self):
+        self._dispatch("DELETE")
+
+    def handle_request(self, method: str, path: str, query: Dict[str, str]):
+        self.send_error(405)
+
+    def _dispatch(self, method: str):
+        stand_in = self.stand_in
+        stand_in.enter()
+        try:
+            if stand_in.latency:
+                time.sleep(stand_in.latency)
+            if stand_in.chance(stand_in.failure_rate):
+                stand_in.count("failures")
+                self.read_body()
+                self.send_response(503)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            parsed = urllib.parse.urlparse(self.path)
+            query = dict(urllib.parse.parse_qsl(parsed.query, keep_blank_values=True))
+            self.handle_request(method, urllib.parse.unquote(parsed.path), query)
+        finally:
+            stand_in.leave()
+
+    def read_body(self) -> bytes:
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            body = _read_chunks(self.rfile)
+        else:
+            body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if "aws-chunked" in self.headers.get("Content-Encoding", ""):
+            body = _decode_aws_chunked(body)
+        return body
+
+    def send_json(self, status: int, content: Any):
+        body = json.dumps(content).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_xml(self, status: int, body: str):
+        encoded = ('<?xml version="1.0" encoding="UTF-8"?>\n' + body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/xml")
+        self.send_header("Content-Length", str(len(encoded)))
+        self.end_headers()
+        self.wfile.write(encoded)
+
+    def send_content(
+        self,
+        content: bytes,
+        etag: str,
+        head: bool = False,
+        accept_ranges: bool = True,
+        headers: Optional[Dict[str, str]] = None,
+    ):
+        """Send content honouring Range and If-Range, throttled and possibly cut half-way."""
+        start, end = 0, len(content) - 1
+        range_header = self.headers.get("Range")
+        if_range = self.headers.get("If-Range")
+        status = 200
+        if accept_ranges and range_header and if_range in (None, etag):
+            match = re.match(r"bytes=(\d*)-(\d*)$", range_header.strip())
+            if match and match.group(1):
+                start = int(match.group(1))
+                end = min(int(match.group(2)), end) if match.group(2) else end
+            elif match and match.group(2):
+                start = max(len(content) - int(match.group(2)), 0)
+            if start >= len(content):
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{len(content)}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            status = 206
+        self.send_response(status)
+        if status == 206:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(content)}")
+        if accept_ranges:
+            self.send_header("Accept-Ranges", "bytes")
+        self.send_header("ETag", etag)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(end + 1 - start))
+        self.end_headers()
+        if head:
+            return
+        body = memoryview(content)[start : end + 1]
+        if self.stand_in.chance(self.stand_in.interrupt_rate):
+            self.stand_in.count("interruptions")
+            body = body[: len(body) // 2]
+            self.close_connection = True
+        self._write_throttled(body)
+
+    def _write_throttled(self, body: memoryview, block_size: int = 64 * 1024):
+        connection = _Throttle(self.stand_in.connection_bandwidth)
+        for offset in range(0, len(body), block_size):
+            block = body[offset : offset + block_size]
+            connection.wait(len(block))
+            self.stand_in.throttle.wait(len(block))
+            # counted before the write: the client may have everything before write returns
+            self.stand_in.count("bytes_sent", len(block))
+            try:
+                self.wfile.write(block)
+            except (BrokenPipeError, ConnectionResetError):
+                self.close_connection = True
+                return
+
+    def log_message(self, *args):
+        pass
+
+
+class _RangeFileHandler(_StandInHandler):
+    def handle_request(self, method: str, path: str, query: Dict[str, str]):
+        stand_in: RangeFileServer = self.stand_in  # type: ignore
+        content = stand_in.files.get(path)
+        if method not in ("GET", "HEAD"):
+            self.send_error(405)
+        elif content is None:
+            self.send_error(404)
+        else:
+            self.send_content(
+                content,
+                _etag(content),
+                head=method == "HEAD",
+                accept_ranges=stand_in.accept_ranges,
+            )
+
+
+class RangeFileServer(StandInServer):
+    """HTTP file server with Range support, standing in for the servers of `download_utilities`.
+
+    Args:
+        files (Optional[Dict[str, bytes]], optional): Content by URL path, e.g. {"/a.zip": b"..."}.
+                                                      Defaults to None.
+        accept_ranges (bool, optional): Whether Range requests are honoured. Defaults to True.
+        **kwargs: Latency, failures and bandwidth (see `StandInServer`).
+    """
+
+    handler_class = _RangeFileHandler
+
+    def __init__(
+        self,
+        files: Optional[Dict[str, bytes]] = None,
+        accept_ranges: bool = True,
+        **kwargs,
+    ):
+        super().__init__(**kwargs)
+        self.files: Dict[str, bytes] = dict(files or {})
+        self.accept_ranges = accept_ranges
+
+    def add_file(self, path: str, content: bytes) -> str:
+        """Serve content at path; returns its URL once the server is started."""
+        path = "/" + path.lstrip("/")
+        self.files[path] = content
+        return f"{self.url}{path}" if self._httpd is not None else path
+
+
+class _FakeCDSHandler(_StandInHandler):
+    def handle_request(self, method: str, path: str, query: Dict[str, str]):
+        stand_in: FakeCDSServer = self.stand_in  # type: ignore
+        match = re.search(r"/(resources|tasks|download)/([^/]+)$", path)
+        if match is None:
+            self.send_error(404)
+            return
+        kind, name = match.groups()
+        if kind == "resources" and method == "POST":
+            request = json.loads(self.read_body() or b"{}")
+            self.send_json(202, stand_in.submit(name, request))
+        elif kind == "tasks" and method == "GET":
+            reply = stand_in.reply(name, f"{self.stand_in.url}{path.rsplit('/tasks/', 1)[0]}")
+            if reply is None:
+                self.send_error(404)
+            else:
+                self.send_json(200, reply)
+        elif kind == "tasks" and method == "DELETE":
+            stand_in.delete(name)
+            self.send_response(204)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+        elif kind == "download" and method in ("GET", "HEAD"):
+            self.send_content(
+                stand_in.archive,
+                _etag(stand_in.archive),
+                head=method == "HEAD",
+                headers={"Content-Type": "application/zip"},
+            )
+        else:
+            self.send_error(405)
+
+
+class FakeCDSServer(StandInServer):
+    """Stand-in for the CDS API speaking the task protocol of the legacy `cdsapi` client.
+
+    A request posted to ".../resources/<dataset>" becomes a job that stays "queued" for a random
+    queue latency, then "running" for `run_time`, and ends "completed" (or "failed", for a fraction
+    `job_failure_rate` of the jobs). Its state is read from ".../tasks/<id>", its result (a zip
+    archive with one member of `result_size` bytes) downloaded from the reported location, and
+    the job freed with DELETE. Use `FakeCDSClientPool` to run `schedule_cds_downloads` against it.
+
+    Args:
+        queue_latency (Tuple[float, float], optional): Range of the time jobs spend queued, in seconds.
+                                                       Defaults to (0.1, 0.5).
+        run_time (float, optional): Seconds jobs spend running. Defaults to 0.1.
+        job_failure_rate (float, optional): Fraction of the jobs that fail. Defaults to 0.
+        result_size (int, optional): Size of the data in the result archives. Defaults to 1 MiB.
+        **kwargs: Latency, failures and bandwidth of the HTTP requests (see `StandInServer`).
+    """
+
+    handler_class = _FakeCDSHandler
+
+    def __init__(
+        self,
+        queue_latency: Tuple[float, float] = (0.1, 0.5),
+        run_time: float = 0.1,
+        job_failure_rate: float = 0.0,
+        result_size: int = 1024 * 1024,
+        **kwargs,
+    ):
+        super().__init__(**kwargs)
+        self.queue_latency = queue_latency
+        self.run_time = run_time
+        self.job_failure_rate = job_failure_rate
+        self.jobs: Dict[str, Dict[str, Any]] = {}
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_STORED) as archive:
+            archive.writestr("data_0.nc", random.Random(0).randbytes(result_size))
+        self.archive = buffer.getvalue()
+
+    def reset_stats(self):
+        super().reset_stats()
+        self.stats.update({"submitted": 0, "deleted": 0, "max_pending": 0})
+
+    def submit(self, dataset: str, request: Dict[str, Any]) -> Dict[str, Any]:
+        request_id = uuid.uuid4().hex
+        with self._lock:
+            queued = self._random.uniform(*self.queue_latency)
+            failed = self.job_failure_rate > 0 and self._random.random() < self.job_failure_rate
+            now = time.monotonic()
+            self.jobs[request_id] = {
+                "dataset": dataset,
+                "request": request,
+                "submitted": now,
+                "queued": queued,
+                "failed": failed,
+            }
+            pending = sum(
+                1 for job in self.jobs.values() if self._state(job, now) in ("queued", "running")
+            )
+            self.stats["submitted"] += 1
+            self.stats["max_pending"] = max(self.stats["max_pending"], pending)
+        return {"state": "queued", "request_id": request_id}
+
+    def reply(self, request_id: str, base_url: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self.jobs.get(request_id)
+            if job is None:
+                return None
+            state = self._state(job, time.monotonic())
+        reply: Dict[str, Any] = {"state": state, "request_id": request_id}
+        if state == "completed":
+            reply["location"] = f"{base_url}/download/{request_id}.zip"
+            reply["content_length"] = len(self.archive)
+            reply["content_type"] = "application/zip"
+        elif state == "failed":
+            reply["error"] = {"message": "job failed", "reason": "stand-in failure"}
+        return reply
+
+    def delete(self, request_id: str):
+        with self._lock:
+            if self.jobs.pop(request_id, None) is not None:
+                self.stats["deleted"] += 1
+
+    def _state(self, job: Dict[str, Any], now: float) -> str:
+        elapsed = now - job["submitted"]
+        if elapsed < job["queued"]:
+            return "queued"
+        if elapsed < job["queued"] + self.run_time:
+            return "running"
+        return "failed" if job["failed"] else "completed"
+
+
+class FakeCDSResult:
+    """Job of `FakeCDSClient`, with the interface of `cdsapi.api.Result`."""
+
+    def __init__(self, client: "FakeCDSClient", reply: Dict[str, Any]):
+        self.client = client
+        self.reply = reply
+
+    def update(self):
+        r = self.client.session.get(
+            f"{self.client.url}/tasks/{self.reply['request_id']}", timeout=self.client.timeout
+        )
+        r.raise_for_status()
+        self.reply = r.json()
+
+    def download(self, target: Optional[str] = None) -> str:
+        if self.reply.get("state") != "completed":
+            raise ValueError(f"job {self.reply.get('request_id')} is not completed.")
+        target = target or self.reply["location"].rsplit("/", 1)[-1]
+        with self.client.session.get(
+            self.reply["location"], stream=True, timeout=self.client.timeout
+        ) as r:
+            r.raise_for_status()
+            with open(target, "wb") as f:
+                for chunk in r.iter_content(chunk_size=1024 * 1024):
+                    f.write(chunk)
+        return target
+
+    def delete(self):
+        self.client.session.delete(
+            f"{self.client.url}/tasks/{self.reply['request_id']}", timeout=self.client.timeout
+        )
+
+
+class FakeCDSClient:
+    """Minimal client of `FakeCDSServer` with the interface of the legacy `cdsapi.Client`.
+
+    Args:
+        url (str): URL of the server.
+        key (Optional[str], optional): Ignored. Defaults to None.
+        wait_until_complete (bool, optional): Whether `retrieve` waits for the job. Defaults to True.
+        sleep_max (float, optional): Seconds between polls while waiting. Defaults to 0.1.
+        timeout (float, optional): Timeout of the HTTP requests. Defaults to 60.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        key: Optional[str] = None,
+        wait_until_complete: bool = True,
+        sleep_max: float = 0.1,
+        timeout: float = 60,
+        **kwargs,
+    ):
+        self.url = url.rstrip("/")
+        self.wait_until_complete = wait_until_complete
+        self.sleep_max = sleep_max
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def retrieve(
+        self, name: str, request: Dict[str, Any], target: Optional[str] = None
+    ) -> FakeCDSResult:
+        r = self.session.post(f"{self.url}/resources/{name}", json=request, timeout=self.timeout)
+        r.raise_for_status()
+        result = FakeCDSResult(self, r.json())
+        if not self.wait_until_complete:
+            return result
+        while result.reply["state"] in ("queued", "running"):
+            time.sleep(self.sleep_max)
+            result.update()
+        if result.reply["state"] == "failed":
+            error = result.reply.get("error", {})
+            raise Exception(f"{error.get('message')}. {error.get('reason')}.")
+        if target is not None:
+            result.download(target)
+        return result
+
+
+class FakeCDSClientPool(CDSClientPool):
+    """`CDSClientPool` creating `FakeCDSClient`s, to pass as `client_pool` to `schedule_cds_downloads`."""
+
+    def client(self):
+        client = getattr(self._local, "client", None)
+        if client is None:
+            url, key = self.credentials()
+            client = FakeCDSClient(url=url, key=key, **self.client_kwargs)
+            self._local.client = client
+        return client
+
+
+class _FakeS3Handler(_StandInHandler):
+    def handle_request(self, method: str, path: str, query: Dict[str, str]):
+        stand_in: FakeS3Server = self.stand_in  # type: ignore
+        bucket, _, key = path.lstrip("/").partition("/")
+        if not bucket:
+            self.send_error(404)
+        elif bucket not in stand_in.buckets:
+            if method == "PUT" and not key:
+                stand_in.buckets[bucket] = {}
+                self._send_empty(200)
+            else:
+                self._send_s3_error(404, "NoSuchBucket", bucket)
+        elif not key:
+            if method == "GET":
+                self._list_objects(bucket, query)
+            elif method in ("PUT", "HEAD"):
+                self._send_empty(200)
+            else:
+                self.send_error(405)
+        elif method == "PUT":
+            copy_source = self.headers.get("x-amz-copy-source")
+            body = self.read_body()
+            if copy_source is not None:
+                source_bucket, _, source_key = urllib.parse.unquote(
+                    copy_source.split("?", 1)[0]
+                ).lstrip("/").partition("/")
+                content = stand_in.buckets.get(source_bucket, {}).get(source_key)
+                if content is None:
+                    self._send_s3_error(404, "NoSuchKey", source_key)
+                    return
+                stand_in.buckets[bucket][key] = content
+                self.send_xml(
+                    200,
+                    f'<CopyObjectResult xmlns="{_S3_NAMESPACE}"><ETag>{escape(_etag(content))}'
+                    f"</ETag><LastModified>{_LAST_MODIFIED}</LastModified></CopyObjectResult>",
+                )
+            else:
+                stand_in.buckets[bucket][key] = body
+                self.send_response(200)
+                self.send_header("ETag", _etag(body))
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+        elif method in ("GET", "HEAD"):
+            content = stand_in.buckets[bucket].get(key)
+            if content is None:
+                if method == "HEAD":
+                    self._send_empty(404)
+                else:
+                    self._send_s3_error(404, "NoSuchKey", key)
+            else:
+                self.send_content(content, _etag(content), head=method == "HEAD")
+        elif method == "DELETE":
+            stand_in.buckets[bucket].pop(key, None)
+            self._send_empty(204)
+        else:
+            self.send_error(405)
+
+    def _list_objects(self, bucket: str, query: Dict[str, str]):
+        stand_in: FakeS3Server = self.stand_in  # type: ignore
+        prefix = query.get("prefix", "")
+        max_keys = min(int(query.get("max-keys", stand_in.page_size)), stand_in.page_size)
+        start_after = query.get("continuation-token") or query.get("start-after", "")
+        keys = sorted(k for k in stand_in.buckets[bucket] if k.startswith(prefix) and k > start_after)
+        page, truncated = keys[:max_keys], len(keys) > max_keys
+        contents = "".join(
+            f"<Contents><Key>{escape(key)}</Key><LastModified>{_LAST_MODIFIED}</LastModified>"
+            f"<ETag>{escape(_etag(stand_in.buckets[bucket][key]))}</ETag>"
+            f"<Size>{len(stand_in.buckets[bucket][key])}</Size>"
+            f"<StorageClass>STANDARD</StorageClass></Contents>"
+            for key in page
+        )
+        token = f"<NextContinuationToken>{escape(page[-1])}</NextContinuationToken>" if truncated else ""
+        self.send_xml(
+            200,
+            f'<ListBucketResult xmlns="{_S3_NAMESPACE}"><Name>{escape(bucket)}</Name>'
+            f"<Prefix>{escape(prefix)}</Prefix><KeyCount>{len(page)}</KeyCount>"
+            f"<MaxKeys>{max_keys}</MaxKeys><IsTruncated>{str(truncated).lower()}</IsTruncated>"
+            f"{token}{contents}</ListBucketResult>",
+        )
+
+    def _send_empty(self, status: int):
+        self.send_response(status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def _send_s3_error(self, status: int, code: str, resource: str):
+        self.send_xml(
+            status,
+            f"<Error><Code>{code}</Code><Message>{code}</Message>"
+            f"<Resource>{escape(resource)}</Resource></Error>",
+        )
+
+
+class FakeS3Server(StandInServer):
+    """In-memory S3-compatible endpoint (path-style) for the functions of `s3_utilities`.
+
+    Supports creating buckets, PutObject, CopyObject, GetObject (with Range), HeadObject,
+    DeleteObject and paginated ListObjectsV2, which is what boto3 needs for `copy_objects`,
+    `list_objects`, `sync_buckets` and `fast_copy`.
+
+    Args:
+        buckets (Iterable[str], optional): Buckets created at start. Defaults to ().
+        page_size (int, optional): Maximum keys per ListObjectsV2 page. Defaults to 1000.
+        **kwargs: Latency, failures and bandwidth (see `StandInServer`).
+    """
+
+    handler_class = _FakeS3Handler
+
+    def __init__(self, buckets: Iterable[str] = (), page_size: int = 1000, **kwargs):
+        super().__init__(**kwargs)
+        self.buckets: Dict[str, Dict[str, bytes]] = {name: {} for name in buckets}
+        self.page_size = page_size
+
+    def client(self, max_pool_connections: int = 32, max_attempts: int = 5):
+        """boto3 S3 client of the server, with dummy credentials and path-style addressing."""
+        import boto3
+        import botocore.client
+
+        return boto3.client(
+            "s3",
+            endpoint_url=self.url,
+            aws_access_key_id="stand-in",
+            aws_secret_access_key="stand-in",
+            region_name="us-east-1",
+            config=botocore.client.Config(
+                s3={"addressing_style": "path"},
+                max_pool_connections=max_pool_connections,
+                retries={"max_attempts": max_attempts, "mode": "standard"},
+            ),
+        )
+
+
+_LAST_MODIFIED = "2024-01-01T00:00:00.000Z"
+
+
+def _etag(content: bytes) -> str:
+    return f'"{hashlib.md5(content).hexdigest()}"'
+
+
+def _read_chunks(rfile) -> bytes:
+    """Body sent with Transfer-Encoding: chunked."""
+    body = b""
+    while True:
+        size = int(rfile.readline().split(b";")[0].strip() or b"0", 16)
+        if size == 0:
+            # trailers end with an empty line
+            while rfile.readline() not in (b"\r\n", b"\n", b""):
+                pass
+            return body
+        body += rfile.read(size)
+        rfile.readline()
+
+
+def _decode_aws_chunked(body: bytes) -> bytes:
+    """Payload of an "aws-chunked" body (chunks with signatures or trailing checksums)."""
+    data = b""
+    stream = io.BytesIO(body)
+    while True:
+        line = stream.readline()
+        if not line:
+            return data
+        size = int(line.split(b";")[0].strip() or b"0", 16)
+        if size == 0:
+            return data
+        data += stream.read(size)
+        stream.readline()
@@ -0,0 +1,274 @@
+import bisect
+import contextlib
+import json
+import os
+import threading
+import time
+from collections import deque
+from dataclasses import asdict, dataclass, field
+from typing import Deque, Dict, Iterator, List, Optional, Sequence
+
+TRANSFER_SOURCES = ("cds", "gee", "http", "s3")
+
+# upper bounds of the histogram buckets; a last +Inf bucket is implied
+DURATION_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+TTFB_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 1800)
+SIZE_BUCKETS = (1e3, 1e4, 1e5, 1e6, 1e7, 1e8, 1e9, 1e10)
+ATTEMPTS_BUCKETS = (1, 2, 3, 5, 10)
+# raw records kept besides the aggregated histograms, e.g. for the JSON export
+MAX_RECORDS = 10000
+
+
+@dataclass
+class TransferRecord:
+    """Measurements of one transfer.
+
+    Attributes:
+        source (str): One of TRANSFER_SOURCES.
+        name (str): File name or object key.
+        bytes (int): Bytes transferred.
+        ttfb (Optional[float]): Seconds until the first response (for CDS, until the request is served).
+        duration (float): Total seconds, including retries.
+        attempts (int): Number of attempts.
+        status (str): "ok", "error", "cached" or "skipped".
+        error (Optional[str]): Last error, if the transfer failed.
+    """
+
+    source: str
+    name: str
+    bytes: int = 0
+    ttfb: Optional[float] = None
+    duration: float = 0.0
+    attempts: int = 1
+    status: str = "ok"
+    error: Optional[str] = None
+
+
+class TransferTimer:
+    """Handle to instrument a transfer from inside `TransferTelemetry.transfer`."""
+
+    def __init__(self, record: TransferRecord):
+        self.record = record
+        self.start = time.perf_counter()
+
+    def attempt(self):
+        """Mark the start of an attempt."""
+        self.record.attempts += 1
+
+    def first_byte(self):
+        """Mark the first response; only the first call counts."""
+        if self.record.ttfb is None:
+            self.record.ttfb = time.perf_counter() - self.start
+
+    def add_bytes(self, n: int):
+        self.first_byte()
+        self.record.bytes += n
+
+    def set_status(self, status: str):
+        self.record.status = status
+
+
+class _Histogram:
+    """Bucket counts and sum of the values of a Prometheus histogram."""
+
+    def __init__(self, bounds: Sequence[float]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def add(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    def to_dict(self) -> Dict:
+        cumulative = 0
+        buckets = {}
+        for bound, count in zip([f"{b:g}" for b in self.bounds] + ["+Inf"], self.counts):
+            cumulative += count
+            buckets[bound] = cumulative
+        return {"buckets": buckets, "sum": float(self.sum), "count": cumulative}
+
+
+@dataclass
+class _SourceStats:
+    """Running totals and histogram counts of the records of one source."""
+
+    transfers: int = 0
+    status: Dict[str, int] = field(default_factory=dict)
+    bytes: int = 0
+    duration: float = 0.0
+    retries: int = 0
+    histograms: Dict[str, _Histogram] = field(
+        default_factory=lambda: {
+            "duration_seconds": _Histogram(DURATION_BUCKETS),
+            "ttfb_seconds": _Histogram(TTFB_BUCKETS),
+            "size_bytes": _Histogram(SIZE_BUCKETS),
+            "attempts": _Histogram(ATTEMPTS_BUCKETS),
+        }
+    )
+
+    def add(self, r: TransferRecord):
+        self.transfers += 1
+        self.status[r.status] = self.status.get(r.status, 0) + 1
+        self.bytes += r.bytes
+        self.retries += max(r.attempts - 1, 0)
+        if r.status in ("ok", "error"):
+            self.duration += r.duration
+            self.histograms["duration_seconds"].add(r.duration)
+            if r.ttfb is not None:
+                self.histograms["ttfb_seconds"].add(r.ttfb)
+            self.histograms["size_bytes"].add(r.bytes)
+            self.histograms["attempts"].add(r.attempts)
+
+
+class TransferTelemetry:
+    """Thread-safe collection of transfer records, aggregated into histograms by source.
+
+    The histograms and totals are updated as records arrive, so memory does not grow with the
+    number of transfers; only the last `max_records` raw records are kept.
+
+    Example:
+        >>> telemetry = get_telemetry()
+        >>> with telemetry.transfer("http", "file.nc") as transfer:
+        ...     transfer.attempt()
+        ...     transfer.add_bytes(1024)
+        >>> telemetry.export("metrics.prom")
+    """
+
+    def __init__(self, max_records: Optional[int] = MAX_RECORDS):
+        self._lock = threading.Lock()
+        self.max_records = max_records
+        self.records: Deque[TransferRecord] = deque(maxlen=max_records)
+        self._stats: Dict[str, _SourceStats] = {}
+        self._scopes: List["TransferTelemetry"] = []
+
+    @contextlib.contextmanager
+    def transfer(self, source: str, name: str) -> Iterator[TransferTimer]:
+        """Time a transfer; an exception escaping the block marks it as failed.
+
+        Args:
+            source (str): One of TRANSFER_SOURCES.
+            name (str): File name or object key.
+
+        Yields:
+            TransferTimer: Handle to report attempts, first byte, bytes and status.
+        """
+        if source not in TRANSFER_SOURCES:
+            raise ValueError(f"source {source} not in {TRANSFER_SOURCES}.")
+        timer = TransferTimer(TransferRecord(source, name, attempts=0))
+        try:
+            yield timer
+        except BaseException as exc:
+            timer.record.status = "error"
+            timer.record.error = f"{type(exc).__name__}: {exc}"
+            raise
+        finally:
+            timer.record.duration = time.perf_counter() - timer.start
+            timer.record.attempts = max(timer.record.attempts, 1)
+            self.record(timer.record)
+
+    def record(self, record: TransferRecord):
+        with self._lock:
+            self.records.append(record)
+            self._stats.setdefault(record.source, _SourceStats()).add(record)
+            scopes = list(self._scopes)
+        for scope in scopes:
+            scope.record(record)
+
+    @contextlib.contextmanager
+    def scope(self) -> Iterator["TransferTelemetry"]:
+        """Collect the records of one job apart, e.g. to export the metrics of that job only.
+
+        Records made while the block runs still reach this telemetry as well.
+
+        Yields:
+            TransferTelemetry: Telemetry holding only the records of the block.
+        """
+        scoped = TransferTelemetry(self.max_records)
+        with self._lock:
+            self._scopes.append(scoped)
+        try:
+            yield scoped
+        finally:
+            with self._lock:
+                self._scopes.remove(scoped)
+
+    def reset(self):
+        with self._lock:
+            self.records.clear()
+            self._stats = {}
+
+    def summary(self) -> Dict[str, Dict]:
+        """Per-source counts by status, totals and histograms of duration, time to first byte,
+        size and attempts (cumulative bucket counts keyed by upper bound, as in Prometheus)."""
+        with self._lock:
+            return {
+                source: {
+                    "transfers": stats.transfers,
+                    "status": dict(stats.status),
+                    "bytes": stats.bytes,
+                    "duration": stats.duration,
+                    "retries": stats.retries,
+                    "throughput": stats.bytes / stats.duration if stats.duration > 0 else 0.0,
+                    "histograms": {
+                        name: histogram.to_dict() for name, histogram in stats.histograms.items()
+                    },
+                }
+                for source, stats in sorted(self._stats.items())
+            }
+
+    def to_json(self, include_records: bool = False) -> str:
+        content: Dict = {"sources": self.summary()}
+        if include_records:
+            with self._lock:
+                content["records"] = [asdict(r) for r in self.records]
+        return json.dumps(content, indent=2)
+
+    def to_prometheus(self) -> str:
+        """Summary in the Prometheus text exposition format."""
+        lines = []
+        summary = self.summary()
+        lines.append("# TYPE download_transfers_total counter")
+        for source, stats in summary.items():
+            for status, count in sorted(stats["status"].items()):
+                lines.append(
+                    f'download_transfers_total{{source="{source}",status="{status}"}} {count}'
+                )
+        for metric, key in (
+            ("download_bytes_total", "bytes"),
+            ("download_retries_total", "retries"),
+        ):
+            lines.append(f"# TYPE {metric} counter")
+            for source, stats in summary.items():
+                lines.append(f'{metric}{{source="{source}"}} {stats[key]}')
+        for name in ("duration_seconds", "ttfb_seconds", "size_bytes", "attempts"):
+            metric = f"download_{name}"
+            lines.append(f"# TYPE {metric} histogram")
+            for source, stats in summary.items():
+                histogram = stats["histograms"][name]
+                for bound, count in histogram["buckets"].items():
+                    lines.append(f'{metric}_bucket{{source="{source}",le="{bound}"}} {count}')
+                lines.append(f'{metric}_sum{{source="{source}"}} {histogram["sum"]}')
+                lines.append(f'{metric}_count{{source="{source}"}} {histogram["count"]}')
+        return "\n".join(lines) + "\n"
+
+    def export(self, path: str):
+        """Write the metrics to a JSON file (".json", including the kept records) or a Prometheus text file."""
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        if path.endswith(".json"):
+            content = self.to_json(include_records=True)
+        else:
+            content = self.to_prometheus()
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+
+_telemetry = TransferTelemetry()
+
+
+def get_telemetry() -> TransferTelemetry:
+    """Telemetry shared by the downloaders of the package."""
+    return _telemetry
@@ -1,4 +1,4 @@
-from typing import Any, Dict, List, Tuple
+from typing import Any, Dict, List, Optional, Tuple
 
 import dask  # type: ignore
 import dask.array
@@ -125,6 +125,91 @@ def assert_sources_combinable(sources: List[xr.DataArray]):
         _assert_transforms_consistent(~transform0, ~transform)
 
 
+def create_zarr_parent(
+    store: Any,
+    path: str,
+    width: int,
+    height: int,
+    transform: Affine,
+    crs: str = "EPSG:4326",
+    index_values: List[float] = [0],
+    dtype: str = "float32",
+    chunks: Optional[Tuple[int, int, int]] = None,
+    shards: Optional[Tuple[int, int, int]] = None,
+    compressor: Optional[str] = "blosc-zstd",
+    clevel: int = 5,
+    fill_value: Any = np.nan,
+    overwrite: bool = False,
+) -> Tuple[xr.DataArray, zarr.core.Array]:
+    """Create a parent Zarr array on disk, ready to be filled by `add_children_to_parent`.
+
+    The array is written with the `transform_mat3x3`, `crs` and `index_values` attributes
+    expected by `data_array_from_zarr`; only metadata is written, so no chunk of the parent
+    is ever allocated in memory.
+
+    Args:
+        store (Any): Zarr store or path of the store/group.
+        path (str): Path of the array within the store.
+        width (int): Width of the parent array.
+        height (int): Height of the parent array.
+        transform (Affine): Affine transform of the parent.
+        crs (str, optional): Coordinate reference system. Defaults to "EPSG:4326".
+        index_values (List[float], optional): Values of the index dimension. Defaults to [0].
+        dtype (str, optional): Data type of the array. Defaults to "float32".
+        chunks (Optional[Tuple[int, int, int]], optional): Chunk shape (index, y, x). Defaults to
+                                                          one index per chunk and roughly 64 MB chunks.
+        shards (Optional[Tuple[int, int, int]], optional): Shard shape (index, y, x); must be a multiple
+                                                          of the chunk shape. Requires zarr>=3. Defaults to None.
+        compressor (Optional[str], optional): One of "blosc-zstd", "blosc-lz4", "zstd" or None.
+                                              Defaults to "blosc-zstd".
+        clevel (int, optional): Compression level. Defaults to 5.
+        fill_value (Any, optional): Fill value of chunks never written. Defaults to NaN.
+        overwrite (bool, optional): If True, replace an existing array at path. Defaults to False.
+
+    Returns:
+        Tuple[xr.DataArray, zarr.core.Array]: Parent data array with dimensions ["index", "y", "x"]
+        backed lazily by the Zarr array, and the Zarr array itself.
+    """
+    shape = (len(index_values), height, width)
+    if chunks is None:
+        chunks = _default_chunks(shape, np.dtype(dtype).itemsize)
+    if np.issubdtype(np.dtype(dtype), np.integer) and isinstance(fill_value, float):
+        fill_value = 0
+    mode = "w" if overwrite else "w-"
+    if _zarr_major_version() >= 3:
+        z = zarr.create_array(
+            store=store,
+            name=path,
+            shape=shape,
+            chunks=chunks,
+            shards=shards,
+            dtype=dtype,
+            compressors=_zarr_v3_compressors(compressor, clevel),
+            fill_value=fill_value,
+            overwrite=overwrite,
+        )
+    else:
+        if shards is not None:
+            raise ValueError("sharding requires zarr>=3.")
+        z = zarr.open_array(
+            store=store,
+            path=path,
+            mode=mode,
+            shape=shape,
+            chunks=chunks,
+            dtype=dtype,
+            compressor=zarr_v2_compressor(compressor, clevel),
+            fill_value=fill_value,
+        )
+    z.attrs["transform_mat3x3"] = list(transform)[:9]
+    z.attrs["crs"] = crs
+    z.attrs["index_values"] = [float(v) for v in index_values]
+    da = data_array_from_zarr(z)
+    if "latitude" in da.dims:
+        da = da.rename({"latitude": "y", "longitude": "x"})
+    return da, z
+
+
 def coords_from_extent(width: int, height: int, x_dim: str = "x", y_dim: str = "y"):
     affine = Affine(2 * 180 / width, 0, -180.0, 0, -2 * 90 / height, 90)
     return affine_to_coords(affine, width, height, x_dim, y_dim)
@@ -196,6 +281,31 @@ def global_crs_transform(width: int = 3600, height: int = 1800):
     return crs, affine
 
 
+def grid_cell_areas(
+    transform: Affine, height: int, geographic: bool = True
+) -> np.ndarray:
+    """Area of the cells of each row of a grid without rotation. For geographic grids the
+    area is in km² on a sphere of radius 6371 km, otherwise in squared CRS units.
+
+    Args:
+        transform (Affine): Affine transform.
+        height (int): Height of array.
+        geographic (bool, optional): True if the transform is in degrees. Defaults to True.
+
+    Returns:
+        np.ndarray: Cell area of each row, shape (height,).
+    """
+    if not geographic:
+        return np.full(height, abs(transform.a * transform.e))
+    earth_radius_km = 6371.0
+    lat_edges = np.radians(transform.f + np.arange(height + 1) * transform.e)
+    return (
+        earth_radius_km**2
+        * np.radians(abs(transform.a))
+        * np.abs(np.diff(np.sin(lat_edges)))
+    )
+
+
 def normalize_array(da: xr.DataArray) -> xr.DataArray:  # noqa: C901
     """Ensure that DataArray follows the conventions expected by downstream algorithms:
     - dimensions must be (index, latitude, longitude) or (index, y, x) in that order; 'index' is most often
@@ -274,8 +384,12 @@ def empty_data_array(
     transform: Affine,
     crs: str = "EPSG:4326",
     index_values: List[float] = [0],
+    dtype: str = "float64",
+    chunks: Any = "auto",
 ):
-    data = dask.array.empty(shape=[len(index_values), height, width])
+    data = dask.array.empty(
+        shape=[len(index_values), height, width], dtype=dtype, chunks=chunks
+    )
     return data_array(data, transform, crs, index_values)
 
 
@@ -283,6 +397,49 @@ def write_array(array: xr.DataArray, path: str):
     array.rio.to_raster(raster_path=path, driver="COG")
 
 
+def zarr_v2_compressor(compressor: Optional[str], clevel: int):
+    """numcodecs compressor for zarr v2 arrays: None, "zstd" or "blosc-<cname>" (bitshuffled)."""
+    from numcodecs import Blosc, Zstd  # type: ignore
+
+    if compressor is None:
+        return None
+    if compressor == "zstd":
+        return Zstd(level=clevel)
+    if compressor.startswith("blosc-"):
+        return Blosc(
+            cname=compressor.split("-", 1)[1], clevel=clevel, shuffle=Blosc.BITSHUFFLE
+        )
+    raise ValueError(f"unsupported compressor {compressor}.")
+
+
+def _default_chunks(
+    shape: Tuple[int, int, int], itemsize: int, target_bytes: int = 64 * 1024 * 1024
+) -> Tuple[int, int, int]:
+    """One index per chunk, square spatial chunks of approximately target_bytes."""
+    side = int((target_bytes // itemsize) ** 0.5)
+    return (1, min(side, shape[1]), min(side, shape[2]))
+
+
+def _zarr_major_version() -> int:
+    return int(zarr.__version__.split(".")[0])
+
+
+def _zarr_v3_compressors(compressor: Optional[str], clevel: int):
+    from zarr.codecs import BloscCodec, ZstdCodec  # type: ignore
+
+    if compressor is None:
+        return None
+    if compressor == "zstd":
+        return [ZstdCodec(level=clevel)]
+    if compressor.startswith("blosc-"):
+        return [
+            BloscCodec(
+                cname=compressor.split("-", 1)[1], clevel=clevel, shuffle="bitshuffle"
+            )
+        ]
+    raise ValueError(f"unsupported compressor {compressor}.")
+
+
 def _assert_transforms_consistent(trans1: Affine, trans2: Affine):
     """Check transforms from (x, y)/(lon, lat) to (col, row) are consistent. If same point maps
     to (col, row) offset by integer amount then a parent array can be assembled from offset childen
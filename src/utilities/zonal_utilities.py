@@ -0,0 +1,224 @@
+from typing import Dict, List, Optional, Sequence
+
+import dask
+import dask.array
+import geopandas as gpd
+import numpy as np
+import xarray as xr
+
+from src.utilities.regrid_utilities import spatial_dims, transform_from_coords
+from src.utilities.shapefiles_utilities import rasterize_labels
+from src.utilities.xarray_utilities import grid_cell_areas
+
+ZONAL_STATISTICS = ("sum", "mean", "min", "max", "count", "area_weighted_mean")
+
+# partial results accumulated per zone; min/max are combined with minimum/maximum, the rest added
+_PARTIALS = ("sum", "count", "weighted_sum", "weight", "min", "max")
+
+
+def zonal_statistics(
+    da: xr.DataArray,
+    labels: xr.DataArray,
+    statistics: Sequence[str] = ("mean",),
+    categories: Optional[List] = None,
+    weights: Optional[xr.DataArray] = None,
+) -> xr.Dataset:
+    """Compute statistics of a raster for every zone of a label raster in a single pass.
+
+    Each chunk of `da` is reduced against the matching chunk of `labels` with sort-and-reduce
+    (bincount-style) operations, giving per-zone partial sums, counts, minima and maxima for
+    every slice of the leading dimension; partials are then combined across chunks. The data
+    is therefore read once, whatever the number of zones.
+
+    Args:
+        da (xr.DataArray): Data with dims (y, x), (latitude, longitude) or (lat, lon), optionally
+                           preceded by one further dimension (e.g. index or time).
+        labels (xr.DataArray): Integer label raster on the same grid as da; label 0 is ignored.
+                               Typically obtained from `rasterize_labels`.
+        statistics (Sequence[str], optional): Any of "sum", "mean", "min", "max", "count" and
+                                              "area_weighted_mean". Defaults to ("mean",).
+        categories (Optional[List], optional): Names of the zones with labels 1, 2, ...
+                                               Defaults to labels.attrs["categories"].
+        weights (Optional[xr.DataArray], optional): Extra weights (e.g. crop harvested area) on the
+                                                    grid of da, multiplying the cell areas used for
+                                                    "area_weighted_mean". Defaults to None.
+
+    Returns:
+        xr.Dataset: One variable per statistic with dims ([leading dim], "zone").
+    """
+    for stat in statistics:
+        if stat not in ZONAL_STATISTICS:
+            raise ValueError(f"statistic {stat} not in {ZONAL_STATISTICS}.")
+    if categories is None:
+        categories = labels.attrs.get("categories")
+    n_zones = len(categories) if categories is not None else int(labels.max())
+
+    y_dim, x_dim = spatial_dims(da)
+    other_dims = [d for d in da.dims if d not in (y_dim, x_dim)]
+    if len(other_dims) > 1:
+        raise ValueError("at most one dimension in addition to the spatial ones expected.")
+    label_y_dim, label_x_dim = spatial_dims(labels)
+    if labels.sizes[label_y_dim] != da.sizes[y_dim] or labels.sizes[
+        label_x_dim
+    ] != da.sizes[x_dim]:
+        raise ValueError("labels and data arrays have different shapes.")
+
+    data = dask.array.asarray(da.transpose(*other_dims, y_dim, x_dim).data)
+    if not other_dims:
+        data = data[np.newaxis, :, :]
+    spatial_chunks = data.chunks[1:]
+    label_data = dask.array.asarray(
+        labels.transpose(label_y_dim, label_x_dim).data
+    ).rechunk(spatial_chunks)
+
+    transform = transform_from_coords(da[x_dim].values, da[y_dim].values)
+    crs = da.rio.crs
+    row_areas = grid_cell_areas(
+        transform, da.sizes[y_dim], geographic=crs is None or crs.is_geographic
+    )
+    cell_weights = dask.array.from_array(
+        np.broadcast_to(row_areas[:, np.newaxis], (da.sizes[y_dim], da.sizes[x_dim])),
+        chunks=spatial_chunks,
+    )
+    if weights is not None:
+        weights_y_dim, weights_x_dim = spatial_dims(weights)
+        extra = dask.array.asarray(
+            weights.transpose(weights_y_dim, weights_x_dim).data
+        ).rechunk(spatial_chunks)
+        cell_weights = cell_weights * dask.array.nan_to_num(extra)
+
+    data_blocks = data.to_delayed()
+    label_blocks = label_data.to_delayed()
+    weight_blocks = cell_weights.to_delayed()
+    block_results = []
+    for i in range(data.numblocks[0]):
+        partials = [
+            dask.delayed(_block_partials)(
+                data_blocks[i, j, k], label_blocks[j, k], weight_blocks[j, k], n_zones
+            )
+            for j in range(data.numblocks[1])
+            for k in range(data.numblocks[2])
+        ]
+        block_results.append(dask.delayed(_combine_partials)(partials))
+    (results,) = dask.compute(block_results)
+    totals = {
+        name: np.concatenate([r[name] for r in results], axis=0) for name in _PARTIALS
+    }
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        derived = {
+            "sum": np.where(totals["count"] > 0, totals["sum"], np.nan),
+            "mean": totals["sum"] / totals["count"],
+            "min": np.where(totals["count"] > 0, totals["min"], np.nan),
+            "max": np.where(totals["count"] > 0, totals["max"], np.nan),
+            "count": totals["count"],
+            "area_weighted_mean": totals["weighted_sum"] / totals["weight"],
+        }
+
+    zone_coord = categories if categories is not None else np.arange(1, n_zones + 1)
+    dims = other_dims + ["zone"]
+    coords: Dict = {"zone": zone_coord}
+    if other_dims and other_dims[0] in da.coords:
+        coords[other_dims[0]] = da[other_dims[0]].values
+    data_vars = {}
+    for stat in statistics:
+        # drop label 0 (outside every zone)
+        values = derived[stat][:, 1:]
+        data_vars[stat] = (dims, values if other_dims else values[0])
+    return xr.Dataset(data_vars=data_vars, coords=coords)
+
+
+def zonal_statistics_by_gdf(
+    da: xr.DataArray,
+    gdf: gpd.GeoDataFrame,
+    attribute: str,
+    values: List[str],
+    statistics: Sequence[str] = ("mean",),
+    weights: Optional[xr.DataArray] = None,
+) -> xr.Dataset:
+    """Rasterize the categories of a GeoDataFrame onto the grid of a data array and compute
+    zonal statistics for every category in one pass (see `zonal_statistics`).
+
+    Args:
+        da (xr.DataArray): Data array, e.g. monthly climate data with dims (time, latitude, longitude).
+        gdf (gpd.GeoDataFrame): GeoDataFrame in the CRS of the data array.
+        attribute (str): Column name for category codes in the GeoDataFrame.
+        values (List[str]): List of category codes, e.g. country ISO codes.
+        statistics (Sequence[str], optional): Statistics to compute. Defaults to ("mean",).
+        weights (Optional[xr.DataArray], optional): Extra weights for "area_weighted_mean". Defaults to None.
+
+    Returns:
+        xr.Dataset: One variable per statistic with dims ([leading dim], "zone").
+    """
+    y_dim, x_dim = spatial_dims(da)
+    transform = transform_from_coords(da[x_dim].values, da[y_dim].values)
+    if transform.e > 0:
+        raise ValueError("latitude should be decreasing; use normalize_array first.")
+    labels = rasterize_labels(
+        gdf,
+        values,
+        attribute,
+        transform=transform,
+        shape=(da.sizes[y_dim], da.sizes[x_dim]),
+    )
+    return zonal_statistics(da, labels, statistics=statistics, weights=weights)
+
+
+def _block_partials(
+    values: np.ndarray, labels: np.ndarray, weights: np.ndarray, n_zones: int
+) -> Dict[str, np.ndarray]:
+    """Per-zone partial statistics of one block. values has shape (n, rows, cols) and labels
+    and weights (rows, cols); results have shape (n, n_zones + 1)."""
+    n = values.shape[0]
+    flat_labels = labels.ravel().astype(np.int64)
+    # labels outside 1..n_zones go to the ignored zone 0, so no segment absorbs their pixels
+    flat_labels[(flat_labels < 0) | (flat_labels > n_zones)] = 0
+    order = np.argsort(flat_labels, kind="stable")
+    sorted_labels = flat_labels[order]
+    zones, starts = np.unique(sorted_labels, return_index=True)
+
+    sorted_values = values.reshape(n, -1)[:, order]
+    sorted_weights = weights.ravel()[order]
+    valid = np.isfinite(sorted_values)
+    filled = np.where(valid, sorted_values, 0.0)
+
+    partials = {
+        "sum": np.zeros((n, n_zones + 1)),
+        "count": np.zeros((n, n_zones + 1)),
+        "weighted_sum": np.zeros((n, n_zones + 1)),
+        "weight": np.zeros((n, n_zones + 1)),
+        "min": np.full((n, n_zones + 1), np.inf),
+        "max": np.full((n, n_zones + 1), -np.inf),
+    }
+    if len(zones) == 0:
+        return partials
+    partials["sum"][:, zones] = np.add.reduceat(filled, starts, axis=1)
+    partials["count"][:, zones] = np.add.reduceat(
+        valid.astype(np.float64), starts, axis=1
+    )
+    partials["weighted_sum"][:, zones] = np.add.reduceat(
+        filled * sorted_weights, starts, axis=1
+    )
+    partials["weight"][:, zones] = np.add.reduceat(
+        valid * sorted_weights, starts, axis=1
+    )
+    partials["min"][:, zones] = np.minimum.reduceat(
+        np.where(valid, sorted_values, np.inf), starts, axis=1
+    )
+    partials["max"][:, zones] = np.maximum.reduceat(
+        np.where(valid, sorted_values, -np.inf), starts, axis=1
+    )
+    return partials
+
+
+def _combine_partials(partials: List[Dict[str, np.ndarray]]) -> Dict[str, np.ndarray]:
+    combined = dict(partials[0])
+    for partial in partials[1:]:
+        for name in _PARTIALS:
+            if name == "min":
+                combined[name] = np.minimum(combined[name], partial[name])
+            elif name == "max":
+                combined[name] = np.maximum(combined[name], partial[name])
+            else:
+                combined[name] = combined[name] + partial[name]
+    return combined
@@ -0,0 +1,93 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+rasterio = pytest.importorskip("rasterio")
+xr = pytest.importorskip("xarray")
+pytest.importorskip("rioxarray")
+pytest.importorskip("zarr")
+
+from rasterio.transform import from_origin  # noqa: E402
+
+from src.utilities.GEE_stacking import (  # noqa: E402
+    plan_period_stacks,
+    split_stacked_raster,
+    stacked_band_name,
+    stacked_raster_to_zarr,
+    stored_times,
+)
+
+
+def _write_stack(path, n_bands, offset=0):
+    """Stacked GeoTIFF whose band i is filled with offset + i."""
+    data = np.stack([np.full((6, 8), offset + i, dtype="float32") for i in range(n_bands)])
+    with rasterio.open(
+        path,
+        "w",
+        driver="GTiff",
+        width=8,
+        height=6,
+        count=n_bands,
+        dtype="float32",
+        crs="EPSG:4326",
+        transform=from_origin(0, 6, 1, 1),
+    ) as dst:
+        dst.write(data)
+    return str(path)
+
+
+def test_stacks_hold_every_band_of_their_periods():
+    months = [f"2020_{m:02d}" for m in range(1, 13)]
+    stacks = plan_period_stacks(months, n_bands=5, max_bands=24)
+    assert [len(s) for s in stacks] == [4, 4, 4]
+    assert sum(stacks, []) == months
+    # a period never gets split, even above max_bands
+    assert plan_period_stacks(months[:2], n_bands=30, max_bands=24) == [[months[0]], [months[1]]]
+    assert stacked_band_name("NDVI", "2020_01") == "NDVI_2020_01"
+    assert stacked_band_name("NDVI", "") == "NDVI"
+
+
+def test_split_stacked_raster_writes_one_file_per_band(tmp_path):
+    stacked = _write_stack(tmp_path / "stack.tif", 3)
+    outputs = [str(tmp_path / "out" / f"band_{i}.tif") for i in range(3)]
+    assert split_stacked_raster(stacked, outputs) == outputs
+    for i, path in enumerate(outputs):
+        with rasterio.open(path) as src:
+            assert src.count == 1
+            assert src.crs.to_epsg() == 4326
+            assert (src.read(1) == i).all()
+    with pytest.raises(ValueError):
+        split_stacked_raster(stacked, outputs[:2])
+
+
+def test_stacked_rasters_are_appended_to_a_zarr_cube(tmp_path):
+    store = str(tmp_path / "cube.zarr")
+    first = _write_stack(tmp_path / "first.tif", 4)
+    second = _write_stack(tmp_path / "second.tif", 2, offset=10)
+    layers = [("a", "2020-01-01"), ("b", "2020-01-01"), ("a", "2020-02-01"), ("b", "2020-02-01")]
+    stacked_raster_to_zarr(first, layers, store, group="ES")
+    stacked_raster_to_zarr(second, [("a", "2020-03-01"), ("b", "2020-03-01")], store, group="ES")
+
+    cube = xr.open_zarr(store, group="ES")
+    assert cube["a"].dims == ("time", "y", "x")
+    assert cube.sizes == {"time": 3, "y": 6, "x": 8}
+    assert cube["a"].isel(x=0, y=0).values.tolist() == [0, 2, 10]
+    assert cube["b"].isel(x=0, y=0).values.tolist() == [1, 3, 11]
+    assert str(cube.time.values[-1])[:10] == "2020-03-01"
+
+
+def test_times_already_in_the_cube_are_not_appended_again(tmp_path):
+    store = str(tmp_path / "cube.zarr")
+    first = _write_stack(tmp_path / "first.tif", 4)
+    layers = [("a", "2020-01-01"), ("b", "2020-01-01"), ("a", "2020-02-01"), ("b", "2020-02-01")]
+    stacked_raster_to_zarr(first, layers, store, group="ES", chunk_size=4)
+    assert stored_times(store, "ES") == [np.datetime64("2020-01-01"), np.datetime64("2020-02-01")]
+    cube = stacked_raster_to_zarr(first, layers, store, group="ES", chunk_size=4)
+    assert cube.sizes["time"] == 2
+    assert cube["a"].encoding["chunks"] == (1, 4, 4)
+
+    # a stack overlapping the cube only adds its new times
+    second = _write_stack(tmp_path / "second.tif", 4, offset=10)
+    overlap = [("a", "2020-02-01"), ("b", "2020-02-01"), ("a", "2020-03-01"), ("b", "2020-03-01")]
+    cube = stacked_raster_to_zarr(second, overlap, store, group="ES", chunk_size=4)
+    assert cube["a"].isel(x=0, y=0).values.tolist() == [0, 2, 12]
+    assert stored_times(store, "missing") == []
@@ -0,0 +1,211 @@
+import json
+import os
+import threading
+import time
+
+import pytest
+
+np = pytest.importorskip("numpy")
+rasterio = pytest.importorskip("rasterio")
+shapely = pytest.importorskip("shapely")
+
+from affine import Affine  # noqa: E402
+from shapely.geometry import MultiPolygon, box  # noqa: E402
+
+from src.utilities.GEE_tiling import (  # noqa: E402
+    GEETaskGraph,
+    download_gee_tiles,
+    pixel_size_for_scale,
+    plan_gee_tiles,
+    tile_side_pixels,
+)
+from src.utilities.stand_in_utilities import RangeFileServer  # noqa: E402
+
+
+def test_tiles_fit_the_request_limits():
+    # 48 MiB per request with a 10% margin, rounded down to multiples of 256 pixels
+    assert tile_side_pixels(dtype="uint8") == 6656
+    assert tile_side_pixels(n_bands=4, dtype="float64") == 1024
+    assert tile_side_pixels(dtype="uint8", max_bytes=10**12) == 9984
+
+
+def test_tiles_are_grid_aligned_and_skip_empty_cells():
+    # two islands far apart: the cells between them are not requested
+    islands = MultiPolygon([box(0.1, 0.1, 0.9, 0.9), box(7.2, 7.2, 7.9, 7.7)])
+    pixel_size = pixel_size_for_scale(1000)
+    tiles = plan_gee_tiles(islands, 1000, dtype="float64", max_bytes=256 * 256 * 8)
+    side = tile_side_pixels(dtype="float64", max_bytes=256 * 256 * 8)
+    tile_size = side * pixel_size
+    assert [(t.col, t.row) for t in tiles] == [(0, 0), (3, 3)]
+    for tile in tiles:
+        assert 0 < tile.width <= side and 0 < tile.height <= side
+        minx, miny, maxx, maxy = tile.bounds
+        assert box(*tile.bounds).intersects(islands)
+        # edges on the pixel grid and inside the tile cell
+        for edge in tile.bounds:
+            assert abs(edge / pixel_size - round(edge / pixel_size)) < 1e-6
+        assert minx >= tile.col * tile_size - 1e-9 and maxx <= (tile.col + 1) * tile_size + 1e-9
+    covered = sum(t.width * t.height for t in tiles) * pixel_size**2
+    assert covered < 0.5 * (7.9 - 0.1) * (7.7 - 0.1)
+    assert tiles[0].download_params("EPSG:4326")["dimensions"] == f"{tiles[0].width}x{tiles[0].height}"
+
+
+def _fake_download(url, directory, filename, source=None, max_attempts=None):
+    """Write the GeoTIFF Earth Engine would return for the parameters encoded in url."""
+    params = json.loads(url)
+    width, height = (int(v) for v in params["dimensions"].split("x"))
+    transform = Affine(*params["crs_transform"])
+    with rasterio.open(
+        os.path.join(directory, filename),
+        "w",
+        driver="GTiff",
+        width=width,
+        height=height,
+        count=1,
+        dtype="float32",
+        crs=params["crs"],
+        transform=transform,
+        nodata=-1,
+    ) as dst:
+        dst.write(np.full((1, height, width), 7, dtype="float32"))
+
+
+class _FakeImage:
+    def __init__(self):
+        self.requests = []
+
+    def getDownloadURL(self, params):
+        self.requests.append(params)
+        return json.dumps(params)
+
+
+def test_tiles_are_downloaded_and_mosaicked(tmp_path):
+    region = box(0.0, 0.0, 0.5, 0.3)
+    tiles = plan_gee_tiles(region, 1000, dtype="float32", max_bytes=16 * 16 * 4)
+    assert len(tiles) > 4
+    image = _FakeImage()
+    output = str(tmp_path / "mosaic.tif")
+    assert download_gee_tiles(image, tiles, output, nodata=-1, download=_fake_download) == output
+
+    assert len(image.requests) == len(tiles)
+    assert not os.path.exists(output + ".tiles")
+    pixel_size = pixel_size_for_scale(1000)
+    with rasterio.open(output) as src:
+        assert src.res == pytest.approx((pixel_size, pixel_size))
+        assert src.bounds.left == pytest.approx(0.0)
+        assert src.bounds.top == pytest.approx(max(t.bounds[3] for t in tiles))
+        assert (src.read(1) == 7).all()
+
+
+class _FlakyDownload:
+    """Fails the first attempt of every other tile and records the overlap of the downloads."""
+
+    def __init__(self, delay=0.02):
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.attempts = {}
+        self.active = 0
+        self.max_active = 0
+
+    def __call__(self, url, directory, filename, source=None, max_attempts=None):
+        key = (directory, filename)
+        with self.lock:
+            self.attempts[key] = self.attempts.get(key, 0) + 1
+            fail = self.attempts[key] == 1 and len(self.attempts) % 2 == 1
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            time.sleep(self.delay)
+            if fail:
+                raise IOError("503")
+            _fake_download(url, directory, filename, source)
+        finally:
+            with self.lock:
+                self.active -= 1
+
+
+def test_task_graph_runs_tiles_of_every_image_together(tmp_path):
+    tiles = plan_gee_tiles(box(0.0, 0.0, 0.2, 0.2), 1000, dtype="float32", max_bytes=16 * 16 * 4)
+    download = _FlakyDownload()
+    graph = GEETaskGraph(max_workers=8, retry_delay=0.01, download=download)
+    merged = []
+    previous = []
+    for month in range(1, 4):
+        output = str(tmp_path / f"image_{month}.tif")
+        job = graph.add_image(
+            _FakeImage(), tiles, output, nodata=-1, on_done=merged.append, depends_on=previous
+        )
+        previous = [job]
+    jobs = graph.run()
+
+    assert [job.state for job in jobs] == ["done"] * 3
+    # the months are downloaded side by side, but merged in dependency order
+    assert len(tiles) < 8 < 3 * len(tiles)
+    assert download.max_active == 8
+    assert merged == [job.output_path for job in jobs]
+    assert max(download.attempts.values()) == 2
+    for job in jobs:
+        assert not os.path.exists(job.output_path + ".tiles")
+        with rasterio.open(job.output_path) as src:
+            assert (src.read(1) == 7).all()
+
+
+def test_task_graph_fails_dependents_of_failed_images(tmp_path):
+    tiles = plan_gee_tiles(box(0.0, 0.0, 0.1, 0.1), 1000, dtype="float32", max_bytes=16 * 16 * 4)
+
+    def broken(url, directory, filename, source=None, max_attempts=None):
+        raise IOError("403")
+
+    graph = GEETaskGraph(max_workers=2, max_attempts=2, retry_delay=0.01, download=broken)
+    first = graph.add_image(_FakeImage(), tiles, str(tmp_path / "a.tif"))
+    second = graph.add_image(_FakeImage(), tiles, str(tmp_path / "b.tif"), depends_on=[first])
+    graph.run()
+    assert first.state == "failed" and isinstance(first.error, IOError)
+    assert second.state == "failed"
+
+
+class _ServedImage:
+    """Image whose tiles are all served at url."""
+
+    def __init__(self, url):
+        self.url = url
+
+    def getDownloadURL(self, params):
+        return self.url
+
+
+def test_failed_tiles_are_retried_by_the_graph_not_in_the_worker(tmp_path, monkeypatch):
+    tiles = plan_gee_tiles(box(0.0, 0.0, 0.05, 0.05), 1000, dtype="float32")
+    assert len(tiles) == 1
+    tile_path = tmp_path / "tile.tif"
+    _fake_download(json.dumps(tiles[0].download_params("EPSG:4326")), str(tmp_path), "tile.tif")
+
+    slept_in_workers = []
+    sleep = time.sleep
+
+    def record_sleep(seconds):
+        if threading.current_thread().name.startswith("ThreadPoolExecutor"):
+            slept_in_workers.append(seconds)
+        sleep(seconds)
+
+    monkeypatch.setattr(time, "sleep", record_sleep)
+    with RangeFileServer({"/tile.tif": tile_path.read_bytes()}, failure_rate=0.5, seed=1) as server:
+        graph = GEETaskGraph(max_workers=2, max_attempts=20, retry_delay=0.01)
+        image = _ServedImage(f"{server.url}/tile.tif")
+        for month in range(4):
+            graph.add_image(image, tiles, str(tmp_path / f"{month}.tif"))
+        jobs = graph.run()
+        assert server.stats["failures"] > 0
+    assert [job.state for job in jobs] == ["done"] * 4
+    assert slept_in_workers == []
+
+
+def test_download_gee_tiles_keeps_one_retry_layer(tmp_path):
+    requests = pytest.importorskip("requests")
+    tiles = plan_gee_tiles(box(0.0, 0.0, 0.05, 0.05), 1000, dtype="float32")
+    with RangeFileServer({"/tile.tif": b"unused"}, failure_rate=1.0) as server:
+        with pytest.raises(requests.HTTPError):
+            download_gee_tiles(
+                _ServedImage(f"{server.url}/tile.tif"), tiles, str(tmp_path / "a.tif"), max_attempts=3
+            )
+        assert server.stats["requests"] == 3
@@ -0,0 +1,104 @@
+import importlib
+import json
+import os
+import sys
+import types
+
+import pytest
+
+np = pytest.importorskip("numpy")
+rasterio = pytest.importorskip("rasterio")
+gpd = pytest.importorskip("geopandas")
+
+from affine import Affine  # noqa: E402
+from shapely.geometry import box  # noqa: E402
+
+
+class _FakeImage:
+    """Stands for both ee.ImageCollection and ee.Image: every step returns the same object."""
+
+    def __init__(self, requests):
+        self.requests = requests
+
+    def select(self, band):
+        return self
+
+    def filterDate(self, start, end):
+        return self
+
+    def mosaic(self):
+        return self
+
+    def reproject(self, crs, scale):
+        return self
+
+    def getDownloadURL(self, params):
+        self.requests.append(params)
+        return json.dumps(params)
+
+
+def _fake_download(url, directory, filename, source=None, max_attempts=None):
+    """Write the GeoTIFF Earth Engine would return for the parameters encoded in url."""
+    params = json.loads(url)
+    width, height = (int(v) for v in params["dimensions"].split("x"))
+    with rasterio.open(
+        os.path.join(directory, filename),
+        "w",
+        driver="GTiff",
+        width=width,
+        height=height,
+        count=1,
+        dtype="float32",
+        crs=params["crs"],
+        transform=Affine(*params["crs_transform"]),
+        nodata=-1,
+    ) as dst:
+        dst.write(np.full((1, height, width), 7, dtype="float32"))
+
+
+@pytest.fixture
+def gee_utilities(monkeypatch):
+    """GEE_utilities imported with fake ee and google.oauth2 modules."""
+    requests = []
+    ee = types.ModuleType("ee")
+    ee.ImageCollection = lambda collection: _FakeImage(requests)
+    oauth2 = types.ModuleType("google.oauth2")
+    oauth2.service_account = types.ModuleType("google.oauth2.service_account")
+    monkeypatch.setitem(sys.modules, "ee", ee)
+    monkeypatch.setitem(sys.modules, "google", types.ModuleType("google"))
+    monkeypatch.setitem(sys.modules, "google.oauth2", oauth2)
+    monkeypatch.setitem(sys.modules, "google.oauth2.service_account", oauth2.service_account)
+    monkeypatch.delitem(sys.modules, "src.utilities.GEE_utilities", raising=False)
+    module = importlib.import_module("src.utilities.GEE_utilities")
+    monkeypatch.setattr(module, "download_file", _fake_download)
+    module.requests = requests
+    yield module
+    sys.modules.pop("src.utilities.GEE_utilities", None)
+
+
+def test_single_collection_downloads_the_tiles_of_every_year(gee_utilities, tmp_path):
+    # a region given in metres is tiled in the CRS of the download
+    gdf = gpd.GeoDataFrame({"code": ["ES"]}, geometry=[box(0.0, 0.0, 0.4, 0.3)], crs="EPSG:4326")
+    gdf = gdf.to_crs("EPSG:3857")
+    gee_utilities.download_gee_data_single_collection(
+        gdf,
+        "code",
+        "MODIS/061/MOD13A1",
+        "NDVI",
+        [2020, 2021],
+        str(tmp_path),
+        scale=1000,
+        max_workers=3,
+        dtype="float32",
+        max_request_bytes=16 * 16 * 4,
+    )
+
+    assert len(gee_utilities.requests) > 2
+    assert {params["crs"] for params in gee_utilities.requests} == {"EPSG:4326"}
+    for year in (2020, 2021):
+        path = tmp_path / "ES" / f"MOD13A1_NDVI_{year}_ES.tif"
+        with rasterio.open(path) as src:
+            assert src.crs.to_epsg() == 4326
+            assert src.bounds.left == pytest.approx(0.0)
+            assert 0.3 <= src.bounds.top < 0.31 and 0.4 <= src.bounds.right < 0.41
+            assert (src.read(1) == 7).all()
@@ -0,0 +1,394 @@
+import asyncio
+import os
+import threading
+import time
+import zipfile
+
+import pytest
+
+pytest.importorskip("dotenv")
+pytest.importorskip("tqdm")
+
+from src.utilities import copernicus_data_store_utilities as cds  # noqa: E402
+
+
+def test_import_creates_no_client():
+    # the module imported above without credentials; clients are only built on first use
+    assert not hasattr(cds, "client")
+
+
+def test_missing_credentials_raise_on_first_use(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)  # no .env file to load
+    monkeypatch.delenv("CDSAPI_URL", raising=False)
+    monkeypatch.delenv("CDSAPI_KEY", raising=False)
+    with pytest.raises(ValueError):
+        cds.CDSClientPool().client()
+
+
+def test_credentials_from_environment(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("CDSAPI_URL", "https://cds.example/api")
+    monkeypatch.setenv("CDSAPI_KEY", "secret")
+    assert cds.CDSClientPool().credentials() == ("https://cds.example/api", "secret")
+    assert cds.CDSClientPool(key="explicit").credentials() == ("https://cds.example/api", "explicit")
+
+
+def test_each_thread_gets_its_own_client(monkeypatch, tmp_path):
+    pytest.importorskip("cdsapi")
+    monkeypatch.setenv("HOME", str(tmp_path))
+    pool = cds.CDSClientPool(url="https://cds.example/api", key="secret")
+    clients = []
+    thread = threading.Thread(target=lambda: clients.append(pool.client()))
+    thread.start()
+    thread.join()
+    assert pool.client() is pool.client()
+    assert pool.client() is not clients[0]
+    assert not os.path.exists(tmp_path / ".cdsapirc")
+
+
+class _FakeJob:
+    """Job of a fake CDS client: queued for two polls, then completed."""
+
+    def __init__(self, client, request):
+        self.client = client
+        self.request = request
+        self.polls = 0
+        self.reply = {"state": "queued"}
+
+    def update(self):
+        self.polls += 1
+        if self.polls >= 2:
+            self.reply = {"state": "failed" if self.request["experiment"] == "bad" else "completed"}
+            self.client.finished(self)
+
+    def download(self, target):
+        if isinstance(self.request["variable"], list):
+            with zipfile.ZipFile(target, "w") as archive:
+                for variable in self.request["variable"]:
+                    archive.writestr(f"{variable.upper()}_{self.request['experiment']}.nc", variable)
+            return
+        with open(target, "wb") as f:
+            f.write(b"archive of " + self.request["experiment"].encode())
+
+
+class _SingleFileJob(_FakeJob):
+    """Job whose archive holds one "data.nc" with every variable, as many CDS datasets do."""
+
+    def download(self, target):
+        with zipfile.ZipFile(target, "w") as archive:
+            archive.writestr("data.nc", ",".join(self.request["variable"]))
+
+
+class _FakeClientPool:
+    def __init__(self, job=_FakeJob):
+        self.job = job
+        self.lock = threading.Lock()
+        self.in_queue = 0
+        self.max_in_queue = 0
+
+    def client(self):
+        return self
+
+    def retrieve(self, dataset, request):
+        with self.lock:
+            self.in_queue += 1
+            self.max_in_queue = max(self.max_in_queue, self.in_queue)
+        return self.job(self, request)
+
+    def finished(self, job):
+        with self.lock:
+            self.in_queue -= 1
+
+
+class _PerThreadJob(_FakeJob):
+    """Job that fails if it is polled or downloaded from a thread other than its client's."""
+
+    def update(self):
+        assert threading.get_ident() == self.client.thread
+        super().update()
+
+    def download(self, target):
+        assert threading.get_ident() == self.client.thread
+        super().download(target)
+
+
+class _PerThreadClient:
+    def __init__(self, pool):
+        self.pool = pool
+        self.thread = threading.get_ident()
+
+    def retrieve(self, dataset, request):
+        return _PerThreadJob(self, request)
+
+    def finished(self, job):
+        pass
+
+
+class _PerThreadClientPool:
+    def __init__(self):
+        self.local = threading.local()
+
+    def client(self):
+        if not hasattr(self.local, "client"):
+            self.local.client = _PerThreadClient(self)
+        return self.local.client
+
+
+def _task(experiment):
+    request = {"period": ["2021"], "experiment": experiment, "product_type": "p", "variable": "v"}
+    return {"dataset": "cmip6", "request": request}
+
+
+def test_scheduler_submits_within_queue_limit(tmp_path):
+    pool = _FakeClientPool()
+    tasks = [_task(f"ssp{i}") for i in range(6)] + [_task("bad")]
+    (tmp_path / "cmip6_2021_ssp0_p_v.zip").write_bytes(b"already here")
+    results = asyncio.run(
+        cds.schedule_cds_downloads(
+            tasks, tmp_path, max_queued=3, poll_interval=0.01, max_retries=1, client_pool=pool
+        )
+    )
+    assert [r["state"] for r in results] == ["skipped"] + ["downloaded"] * 5 + ["failed"]
+    assert pool.max_in_queue == 3
+    assert (tmp_path / "cmip6_2021_ssp5_p_v.zip").read_bytes() == b"archive of ssp5"
+    assert "CDS request failed" in results[-1]["error"]
+
+
+def test_scheduler_uses_the_submitting_client(tmp_path):
+    tasks = [_task(f"ssp{i}") for i in range(8)]
+    results = asyncio.run(
+        cds.schedule_cds_downloads(
+            tasks,
+            tmp_path,
+            max_queued=3,
+            max_downloads=2,
+            poll_interval=0.01,
+            max_retries=1,
+            retry_delay=0,
+            client_pool=_PerThreadClientPool(),
+        )
+    )
+    assert [r["state"] for r in results] == ["downloaded"] * 8
+
+
+class _SlowDownloadJob(_FakeJob):
+    """Job taking a while to download, recording how many requests were sent by then."""
+
+    def download(self, target):
+        time.sleep(0.3)
+        self.client.submitted_by_download.append(self.client.submitted)
+        super().download(target)
+
+
+class _CountingClientPool(_FakeClientPool):
+    def __init__(self):
+        super().__init__(job=_SlowDownloadJob)
+        self.submitted = 0
+        self.submitted_by_download = []
+
+    def retrieve(self, dataset, request):
+        with self.lock:
+            self.submitted += 1
+        return super().retrieve(dataset, request)
+
+
+def test_jobs_waiting_for_a_download_do_not_block_submissions(tmp_path):
+    pool = _CountingClientPool()
+    tasks = [_task(f"ssp{i}") for i in range(3)]
+    results = asyncio.run(
+        cds.schedule_cds_downloads(
+            tasks, tmp_path, max_queued=1, max_downloads=1, poll_interval=0.01, client_pool=pool
+        )
+    )
+    assert [r["state"] for r in results] == ["downloaded"] * 3
+    # while the first job downloads and the second waits for it, the third is submitted
+    assert pool.submitted_by_download[0] == 3
+
+
+# the agroclimatic indicators name their files after the request values, so they can be merged
+AGRO_MERGE_KEYS = ("variable", "experiment", "period")
+
+
+def _agro_task(variable, experiment="rcp4_5"):
+    request = {
+        "origin": "gfdl_esm2m",
+        "variable": [variable],
+        "experiment": experiment,
+        "temporal_aggregation": "monthly",
+        "period": ["201101_204012"],
+        "product_type": "climate_impact_indicators",
+        "area": [10, -10, 0, 0],
+    }
+    return {"dataset": "sis-agroclimatic-indicators", "request": request}
+
+
+def test_estimate_request_cost():
+    limits = cds.CDSRequestLimits(resolution=0.5)
+    fields, size = cds.estimate_request_cost(_agro_task("tg")["request"], limits)
+    assert fields == 30 * 12
+    assert size == fields * 20 * 20 * 4
+
+
+def test_planner_splits_oversized_and_merges_small_requests():
+    big = _agro_task("tg")
+    big["request"]["variable"] = ["tg", "tn", "tx", "rr"]
+    small = [_agro_task(v, "rcp8_5") for v in ("tg", "tn", "tx")]
+    limits = cds.CDSRequestLimits(max_fields=1000, min_fields=500, merge_keys=AGRO_MERGE_KEYS)
+    planned = cds.plan_cds_requests([big] + small, limits)
+
+    split = [p for p in planned if p["archive_name"].startswith(cds._archive_name(**big))]
+    assert [p["request"]["variable"] for p in split] == [["tg", "tn"], ["tx", "rr"]]
+    (merged,) = [p for p in planned if p["targets"]]
+    assert merged["request"]["variable"] == ["tg", "tn"]
+    assert [t["archive_name"] for t in merged["targets"]] == [
+        cds._archive_name(**small[0]),
+        cds._archive_name(**small[1]),
+    ]
+    assert [p["request"]["variable"] for p in planned if p["request"]["experiment"] == "rcp8_5"] == [
+        ["tg", "tn"],
+        ["tx"],
+    ]
+
+
+def test_split_merged_archive(tmp_path):
+    with zipfile.ZipFile(tmp_path / "merged.zip", "w") as archive:
+        archive.writestr("TG_gfdl_rcp8p5_20110101-20401231.nc", b"tg")
+        archive.writestr("TN_gfdl_rcp8p5_20110101-20401231.nc", b"tn")
+        archive.writestr("README.txt", b"readme")
+    targets = [
+        {"archive_name": "a", "match": {"variable": ["tg"], "period": ["201101_204012"]}},
+        {"archive_name": "b", "match": {"variable": ["tn"], "period": ["201101_204012"]}},
+    ]
+    paths = cds.split_merged_archive(tmp_path / "merged.zip", targets, tmp_path)
+    with zipfile.ZipFile(paths[0]) as a, zipfile.ZipFile(paths[1]) as b:
+        assert sorted(a.namelist()) == ["README.txt", "TG_gfdl_rcp8p5_20110101-20401231.nc"]
+        assert sorted(b.namelist()) == ["README.txt", "TN_gfdl_rcp8p5_20110101-20401231.nc"]
+
+
+def test_scheduler_splits_merged_downloads(tmp_path):
+    pool = _FakeClientPool()
+    tasks = [_agro_task(v) for v in ("tg", "tn", "tx")]
+    for task in tasks:
+        task["extract_by_extension"] = ".nc"
+    limits = cds.CDSRequestLimits(max_fields=5000, merge_keys=AGRO_MERGE_KEYS)
+    planned = cds.plan_cds_requests(tasks, limits)
+    assert len(planned) == 1
+    (result,) = asyncio.run(
+        cds.schedule_cds_downloads(planned, tmp_path, poll_interval=0.01, client_pool=pool)
+    )
+    assert result["state"] == "downloaded"
+    assert (tmp_path / "TN_rcp4_5.nc").read_text() == "tn"
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["TG_rcp4_5.nc", "TN_rcp4_5.nc", "TX_rcp4_5.nc"]
+
+
+def test_members_match_whole_words():
+    assert cds._member_matches("var_1_2020.nc", {"variable": ["1"]})
+    assert not cds._member_matches("var_10_2020.nc", {"variable": ["1"]})
+    assert not cds._member_matches("var_1000.nc", {"variable": ["10"]})
+    assert cds._member_matches("TG_rcp4_5.nc", {"experiment": "rcp4_5"})
+    assert cds._member_matches("TG_20110101-20401231.nc", {"period": ["201101_204012"]})
+
+
+def test_split_merged_archive_refuses_unsplittable_members(tmp_path):
+    targets = [
+        {"archive_name": "a", "match": {"variable": ["1"]}},
+        {"archive_name": "b", "match": {"variable": ["10"]}},
+    ]
+    with zipfile.ZipFile(tmp_path / "single.zip", "w") as archive:
+        archive.writestr("data.nc", b"1,10")
+    with pytest.raises(ValueError):
+        cds.split_merged_archive(tmp_path / "single.zip", targets, tmp_path)
+    with zipfile.ZipFile(tmp_path / "both.zip", "w") as archive:
+        archive.writestr("V_1_10.nc", b"1,10")
+        archive.writestr("V_10.nc", b"10")
+    with pytest.raises(ValueError):
+        cds.split_merged_archive(tmp_path / "both.zip", targets, tmp_path)
+    assert not (tmp_path / "a.zip").exists()
+
+
+def test_scheduler_falls_back_to_unmerged_requests(tmp_path):
+    pool = _FakeClientPool(job=_SingleFileJob)
+    tasks = [_agro_task(v) for v in ("tg", "tn")]
+    limits = cds.CDSRequestLimits(max_fields=5000, merge_keys=AGRO_MERGE_KEYS)
+    planned = cds.plan_cds_requests(tasks, limits)
+    assert len(planned) == 1
+    (result,) = asyncio.run(
+        cds.schedule_cds_downloads(planned, tmp_path, poll_interval=0.01, client_pool=pool)
+    )
+    assert result["state"] == "downloaded"
+    for task, variable in zip(tasks, ("tg", "tn")):
+        with zipfile.ZipFile(tmp_path / f"{cds._archive_name(**task)}.zip") as archive:
+            assert archive.read("data.nc") == variable.encode()
+    assert sorted(p.name for p in tmp_path.iterdir()) == sorted(
+        f"{cds._archive_name(**task)}.zip" for task in tasks
+    )
+
+
+def test_scheduler_joins_the_parts_of_split_requests(tmp_path):
+    pool = _FakeClientPool(job=_SingleFileJob)
+    big = _agro_task("tg")
+    big["request"]["variable"] = ["tg", "tn", "tx", "rr"]
+    planned = cds.plan_cds_requests([big], cds.CDSRequestLimits(max_fields=1000, min_fields=0))
+    assert [p["archive_name"][-6:] for p in planned] == ["_part1", "_part2"]
+    results = asyncio.run(
+        cds.schedule_cds_downloads(planned, tmp_path, poll_interval=0.01, client_pool=pool)
+    )
+    joined = tmp_path / f"{cds._archive_name(**big)}.zip"
+    assert [r["archive_path"] for r in results] == [joined, joined]
+    assert [p.name for p in tmp_path.iterdir()] == [joined.name]
+    with zipfile.ZipFile(joined) as archive:
+        assert archive.read("data.nc") == b"tg,tn"
+        assert archive.read("data_part2.nc") == b"tx,rr"
+
+    # a second run finds the joined archive and downloads nothing
+    results = asyncio.run(
+        cds.schedule_cds_downloads(planned, tmp_path, poll_interval=0.01, client_pool=pool)
+    )
+    assert [r["state"] for r in results] == ["skipped", "skipped"]
+
+
+def test_requests_are_only_merged_on_request():
+    tasks = [_agro_task(v) for v in ("tg", "tn")]
+    assert len(cds.plan_cds_requests(tasks, cds.CDSRequestLimits(max_fields=5000))) == 2
+
+
+def _cmip6_task(variable, experiment):
+    request = {
+        "temporal_resolution": "monthly",
+        "experiment": experiment,
+        "variable": variable,
+        "model": "gfdl_esm4",
+        "year": ["2015"],
+        "month": ["01"],
+    }
+    return {"dataset": "projections-cmip6", "request": request, "archive_name": f"{variable}_{experiment}"}
+
+
+def test_cmip6_archives_are_split_by_file_name_tokens(tmp_path):
+    tasks = [
+        _cmip6_task(v, e)
+        for v in ("near_surface_air_temperature", "precipitation")
+        for e in ("ssp1_2_6", "ssp5_8_5")
+    ]
+    limits = cds.CDSRequestLimits(
+        merge_keys=("variable", "experiment"), member_tokens=cds.cmip6_member_tokens
+    )
+    (merged,) = cds.plan_cds_requests(tasks, limits)
+    assert len(merged["targets"]) == 4
+    with zipfile.ZipFile(tmp_path / "merged.zip", "w") as archive:
+        for short in ("tas", "pr"):
+            for scenario in ("ssp126", "ssp585"):
+                name = f"{short}_Amon_GFDL-ESM4_{scenario}_r1i1p1f1_gr1_20150116-20150116.nc"
+                archive.writestr(name, name)
+    with pytest.raises(ValueError):
+        cds.split_merged_archive(tmp_path / "merged.zip", merged["targets"], tmp_path)
+
+    paths = cds.split_merged_archive(
+        tmp_path / "merged.zip", merged["targets"], tmp_path, merged["member_tokens"]
+    )
+    names = {}
+    for path in paths:
+        with zipfile.ZipFile(path) as archive:
+            (names[path.stem],) = archive.namelist()
+    assert names["near_surface_air_temperature_ssp5_8_5"].startswith("tas_Amon_GFDL-ESM4_ssp585_")
+    assert names["precipitation_ssp1_2_6"].startswith("pr_Amon_GFDL-ESM4_ssp126_")
@@ -0,0 +1,66 @@
+import os
+
+from src.utilities.download_cache_utilities import DownloadCache
+
+
+def _write(path, content: bytes):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(content)
+    return str(path)
+
+
+def test_key_is_canonical():
+    a = DownloadCache.key("cds", {"dataset": "d", "request": {"a": 1, "b": [1, 2]}})
+    b = DownloadCache.key("cds", {"request": {"b": (1, 2), "a": 1}, "dataset": "d"})
+    assert a == b
+    assert a != DownloadCache.key("gee", {"dataset": "d", "request": {"a": 1, "b": [1, 2]}})
+
+
+def test_put_and_get_link_the_cached_object(tmp_path):
+    cache = DownloadCache(str(tmp_path / "cache"))
+    key = DownloadCache.key("http", "https://example.com/a.zip")
+    downloaded = _write(tmp_path / "first" / "a.zip", b"archive")
+    cache.put(key, downloaded, source="http", request="https://example.com/a.zip")
+
+    target = str(tmp_path / "second" / "renamed.zip")
+    assert cache.get(key, target) == target
+    assert os.path.samefile(downloaded, target)
+    (entry,) = cache.entries()
+    assert entry["size"] == len(b"archive")
+    assert entry["source"] == "http"
+    assert cache.get(DownloadCache.key("http", "https://example.com/b.zip"), target) is None
+
+
+def test_identical_content_is_stored_once(tmp_path):
+    cache = DownloadCache(str(tmp_path / "cache"))
+    cache.put("k1", _write(tmp_path / "a.bin", b"same bytes"))
+    cache.put("k2", _write(tmp_path / "b.bin", b"same bytes"))
+    assert len(cache.entries()) == 2
+    assert cache.total_size() == len(b"same bytes")
+
+
+def test_corrupted_objects_are_dropped(tmp_path):
+    cache = DownloadCache(str(tmp_path / "cache"))
+    path = _write(tmp_path / "a.bin", b"original")
+    cache.put("k", path)
+    # writing through the hard link corrupts the cached object
+    with open(path, "r+b") as f:
+        f.write(b"tampered")
+    assert cache.verify() == ["k"]
+    assert cache.get("k", str(tmp_path / "b.bin")) is None
+
+    cache.put("k", _write(tmp_path / "c.bin", b"original"))
+    with open(str(tmp_path / "c.bin"), "ab") as f:
+        f.write(b" and more")
+    assert cache.get("k", str(tmp_path / "d.bin")) is None
+    assert cache.entries() == []
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = DownloadCache(str(tmp_path / "cache"), max_bytes=25)
+    cache.put("old", _write(tmp_path / "old.bin", b"x" * 10))
+    cache.put("used", _write(tmp_path / "used.bin", b"y" * 10))
+    cache.get("old", str(tmp_path / "old_again.bin"))
+    cache.put("new", _write(tmp_path / "new.bin", b"z" * 10))
+    assert sorted(e["key"] for e in cache.entries()) == ["new", "old"]
+    assert cache.total_size() == 20
@@ -0,0 +1,254 @@
+import asyncio
+import hashlib
+import http.server
+import io
+import json
+import os
+import re
+import threading
+import zipfile
+
+import pytest
+
+pytest.importorskip("requests")
+pytest.importorskip("aiohttp")
+
+from src.utilities.download_cache_utilities import DownloadCache  # noqa: E402
+from src.utilities.download_utilities import (  # noqa: E402
+    download_and_extract_archive,
+    download_file,
+    download_file_segmented,
+    download_many,
+    get_http_session,
+)
+from src.utilities.telemetry_utilities import get_telemetry  # noqa: E402
+
+PAYLOAD = bytes(range(256)) * 4096  # 1 MiB
+ETAG = '"payload-v1"'
+
+
+class _RangeHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+    requested_ranges: list = []
+    client_ports: list = []
+    accept_ranges = True
+    files: dict = {}
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header("ETag", ETAG)
+        self.send_header("Content-Length", str(len(self.files.get(self.path, PAYLOAD))))
+        if self.accept_ranges:
+            self.send_header("Accept-Ranges", "bytes")
+        self.end_headers()
+
+    def do_GET(self):
+        self.client_ports.append(self.client_address[1])
+        if self.path.endswith("missing.bin"):
+            self.send_error(404)
+            return
+        content = self.files.get(self.path, PAYLOAD)
+        start, end = 0, len(content) - 1
+        range_header = self.headers.get("Range")
+        if_range = self.headers.get("If-Range")
+        if self.accept_ranges and range_header and (if_range is None or if_range == ETAG):
+            match = re.match(r"bytes=(\d+)-(\d*)", range_header)
+            start = int(match.group(1))
+            if match.group(2):
+                end = int(match.group(2))
+            self.requested_ranges.append(start)
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(content)}")
+        else:
+            self.requested_ranges.append(None)
+            self.send_response(200)
+        self.send_header("ETag", ETAG)
+        self.send_header("Content-Length", str(end + 1 - start))
+        self.end_headers()
+        self.wfile.write(content[start : end + 1])
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server_url():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _RangeHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    _RangeHandler.requested_ranges = []
+    _RangeHandler.accept_ranges = True
+    _RangeHandler.files = {}
+    _RangeHandler.client_ports = []
+    yield f"http://127.0.0.1:{server.server_address[1]}/payload.bin"
+    server.shutdown()
+
+
+def test_download_is_atomic_and_verified(tmp_path, server_url):
+    sha256 = hashlib.sha256(PAYLOAD).hexdigest()
+    download_file(server_url, str(tmp_path), "payload.bin", expected_sha256=sha256)
+    assert (tmp_path / "payload.bin").read_bytes() == PAYLOAD
+    assert not (tmp_path / "payload.bin.part").exists()
+
+
+def test_download_resumes_from_partial_file(tmp_path, server_url):
+    half = len(PAYLOAD) // 2
+    (tmp_path / "payload.bin.part").write_bytes(PAYLOAD[:half])
+    (tmp_path / "payload.bin.part.json").write_text(json.dumps({"etag": ETAG}))
+    download_file(server_url, str(tmp_path), "payload.bin")
+    assert _RangeHandler.requested_ranges == [half]
+    assert (tmp_path / "payload.bin").read_bytes() == PAYLOAD
+
+
+def test_download_restarts_when_validator_changed(tmp_path, server_url):
+    (tmp_path / "payload.bin.part").write_bytes(b"stale content")
+    (tmp_path / "payload.bin.part.json").write_text(json.dumps({"etag": '"old"'}))
+    download_file(server_url, str(tmp_path), "payload.bin")
+    assert _RangeHandler.requested_ranges == [None]
+    assert (tmp_path / "payload.bin").read_bytes() == PAYLOAD
+
+
+def test_segmented_download_fetches_ranges_concurrently(tmp_path, server_url):
+    result = download_file_segmented(
+        server_url, str(tmp_path), "payload.bin", n_segments=4, min_segment_size=1024
+    )
+    assert (tmp_path / "payload.bin").read_bytes() == PAYLOAD
+    assert sorted(_RangeHandler.requested_ranges) == [0, 262144, 524288, 786432]
+    assert result.segments == 4
+    assert result.bytes == len(PAYLOAD)
+    assert result.throughput > 0
+
+
+def test_segmented_download_resumes_segments(tmp_path, server_url):
+    segments = [
+        {"start": 0, "end": 524287, "written": 524288},
+        {"start": 524288, "end": len(PAYLOAD) - 1, "written": 1000},
+    ]
+    part = bytearray(len(PAYLOAD))
+    part[:525288] = PAYLOAD[:525288]
+    (tmp_path / "payload.bin.part").write_bytes(bytes(part))
+    (tmp_path / "payload.bin.part.json").write_text(
+        json.dumps({"validator": ETAG, "total": str(len(PAYLOAD)), "segments": segments})
+    )
+    result = download_file_segmented(
+        server_url, str(tmp_path), "payload.bin", n_segments=2, min_segment_size=1024
+    )
+    assert _RangeHandler.requested_ranges == [525288]
+    assert result.bytes == len(PAYLOAD) - 525288
+    assert (tmp_path / "payload.bin").read_bytes() == PAYLOAD
+
+
+def test_segmented_download_falls_back_without_range_support(tmp_path, server_url):
+    _RangeHandler.accept_ranges = False
+    result = download_file_segmented(
+        server_url, str(tmp_path), "payload.bin", n_segments=4, min_segment_size=1024
+    )
+    assert _RangeHandler.requested_ranges == [None]
+    assert result.segments == 1
+    assert (tmp_path / "payload.bin").read_bytes() == PAYLOAD
+
+
+def test_download_many_reports_per_file_results(tmp_path, server_url):
+    base = server_url.rsplit("/", 1)[0]
+    tasks = [(f"{base}/tile_{i}.bin", str(tmp_path / "tiles" / f"tile_{i}.bin")) for i in range(6)]
+    tasks.append((f"{base}/missing.bin", str(tmp_path / "tiles" / "missing.bin")))
+    results = asyncio.run(download_many(tasks, max_concurrency=3, max_per_host=2))
+
+    assert [r.filename for r in results] == [os.path.basename(t[1]) for t in tasks]
+    for result in results[:-1]:
+        assert result.error is None
+        assert result.bytes == len(PAYLOAD)
+        assert result.attempts == 1
+    assert (tmp_path / "tiles" / "tile_5.bin").read_bytes() == PAYLOAD
+    # client errors are not retried
+    assert results[-1].error is not None
+    assert results[-1].attempts == 1
+    assert not (tmp_path / "tiles" / "missing.bin").exists()
+
+
+def test_download_many_does_not_block_other_hosts(tmp_path):
+    from src.utilities.stand_in_utilities import RangeFileServer
+
+    with RangeFileServer(latency=0.4) as slow, RangeFileServer() as fast:
+        tasks = [
+            (slow.add_file(f"/slow_{i}.bin", PAYLOAD), str(tmp_path / f"slow_{i}.bin"))
+            for i in range(3)
+        ]
+        tasks.append((fast.add_file("/fast.bin", PAYLOAD), str(tmp_path / "fast.bin")))
+        results = asyncio.run(download_many(tasks, max_concurrency=2, max_per_host=1))
+    assert all(r.error is None for r in results)
+    # the fast host got the second global slot instead of a task queued on the slow host
+    assert results[-1].duration < 0.3
+
+
+def test_download_is_linked_from_cache(tmp_path, server_url):
+    cache = DownloadCache(str(tmp_path / "cache"))
+    (tmp_path / "a").mkdir()
+    (tmp_path / "b").mkdir()
+    download_file(server_url, str(tmp_path / "a"), "payload.bin", cache=cache)
+    download_file(server_url, str(tmp_path / "b"), "payload.bin", cache=cache)
+    assert _RangeHandler.requested_ranges == [None]
+    assert os.path.samefile(tmp_path / "a" / "payload.bin", tmp_path / "b" / "payload.bin")
+
+
+def _serve_zip(server_url):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("tas.nc", PAYLOAD)
+        archive.writestr("readme.txt", b"not needed" * 100000)
+        archive.writestr("monthly/pr.nc", PAYLOAD[::-1])
+        archive.writestr("../outside.nc", b"sanitized")
+    _RangeHandler.files = {"/archive.zip": buffer.getvalue()}
+    return server_url.rsplit("/", 1)[0] + "/archive.zip"
+
+
+def test_streaming_extraction_skips_the_archive(tmp_path, server_url):
+    url = _serve_zip(server_url)
+    download_and_extract_archive(url, str(tmp_path), extract_by_extension=".nc", stream=True)
+    assert (tmp_path / "tas.nc").read_bytes() == PAYLOAD
+    assert (tmp_path / "monthly" / "pr.nc").read_bytes() == PAYLOAD[::-1]
+    assert (tmp_path / "outside.nc").read_bytes() == b"sanitized"
+    assert not (tmp_path / "readme.txt").exists()
+    assert not (tmp_path / "archive.zip").exists()
+    # only range requests: the archive was never downloaded as a whole
+    assert None not in _RangeHandler.requested_ranges
+    # the central directory was read once, not once per member
+    with zipfile.ZipFile(io.BytesIO(_RangeHandler.files["/archive.zip"])) as archive:
+        start_dir = archive.start_dir
+    assert sum(start >= start_dir for start in _RangeHandler.requested_ranges) <= 3
+
+
+def test_streaming_extraction_falls_back_to_download(tmp_path, server_url):
+    url = _serve_zip(server_url)
+    _RangeHandler.accept_ranges = False
+    download_and_extract_archive(url, str(tmp_path), extract_by_extension=".nc", stream=True)
+    assert _RangeHandler.requested_ranges == [None]
+    assert (tmp_path / "monthly" / "pr.nc").read_bytes() == PAYLOAD[::-1]
+    assert not (tmp_path / "archive.zip").exists()
+
+
+def test_sessions_are_per_thread_and_share_connections(tmp_path, server_url):
+    sessions = []
+    thread = threading.Thread(target=lambda: sessions.append(get_http_session()))
+    thread.start()
+    thread.join()
+    session = get_http_session(pool_size=4)
+    assert session is get_http_session()
+    assert session is not sessions[0]
+    assert session.get_adapter("https://") is get_http_session().get_adapter("http://")
+
+    download_file(server_url, str(tmp_path), "a.bin")
+    download_file(server_url, str(tmp_path), "b.bin")
+    # the second download reused the keep-alive connection of the first
+    assert len(set(_RangeHandler.client_ports)) == 1
+
+
+def test_downloads_are_recorded_in_telemetry(tmp_path, server_url):
+    telemetry = get_telemetry()
+    telemetry.reset()
+    download_file(server_url, str(tmp_path), "payload.bin")
+    download_file(server_url, str(tmp_path), "payload.bin")
+    downloaded, skipped = telemetry.records
+    assert (downloaded.source, downloaded.bytes, downloaded.status) == ("http", len(PAYLOAD), "ok")
+    assert downloaded.ttfb is not None
+    assert skipped.status == "skipped"
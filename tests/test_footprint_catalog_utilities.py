@@ -0,0 +1,86 @@
+import os
+
+import pytest
+
+np = pytest.importorskip("numpy")
+rasterio = pytest.importorskip("rasterio")
+shapely = pytest.importorskip("shapely")
+
+from rasterio.transform import from_origin  # noqa: E402
+from shapely.geometry import box  # noqa: E402
+
+from src.utilities import footprint_catalog_utilities  # noqa: E402
+from src.utilities.footprint_catalog_utilities import FootprintCatalog  # noqa: E402
+
+
+def _write(path, left, top, crs="EPSG:4326", res=1.0):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with rasterio.open(
+        path,
+        "w",
+        driver="GTiff",
+        width=4,
+        height=4,
+        count=1,
+        dtype="uint8",
+        crs=crs,
+        transform=from_origin(left, top, res, res),
+    ) as dst:
+        dst.write(np.ones((1, 4, 4), dtype="uint8"))
+    return str(path)
+
+
+def test_update_reads_only_new_and_changed_files(tmp_path, monkeypatch):
+    tiles = tmp_path / "tiles"
+    a = _write(tiles / "2020" / "a.tif", 0, 4)
+    b = _write(tiles / "2021" / "b.tif", 10, 4)
+    (tiles / "notes.txt").write_text("not a raster")
+    (tiles / "broken.tif").write_bytes(b"not a tiff")
+    catalog = FootprintCatalog(str(tmp_path / "catalog.sqlite"))
+    footprints = catalog.update(str(tiles))
+    assert [f.path for f in footprints] == [a, b]
+    assert footprints[0].bounds == (0, 0, 4, 4)
+    assert footprints[0].dtype == "uint8" and footprints[0].res == (1.0, 1.0)
+
+    read = []
+    original = footprint_catalog_utilities._read_footprint
+    monkeypatch.setattr(
+        footprint_catalog_utilities,
+        "_read_footprint",
+        lambda path, stat: read.append(path) or original(path, stat),
+    )
+    reopened = FootprintCatalog(str(tmp_path / "catalog.sqlite"))
+    assert reopened.update(str(tiles)) == footprints
+    assert read == [str(tiles / "broken.tif")]
+
+    read.clear()
+    os.remove(b)
+    c = _write(tiles / "c.tif", 20, 4)
+    _write(tiles / "2020" / "a.tif", 100, 4)
+    os.utime(a, ns=(0, 10**18))
+    footprints = reopened.update(str(tiles))
+    assert sorted(read) == sorted([a, c, str(tiles / "broken.tif")])
+    assert [f.path for f in footprints] == [a, c]
+    assert footprints[0].bounds == (100, 0, 104, 4)
+    assert [f.path for f in reopened.footprints()] == [a, c]
+
+    # a file overwritten with something unreadable leaves the catalog
+    with open(c, "wb") as f:
+        f.write(b"truncated")
+    assert [f.path for f in reopened.update(str(tiles))] == [a]
+    assert [f.path for f in reopened.footprints()] == [a]
+
+
+def test_select_reprojects_footprints_once_per_crs(tmp_path):
+    tiles = tmp_path / "tiles"
+    near = _write(tiles / "near.tif", 0, 4)
+    far = _write(tiles / "far.tif", 50, 54)
+    # inside the area of near, in metres
+    projected = _write(tiles / "projected.tif", 100000, 400000, crs="EPSG:3857", res=10000)
+    catalog = FootprintCatalog(str(tmp_path / "catalog.sqlite"))
+    footprints = catalog.update(str(tiles))
+
+    region = box(1, 1, 2, 3.5).union(box(30, 30, 31, 31))
+    assert catalog.select(region, "EPSG:4326", footprints) == [near, projected]
+    assert catalog.select(box(52, 52, 53, 53), "EPSG:4326") == [far]
+    assert catalog.select(box(-10, -10, -9, -9), "EPSG:4326") == []
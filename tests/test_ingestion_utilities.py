@@ -0,0 +1,77 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+xr = pytest.importorskip("xarray")
+pytest.importorskip("zarr")
+pytest.importorskip("scipy")
+
+from src.utilities.ingestion_utilities import ingest_netcdf_to_zarr  # noqa: E402
+
+LATITUDE = np.linspace(10.0, 5.0, 6)
+LONGITUDE = np.linspace(-5.0, 2.0, 8)
+
+
+def _write_netcdf(path, variable, start, periods):
+    """Hourly file as extracted from a CDS archive (scipy writes NetCDF3)."""
+    times = np.datetime64(start, "ns") + np.arange(periods) * np.timedelta64(1, "h")
+    offset = (times - np.datetime64("2000-01-01", "ns")) // np.timedelta64(1, "h")
+    data = (offset[:, None, None] + np.zeros((periods, 6, 8))).astype(np.float64)
+    ds = xr.Dataset(
+        {variable: (["valid_time", "latitude", "longitude"], data, {"units": "K"})},
+        coords={"valid_time": times, "latitude": LATITUDE, "longitude": LONGITUDE},
+    )
+    ds.to_netcdf(path, engine="scipy")
+    return str(path)
+
+
+def test_files_are_written_into_their_region(tmp_path):
+    files = [
+        _write_netcdf(tmp_path / "t2m_b.nc", "t2m", "2020-01-01T04", 4),
+        _write_netcdf(tmp_path / "t2m_a.nc", "t2m", "2020-01-01T00", 4),
+        _write_netcdf(tmp_path / "tp_a.nc", "tp", "2020-01-01T00", 8),
+    ]
+    store = str(tmp_path / "climate.zarr")
+    ds = ingest_netcdf_to_zarr(files, store, compressor="zstd", max_workers=3)
+
+    assert ds.t2m.dims == ("valid_time", "latitude", "longitude")
+    assert ds.t2m.dtype == np.float32
+    assert ds.t2m.encoding["chunks"] == (1, 6, 8)
+    expected = (
+        np.arange(8) + 20 * 365 * 24 + 5 * 24
+    )  # hours from 2000-01-01 (5 leap days) to 2020-01-01
+    np.testing.assert_array_equal(ds.t2m.isel(latitude=0, longitude=0).values, expected)
+    np.testing.assert_array_equal(ds.tp.isel(latitude=2, longitude=3).values, expected)
+    np.testing.assert_array_equal(ds.latitude.values, LATITUDE)
+    assert (tmp_path / "climate.zarr" / ".zmetadata").exists()
+
+
+def test_new_years_are_appended(tmp_path):
+    store = str(tmp_path / "climate.zarr")
+    first = _write_netcdf(tmp_path / "2020.nc", "t2m", "2020-12-31T20", 4)
+    ingest_netcdf_to_zarr([first], store, layout="timeseries", chunks={"latitude": 3})
+    created = (tmp_path / "climate.zarr" / "t2m" / "0.0.0").stat().st_mtime_ns
+
+    second = _write_netcdf(tmp_path / "2021.nc", "t2m", "2021-01-01T00", 6)
+    ds = ingest_netcdf_to_zarr([first, second], store, max_workers=2)
+
+    assert ds.sizes["valid_time"] == 10
+    assert ds.t2m.encoding["chunks"] == (4, 3, 8)
+    values = ds.t2m.isel(latitude=5, longitude=7).values
+    np.testing.assert_array_equal(np.diff(values), np.ones(9))
+    # chunks holding only earlier years are not rewritten
+    assert (tmp_path / "climate.zarr" / "t2m" / "0.0.0").stat().st_mtime_ns == created
+
+    # everything is already in the store
+    assert ingest_netcdf_to_zarr([second], store).sizes["valid_time"] == 10
+
+
+def test_overlapping_files_are_rejected(tmp_path):
+    store = str(tmp_path / "climate.zarr")
+    ingest_netcdf_to_zarr(
+        [_write_netcdf(tmp_path / "a.nc", "t2m", "2020-01-01T00", 4)], store
+    )
+    overlapping = _write_netcdf(tmp_path / "b.nc", "t2m", "2020-01-01T02", 4)
+    with pytest.raises(ValueError):
+        ingest_netcdf_to_zarr([overlapping], store)
+    with pytest.raises(ValueError):
+        ingest_netcdf_to_zarr([overlapping], str(tmp_path / "other.zarr"), layout="cube")
@@ -0,0 +1,127 @@
+import threading
+
+import pytest
+
+np = pytest.importorskip("numpy")
+rasterio = pytest.importorskip("rasterio")
+
+from rasterio.merge import merge  # noqa: E402
+from rasterio.transform import from_origin  # noqa: E402
+
+from src.utilities import mosaic_utilities  # noqa: E402
+from src.utilities.mosaic_utilities import mosaic_rasters  # noqa: E402
+
+
+def _write(path, left, top, data, nodata=-1.0, res=1.0):
+    with rasterio.open(
+        path,
+        "w",
+        driver="GTiff",
+        width=data.shape[2],
+        height=data.shape[1],
+        count=data.shape[0],
+        dtype=data.dtype,
+        crs="EPSG:3035",
+        transform=from_origin(left, top, res, res),
+        nodata=nodata,
+    ) as dst:
+        dst.write(data)
+    return str(path)
+
+
+def test_mosaic_matches_rasterio_merge(tmp_path):
+    rng = np.random.default_rng(0)
+    paths = []
+    # overlapping tiles with holes of nodata and a gap between them
+    for i, (left, top) in enumerate([(0, 100), (40, 90), (130, 60), (20, 30)]):
+        data = rng.uniform(0, 10, (2, 50, 60)).astype("float32")
+        data[:, :5, :5] = -1
+        paths.append(_write(tmp_path / f"tile_{i}.tif", left, top, data))
+    output = str(tmp_path / "mosaic.tif")
+    assert mosaic_rasters(paths, output, block_size=32, max_workers=3) == output
+
+    expected, transform = merge(paths)
+    with rasterio.open(output) as src:
+        assert src.transform == transform
+        assert src.block_shapes[0] == (32, 32)
+        assert src.compression is not None
+        assert src.nodata == -1
+        np.testing.assert_array_equal(src.read(), expected)
+
+
+def test_mosaic_rejects_mismatched_inputs(tmp_path):
+    a = _write(tmp_path / "a.tif", 0, 10, np.ones((1, 10, 10), "float32"))
+    b = _write(tmp_path / "b.tif", 10, 10, np.ones((2, 10, 10), "float32"))
+    with pytest.raises(ValueError):
+        mosaic_rasters([a, b], str(tmp_path / "mosaic.tif"))
+
+
+class _OpenFiles:
+    """Wraps rasterio.open to count the inputs open at the same time."""
+
+    def __init__(self, open_):
+        self.open_ = open_
+        self.lock = threading.Lock()
+        self.current = 0
+        self.max = 0
+
+    def __call__(self, path, mode="r", **kwargs):
+        dataset = self.open_(path, mode, **kwargs)
+        if mode != "r":
+            return dataset
+        with self.lock:
+            self.current += 1
+            self.max = max(self.max, self.current)
+        return _Tracked(dataset, self)
+
+
+class _Tracked:
+    def __init__(self, dataset, files):
+        self.dataset = dataset
+        self.files = files
+
+    def __getattr__(self, name):
+        return getattr(self.dataset, name)
+
+    def close(self):
+        with self.files.lock:
+            self.files.current -= 1
+        self.dataset.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def test_mosaic_keeps_few_inputs_open(tmp_path, monkeypatch):
+    rng = np.random.default_rng(1)
+    paths = [
+        _write(tmp_path / f"tile_{i}_{j}.tif", 8 * i, 100 - 8 * j, rng.uniform(0, 10, (1, 10, 10)))
+        for i in range(4)
+        for j in range(3)
+    ]
+    files = _OpenFiles(rasterio.open)
+    monkeypatch.setattr(mosaic_utilities.rasterio, "open", files)
+    output = mosaic_rasters(
+        paths, str(tmp_path / "mosaic.tif"), block_size=16, max_workers=3, max_open_files=2
+    )
+    monkeypatch.undo()
+
+    assert files.max <= 3 * 2
+    assert files.current == 0
+    with rasterio.open(output) as src:
+        np.testing.assert_array_equal(src.read(), merge(paths)[0])
+
+
+def test_failed_mosaic_leaves_no_partial_file(tmp_path, monkeypatch):
+    paths = [_write(tmp_path / "a.tif", 0, 10, np.ones((1, 10, 10), "float32"))]
+
+    def broken(*args):
+        raise IOError("disk full")
+
+    monkeypatch.setattr(mosaic_utilities, "_pixel_window", broken)
+    with pytest.raises(IOError):
+        mosaic_rasters(paths, str(tmp_path / "mosaic.tif"))
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["a.tif"]
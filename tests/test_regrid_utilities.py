@@ -0,0 +1,86 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("scipy")
+xr = pytest.importorskip("xarray")
+pytest.importorskip("rioxarray")
+
+from affine import Affine  # noqa: E402
+from src.utilities.regrid_utilities import (  # noqa: E402
+    compute_regrid_weights,
+    get_regrid_weights,
+    regrid,
+)
+from src.utilities.xarray_utilities import affine_to_coords  # noqa: E402
+
+
+def test_identity_weights():
+    transform = Affine(1.0, 0, 0.0, 0, -1.0, 10.0)
+    for method in ["nearest", "bilinear", "conservative"]:
+        weights = compute_regrid_weights(
+            transform, (10, 20), transform, (10, 20), method=method, geographic=False
+        )
+        assert np.allclose(weights.weights_x.toarray(), np.eye(20))
+        assert np.allclose(weights.weights_y.toarray(), np.eye(10))
+
+
+def test_conservative_coarsening_is_block_mean():
+    src = Affine(0.5, 0, 0.0, 0, -0.5, 10.0)
+    dst = Affine(1.0, 0, 0.0, 0, -1.0, 10.0)
+    values = np.arange(20 * 40, dtype=float).reshape(20, 40)
+    da = xr.DataArray(
+        values, dims=["y", "x"], coords=affine_to_coords(src, 40, 20)
+    )
+    result = regrid(da, transform=dst, shape=(10, 20), method="conservative")
+    expected = values.reshape(10, 2, 20, 2).mean(axis=(1, 3))
+    # y weights are area-weighted on the sphere, so allow a small difference
+    assert np.allclose(result.values, expected, rtol=1e-3)
+
+
+def test_regrid_ignores_nans_and_keeps_leading_dims():
+    src = Affine(1.0, 0, 0.0, 0, -1.0, 4.0)
+    dst = Affine(2.0, 0, 0.0, 0, -2.0, 4.0)
+    values = np.ones((3, 4, 4))
+    values[:, 0, 0] = np.nan
+    coords = affine_to_coords(src, 4, 4)
+    coords["time"] = [1, 2, 3]
+    da = xr.DataArray(values, dims=["time", "y", "x"], coords=coords).chunk(
+        {"time": 1}
+    )
+    result = regrid(da, transform=dst, shape=(2, 2), method="conservative")
+    assert result.dims == ("time", "y", "x")
+    assert np.allclose(result.values, 1.0)
+
+
+def test_regrid_keeps_the_y_chunks():
+    src = Affine(0.5, 0, 0.0, 0, -0.5, 10.0)
+    dst = Affine(1.0, 0, 0.0, 0, -1.0, 10.0)
+    values = np.random.default_rng(0).random((2, 20, 40))
+    values[0, 3, 5] = np.nan
+    coords = affine_to_coords(src, 40, 20)
+    coords["time"] = [1, 2]
+    da = xr.DataArray(values, dims=["time", "y", "x"], coords=coords)
+    for method in ["nearest", "bilinear", "conservative"]:
+        whole = regrid(da, transform=dst, shape=(10, 20), method=method)
+        chunked = regrid(
+            da.chunk({"time": 1, "y": 6, "x": 10}), transform=dst, shape=(10, 20), method=method
+        )
+        # target rows follow the source y chunks; only x is a single chunk
+        assert chunked.data.chunks[1] == (3, 3, 3, 1)
+        assert chunked.data.chunks[2] == (20,)
+        assert np.allclose(chunked.values, whole.values, equal_nan=True)
+
+
+def test_weights_cached_on_disk(tmp_path):
+    src = Affine(0.25, 0, -10.0, 0, -0.25, 10.0)
+    dst = Affine(0.5, 0, -10.0, 0, -0.5, 10.0)
+    weights = get_regrid_weights(
+        src, (80, 80), dst, (40, 40), method="bilinear", cache_dir=str(tmp_path)
+    )
+    files = list(tmp_path.glob("regrid_bilinear_*.npz"))
+    assert len(files) == 1
+    from src.utilities.regrid_utilities import load_regrid_weights
+
+    loaded = load_regrid_weights(str(files[0]))
+    assert (loaded.weights_x != weights.weights_x).nnz == 0
+    assert loaded.dst_shape == (40, 40)
@@ -0,0 +1,174 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+gpd = pytest.importorskip("geopandas")
+pytest.importorskip("rasterio")
+pytest.importorskip("rioxarray")
+
+from shapely.geometry import box  # noqa: E402
+from src.utilities.shapefiles_utilities import (  # noqa: E402
+    BoundaryIndex,
+    RasterizationCache,
+    clip_to_bounds,
+    coverage_layer,
+    filter_countries_by_attribute,
+    load_boundaries,
+    label_layers,
+    rasterize_countries,
+    rasterize_coverage,
+    rasterize_labels,
+)
+
+
+def _countries():
+    return gpd.GeoDataFrame(
+        {"iso3": ["AAA", "BBB", "CCC"]},
+        geometry=[box(0, 0, 2, 2), box(2, 0, 4, 2), box(10, 10, 11, 11)],
+        crs="EPSG:4326",
+    )
+
+
+def test_rasterize_labels_tile_wise():
+    labels = rasterize_labels(
+        _countries(), ["AAA", "BBB"], "iso3", resolution=1.0, chunk_size=(1, 2)
+    )
+    assert labels.dtype == np.uint8
+    assert labels.attrs["categories"] == ["AAA", "BBB"]
+    # the grid is extended by one pixel beyond the maximum bounds
+    expected = np.array([[0, 0, 0, 0, 0], [1, 1, 2, 2, 0], [1, 1, 2, 2, 0]])
+    assert np.array_equal(labels.values, expected)
+
+
+def test_label_layers_match_layers_mode():
+    gdf = _countries()
+    ds_labels = rasterize_countries(gdf, ["AAA", "BBB"], "iso3", 1.0, mode="labels")
+    layers = label_layers(ds_labels["labels"])
+    ds_layers = rasterize_countries(gdf, ["AAA", "BBB"], "iso3", 1.0)
+    for name in ["iso3_AAA", "iso3_BBB"]:
+        assert np.array_equal(
+            layers[name].values.astype(int), ds_layers[name].values[0]
+        )
+
+
+@pytest.mark.parametrize("method", ["exact", "supersample"])
+def test_rasterize_coverage_fractions(method):
+    pytest.importorskip("sparse")
+    gdf = gpd.GeoDataFrame(
+        {"iso3": ["AAA", "BBB"]},
+        geometry=[box(0.5, 0, 2, 2), box(2, 0, 3.8, 2)],
+        crs="EPSG:4326",
+    )
+    coverage = rasterize_coverage(
+        gdf, ["AAA", "BBB"], "iso3", resolution=1.0, method=method
+    )
+    # only pixels crossed by a boundary are stored
+    assert coverage["boundary_coverage"].data.nnz < 3 * 4 * 2
+    layer_a = coverage_layer(coverage, "AAA").values
+    layer_b = coverage_layer(coverage, "BBB").values
+    assert np.allclose(layer_a[1:, 0], 0.5)
+    assert np.allclose(layer_a[1:, 1], 1.0)
+    assert np.allclose(layer_b[1:, 3], 0.8)
+    assert np.allclose(layer_a[0], 0.0)
+
+
+def test_boundary_index_attribute_and_bbox_queries():
+    world = _countries()
+    index = BoundaryIndex(world)
+    assert list(index.select("iso3", ["BBB", "ZZZ"])) == [1]
+    assert list(index.select("iso3", ["bb", "cc"], exact_match=False)) == [1, 2]
+    assert list(index.query_bbox((1.5, 0.5, 2.5, 1.5))) == [0, 1]
+    filtered = filter_countries_by_attribute(
+        world, "iso3", ["a", "c"], exact_match=False, index=index
+    )
+    assert list(filtered["iso3"]) == ["AAA", "CCC"]
+
+
+def test_boundary_index_selects_the_bounding_box_before_clipping(monkeypatch):
+    import src.utilities.shapefiles_utilities as shapefiles_utilities
+
+    world = _countries()
+    index = BoundaryIndex(world)
+    bbox = gpd.GeoDataFrame(geometry=[box(1.0, 0.0, 3.0, 3.0)], crs="EPSG:4326")
+    clipped_rows = []
+    clip = shapefiles_utilities._clip_to_bounding_box
+
+    def recording_clip(gdf, bounding_box):
+        clipped_rows.append(list(gdf["iso3"]))
+        return clip(gdf, bounding_box)
+
+    monkeypatch.setattr(shapefiles_utilities, "_clip_to_bounding_box", recording_clip)
+    values = ["AAA", "BBB", "CCC"]
+    filtered = filter_countries_by_attribute(
+        world, "iso3", values, bounding_box=bbox, index=index
+    )
+    expected = filter_countries_by_attribute(world, "iso3", values, bounding_box=bbox)
+    assert list(filtered["iso3"]) == list(expected["iso3"]) == ["AAA", "BBB"]
+    assert list(filtered.geometry) == list(expected.geometry)
+
+    layers = rasterize_countries(world, values, "iso3", 1.0, bounding_box=bbox, index=index)
+    unindexed = rasterize_countries(world, values, "iso3", 1.0, bounding_box=bbox)
+    assert list(layers.data_vars) == list(unindexed.data_vars)
+    for name in layers.data_vars:
+        assert np.array_equal(layers[name].values, unindexed[name].values)
+    # CCC, far from the bounding box, never reaches the clip when the index is used
+    assert clipped_rows[0] == clipped_rows[2] == ["AAA", "BBB"]
+    assert "CCC" in clipped_rows[1] and "CCC" in clipped_rows[3]
+
+
+def test_clip_to_bounds_only_clips_crossing_geometries():
+    world = _countries()
+    clipped = clip_to_bounds(world, (1.0, -1.0, 12.0, 12.0))
+    assert list(clipped["iso3"]) == ["AAA", "BBB", "CCC"]
+    # geometries inside are passed through untouched
+    assert clipped.geometry.iloc[1].equals_exact(world.geometry.iloc[1], 0)
+    assert clipped.geometry.iloc[0].bounds == (1.0, 0.0, 2.0, 2.0)
+    assert list(clip_to_bounds(world, (0.0, 0.0, 3.0, 3.0))["iso3"]) == ["AAA", "BBB"]
+
+
+def test_load_boundaries_through_parquet_cache(tmp_path):
+    pytest.importorskip("pyarrow")
+    source = tmp_path / "boundaries.geojson"
+    world = _countries()
+    world["name"] = ["A", "B", "C"]
+    world.to_file(source, driver="GeoJSON")
+    cache_dir = tmp_path / "cache"
+
+    loaded = load_boundaries(
+        str(source), cache_dir=str(cache_dir), simplify_tolerances=[0.5]
+    )
+    assert sorted(loaded["iso3"]) == ["AAA", "BBB", "CCC"]
+    assert len(list(cache_dir.glob("*.parquet"))) == 1
+
+    subset = load_boundaries(
+        str(source),
+        columns=["iso3"],
+        bounds=(9.0, 9.0, 12.0, 12.0),
+        simplify_tolerance=0.5,
+        cache_dir=str(cache_dir),
+        simplify_tolerances=[0.5],
+    )
+    assert list(subset.columns) == ["iso3", "geometry"]
+    assert list(subset["iso3"]) == ["CCC"]
+    assert len(list(cache_dir.glob("*.parquet"))) == 1
+
+
+def test_rasterization_cache_hit_and_eviction(tmp_path):
+    pytest.importorskip("zarr")
+    cache = RasterizationCache(str(tmp_path))
+    first = rasterize_labels(
+        _countries(), ["AAA", "BBB"], "iso3", resolution=1.0, cache=cache
+    )
+    assert len(list(tmp_path.glob("*.zarr"))) == 1
+    second = rasterize_labels(
+        _countries(), ["AAA", "BBB"], "iso3", resolution=1.0, cache=cache
+    )
+    assert np.array_equal(first.values, second.values)
+    assert second.attrs["categories"] == ["AAA", "BBB"]
+    assert len(list(tmp_path.glob("*.zarr"))) == 1
+
+    # a different grid is a different entry; a tiny cap keeps only the most recent one
+    small_cache = RasterizationCache(str(tmp_path), max_bytes=1)
+    rasterize_labels(
+        _countries(), ["AAA", "BBB"], "iso3", resolution=0.5, cache=small_cache
+    )
+    assert len(list(tmp_path.glob("*.zarr"))) == 1
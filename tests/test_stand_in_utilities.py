@@ -0,0 +1,142 @@
+import asyncio
+import io
+import os
+import time
+import zipfile
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("requests")
+pytest.importorskip("boto3")
+
+from src.utilities.benchmark_utilities import (  # noqa: E402
+    benchmark_http_threads,
+    format_curves,
+)
+from src.utilities.copernicus_data_store_utilities import schedule_cds_downloads  # noqa: E402
+from src.utilities.download_utilities import (  # noqa: E402
+    download_and_extract_archive,
+    download_file,
+    download_file_segmented,
+)
+from src.utilities.s3_utilities import copy_objects, list_objects  # noqa: E402
+from src.utilities.telemetry_utilities import get_telemetry  # noqa: E402
+from src.utilities.stand_in_utilities import (  # noqa: E402
+    FakeCDSClientPool,
+    FakeCDSServer,
+    FakeS3Server,
+    RangeFileServer,
+)
+
+CONTENT = os.urandom(512 * 1024)
+
+
+def test_range_server_resumes_interrupted_bodies(tmp_path):
+    with RangeFileServer({"/a.bin": CONTENT}, interrupt_rate=0.5, seed=3) as server:
+        download_file(f"{server.url}/a.bin", str(tmp_path), "a.bin", max_attempts=10)
+        assert server.stats["interruptions"] > 0
+    assert (tmp_path / "a.bin").read_bytes() == CONTENT
+
+
+def test_failed_responses_are_retried_once_per_attempt(tmp_path):
+    telemetry = get_telemetry()
+    telemetry.reset()
+    with RangeFileServer({"/a.bin": CONTENT}, failure_rate=0.5, seed=1) as server:
+        download_file(f"{server.url}/a.bin", str(tmp_path), "a.bin", max_attempts=20)
+        assert server.stats["failures"] > 0
+        # no hidden transport retries: every request is an attempt in the telemetry
+        (record,) = telemetry.records
+        assert record.attempts == server.stats["requests"]
+    assert (tmp_path / "a.bin").read_bytes() == CONTENT
+
+
+def test_range_server_throttles_connections(tmp_path):
+    with RangeFileServer({"/a.bin": CONTENT}, connection_bandwidth=2e6) as server:
+        start = time.perf_counter()
+        download_file(f"{server.url}/a.bin", str(tmp_path), "a.bin")
+        assert time.perf_counter() - start >= 0.2
+        assert server.stats["bytes_sent"] == len(CONTENT)
+
+
+def test_fake_cds_jobs_are_polled_downloaded_and_deleted(tmp_path):
+    tasks = [
+        {
+            "dataset": "reanalysis-era5-single-levels",
+            "request": {
+                "period": [str(year)],
+                "experiment": "historical",
+                "product_type": "reanalysis",
+                "variable": "2m_temperature",
+            },
+        }
+        for year in range(2000, 2006)
+    ]
+    with FakeCDSServer(
+        queue_latency=(0.05, 0.2), job_failure_rate=0.3, result_size=1024, seed=1
+    ) as server:
+        pool = FakeCDSClientPool(server.url, "uid:key", wait_until_complete=False)
+        results = asyncio.run(
+            schedule_cds_downloads(
+                tasks,
+                tmp_path,
+                max_queued=3,
+                max_downloads=2,
+                poll_interval=0.02,
+                max_retries=5,
+                retry_delay=0,
+                client_pool=pool,
+            )
+        )
+        assert server.stats["submitted"] > len(tasks)  # some jobs failed and were resubmitted
+        assert server.stats["max_pending"] <= 3
+        assert server.stats["deleted"] == len(tasks)
+    assert [r["state"] for r in results] == ["downloaded"] * len(tasks)
+    with zipfile.ZipFile(Path(results[0]["archive_path"])) as archive:
+        assert archive.namelist() == ["data_0.nc"]
+
+
+def test_fake_s3_lists_pages_and_copies(tmp_path):
+    with FakeS3Server(["source", "target"], page_size=2) as server:
+        client = server.client()
+        for i in range(5):
+            client.put_object(Bucket="source", Key=f"hazard/{i}", Body=CONTENT[: 1000 * (i + 1)])
+        keys, size = list_objects(client, "source", "hazard/")
+        assert keys == [f"hazard/{i}" for i in range(5)]
+        assert size == 15000
+
+        copy_objects(keys, client, "source", client, "target", max_workers=2)
+        assert server.buckets["target"] == server.buckets["source"]
+        body = client.get_object(Bucket="target", Key="hazard/4", Range="bytes=10-19")["Body"]
+        assert body.read() == CONTENT[10:20]
+
+
+def test_benchmark_sweep_reports_throughput():
+    with RangeFileServer(connection_bandwidth=4e6) as server:
+        urls = [server.add_file(f"/file_{i}.bin", CONTENT) for i in range(4)]
+        points = benchmark_http_threads(urls, values=(1, 4))
+        assert server.stats["max_active"] == 4
+    assert [p.value for p in points] == [1, 4]
+    assert all(p.bytes == 4 * len(CONTENT) and p.errors == 0 for p in points)
+    assert points[1].throughput > points[0].throughput
+    assert "http-threads (max_workers)" in format_curves(points)
+
+
+def test_streamed_extraction_and_segments_retry_failed_requests(tmp_path):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for i in range(4):
+            archive.writestr(f"member_{i}.nc", CONTENT[i * 1000 : (i + 1) * 50000])
+    files = {"/a.zip": buffer.getvalue(), "/a.bin": CONTENT}
+    with RangeFileServer(files, failure_rate=0.3, seed=2) as server:
+        download_and_extract_archive(
+            f"{server.url}/a.zip", str(tmp_path), extract_by_extension=".nc", stream=True
+        )
+        result = download_file_segmented(
+            f"{server.url}/a.bin", str(tmp_path), "a.bin", n_segments=4, min_segment_size=1024
+        )
+        assert result.segments == 4
+        assert server.stats["failures"] > 0
+    for i in range(4):
+        assert (tmp_path / f"member_{i}.nc").read_bytes() == CONTENT[i * 1000 : (i + 1) * 50000]
+    assert (tmp_path / "a.bin").read_bytes() == CONTENT
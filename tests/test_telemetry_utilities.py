@@ -0,0 +1,90 @@
+import json
+
+import pytest
+
+from src.utilities.telemetry_utilities import TransferRecord, TransferTelemetry
+
+
+def test_transfer_records_bytes_attempts_and_errors():
+    telemetry = TransferTelemetry()
+    with telemetry.transfer("http", "a.nc") as transfer:
+        transfer.attempt()
+        transfer.attempt()
+        transfer.add_bytes(100)
+        transfer.add_bytes(50)
+    with pytest.raises(OSError):
+        with telemetry.transfer("gee", "tile.tif") as transfer:
+            transfer.attempt()
+            raise OSError("quota exceeded")
+
+    ok, failed = telemetry.records
+    assert (ok.bytes, ok.attempts, ok.status) == (150, 2, "ok")
+    assert ok.ttfb is not None and ok.ttfb <= ok.duration
+    assert failed.status == "error"
+    assert failed.error == "OSError: quota exceeded"
+    with pytest.raises(ValueError):
+        with telemetry.transfer("ftp", "x"):
+            pass
+
+
+def test_summary_histograms_by_source():
+    telemetry = TransferTelemetry()
+    for duration, attempts in ((0.2, 1), (3.0, 1), (45.0, 3)):
+        telemetry.record(
+            TransferRecord("cds", "f", bytes=1000, duration=duration, attempts=attempts, ttfb=1.0)
+        )
+    telemetry.record(TransferRecord("cds", "g", attempts=0, status="skipped"))
+
+    stats = telemetry.summary()["cds"]
+    assert stats["status"] == {"ok": 3, "skipped": 1}
+    assert stats["bytes"] == 3000
+    assert stats["retries"] == 2
+    durations = stats["histograms"]["duration_seconds"]
+    assert durations["buckets"]["0.25"] == 1
+    assert durations["buckets"]["5"] == 2
+    assert durations["buckets"]["+Inf"] == 3
+    assert durations["count"] == 3
+    assert stats["histograms"]["attempts"]["buckets"]["1"] == 2
+
+
+def test_export_json_and_prometheus(tmp_path):
+    telemetry = TransferTelemetry()
+    telemetry.record(TransferRecord("s3", "key", bytes=10, duration=0.5, ttfb=0.1))
+    telemetry.export(str(tmp_path / "metrics.json"))
+    telemetry.export(str(tmp_path / "metrics.prom"))
+
+    content = json.loads((tmp_path / "metrics.json").read_text())
+    assert content["sources"]["s3"]["bytes"] == 10
+    assert content["records"][0]["name"] == "key"
+    text = (tmp_path / "metrics.prom").read_text()
+    assert 'download_transfers_total{source="s3",status="ok"} 1' in text
+    assert 'download_duration_seconds_bucket{source="s3",le="0.5"} 1' in text
+    assert 'download_ttfb_seconds_count{source="s3"} 1' in text
+
+
+def test_scope_holds_only_the_records_of_its_job(tmp_path):
+    telemetry = TransferTelemetry()
+    telemetry.record(TransferRecord("http", "earlier", bytes=7))
+    for job in ("first", "second"):
+        with telemetry.scope() as scoped:
+            telemetry.record(TransferRecord("http", job, bytes=10))
+        scoped.export(str(tmp_path / f"{job}.json"))
+    telemetry.record(TransferRecord("http", "later", bytes=3))
+
+    for job in ("first", "second"):
+        content = json.loads((tmp_path / f"{job}.json").read_text())
+        assert [r["name"] for r in content["records"]] == [job]
+        assert content["sources"]["http"]["bytes"] == 10
+    assert [r.name for r in telemetry.records] == ["earlier", "first", "second", "later"]
+
+
+def test_records_are_bounded_but_aggregates_count_everything():
+    telemetry = TransferTelemetry(max_records=3)
+    for i in range(10):
+        telemetry.record(TransferRecord("gee", f"tile_{i}", bytes=100, duration=1.0, attempts=2))
+    assert [r.name for r in telemetry.records] == ["tile_7", "tile_8", "tile_9"]
+    stats = telemetry.summary()["gee"]
+    assert (stats["transfers"], stats["bytes"], stats["retries"]) == (10, 1000, 10)
+    assert stats["histograms"]["duration_seconds"]["count"] == 10
+    telemetry.reset()
+    assert telemetry.summary() == {} and not telemetry.records
@@ -1,6 +1,10 @@
+import importlib
 import sys
 import types
 
+import pytest
+
+_stubbed = []
 for mod in [
     "dask",
     "dask.array",
@@ -11,6 +15,12 @@ for mod in [
     "zarr",
     "zarr.core",
 ]:
+    # only stub what is missing, so that the zarr parent tests below run on the real stack
+    try:
+        importlib.import_module(mod)
+        continue
+    except ImportError:
+        _stubbed.append(mod)
     module = sys.modules.setdefault(mod, types.ModuleType(mod))
     if mod == "rasterio.crs":
         setattr(module, "CRS", object)
@@ -27,8 +37,19 @@ for mod in [
             setattr(core_mod, "Array", object)
             setattr(module, "core", core_mod)
 
-from affine import Affine
-from src.utilities.xarray_utilities import affine_has_rotation
+import numpy as np  # noqa: E402
+from affine import Affine  # noqa: E402
+from src.utilities.xarray_utilities import (  # noqa: E402
+    add_children_to_parent,
+    affine_has_rotation,
+    affine_to_coords,
+    create_zarr_parent,
+    empty_data_array,
+)
+
+requires_stack = pytest.mark.skipif(
+    bool(_stubbed), reason=f"stubbed modules: {_stubbed}"
+)
 
 
 def test_affine_has_rotation_false():
@@ -49,3 +70,57 @@ def test_affine_has_rotation_true_shear():
     e = 1
     aff = Affine(a, b, 0, d, e, 0)
     assert affine_has_rotation(aff)
+
+
+@requires_stack
+def test_create_zarr_parent_attributes(tmp_path):
+    transform = Affine(1.0, 0, -180.0, 0, -1.0, 90.0)
+    da_parent, z = create_zarr_parent(
+        str(tmp_path / "parent.zarr"),
+        "hazard",
+        360,
+        180,
+        transform,
+        index_values=[10, 100],
+    )
+    assert z.shape == (2, 180, 360)
+    assert z.dtype == np.float32
+    assert z.attrs["index_values"] == [10.0, 100.0]
+    assert da_parent.dims == ("index", "y", "x")
+    assert np.isnan(z[0, 0, 0])
+
+
+@requires_stack
+def test_add_children_to_created_parent(tmp_path):
+    import xarray as xr
+
+    transform = Affine(1.0, 0, -180.0, 0, -1.0, 90.0)
+    da_parent, z = create_zarr_parent(
+        str(tmp_path / "parent.zarr"),
+        "hazard",
+        360,
+        180,
+        transform,
+        index_values=[10, 100],
+        chunks=(1, 30, 30),
+    )
+    child_transform = Affine(1.0, 0, -170.0, 0, -1.0, 70.0)
+    da_child = xr.DataArray(
+        np.ones((4, 5), dtype=np.float32),
+        dims=["y", "x"],
+        coords=affine_to_coords(child_transform, 5, 4),
+    )
+    add_children_to_parent(da_parent, z, 1, da_child)
+    assert np.all(z[1, 20:24, 10:15] == 1)
+    assert np.isnan(z[0, 20, 10])
+
+
+@requires_stack
+def test_empty_data_array_dtype_and_chunks():
+    transform = Affine(1.0, 0, -180.0, 0, -1.0, 90.0)
+    da = empty_data_array(
+        360, 180, transform, index_values=[1, 2], dtype="float32", chunks=(1, 90, 180)
+    )
+    assert da.dtype == np.float32
+    assert da.data.chunks == ((1, 1), (90, 90), (180, 180))
+    assert da.dims == ("index", "latitude", "longitude")
@@ -0,0 +1,59 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+xr = pytest.importorskip("xarray")
+pytest.importorskip("dask")
+pytest.importorskip("geopandas")
+pytest.importorskip("rioxarray")
+
+from affine import Affine  # noqa: E402
+from src.utilities.xarray_utilities import affine_to_coords  # noqa: E402
+from src.utilities.zonal_utilities import zonal_statistics  # noqa: E402
+
+
+def _grid_arrays():
+    transform = Affine(1.0, 0, 0.0, 0, -1.0, 4.0)
+    coords = affine_to_coords(transform, 4, 4)
+    labels = np.array(
+        [[1, 1, 2, 2], [1, 1, 2, 2], [0, 0, 2, 2], [0, 0, 0, 0]], dtype=np.uint8
+    )
+    da_labels = xr.DataArray(
+        labels, dims=["y", "x"], coords=coords, attrs={"categories": ["A", "B"]}
+    )
+    values = np.stack([np.arange(16.0).reshape(4, 4), np.ones((4, 4))])
+    values[0, 0, 0] = np.nan
+    coords["time"] = [0, 1]
+    da = xr.DataArray(values, dims=["time", "y", "x"], coords=coords).chunk(
+        {"time": 1, "y": 2, "x": 2}
+    )
+    return da, da_labels
+
+
+def test_zonal_statistics_all_slices_one_pass():
+    da, labels = _grid_arrays()
+    result = zonal_statistics(
+        da, labels, statistics=["sum", "mean", "min", "max", "count"]
+    )
+    assert list(result.zone.values) == ["A", "B"]
+    assert result["count"].sel(time=0).values.tolist() == [3, 6]
+    assert result["sum"].sel(time=0, zone="A").item() == 1 + 4 + 5
+    assert result["min"].sel(time=0, zone="B").item() == 2
+    assert result["max"].sel(time=0, zone="B").item() == 11
+    assert np.allclose(result["mean"].sel(time=1).values, 1.0)
+
+
+def test_area_weighted_mean_of_constant_field():
+    da, labels = _grid_arrays()
+    result = zonal_statistics(da.isel(time=1), labels, statistics=["area_weighted_mean"])
+    assert result["area_weighted_mean"].dims == ("zone",)
+    assert np.allclose(result["area_weighted_mean"].values, 1.0)
+
+
+def test_labels_above_the_zones_are_ignored():
+    da, labels = _grid_arrays()
+    # a label with no category must not leak into the last zone
+    labels = labels.copy(data=np.where(labels.values == 0, 3, labels.values).astype(np.uint8))
+    result = zonal_statistics(da, labels, statistics=["sum", "count", "max"])
+    assert result["count"].sel(time=0).values.tolist() == [3, 6]
+    assert result["sum"].sel(time=0, zone="B").item() == 2 + 3 + 6 + 7 + 10 + 11
+    assert result["max"].sel(time=0, zone="B").item() == 11